@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from app.schemas.order import OrderCreate, OrderResponse, RefundRequest, RefundResponse
 from app.domain.order_service import create_order, request_refund
 from app.infrastructure.database import SessionLocal
+from app.infrastructure.outbox import get_relay
 from app.api.dependencies import get_current_user
 
 router = APIRouter()
 
+# Publishes outbox events, including any left over from a previous run
+relay = get_relay()
+router.add_event_handler("startup", relay.start)
+router.add_event_handler("shutdown", relay.stop)
+
 
 def get_db():
     db = SessionLocal()
@@ -35,6 +41,7 @@ Domain logic handles stock checks and promotions
 
 from app.schemas.order import CheckoutRequest, CheckoutResponse
 from app.domain.payment_service import checkout_order
+from app.domain.stock_reservations import StockReservationError, StockReservationExpired
 
 
 @router.post("/checkout", response_model=CheckoutResponse)
@@ -43,9 +50,14 @@ def checkout_endpoint(
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
-    order = checkout_order(
-        request.order_id, request.payment_method, request.payment_token, db
-    )
+    try:
+        order = checkout_order(
+            request.order_id, request.payment_method, request.payment_token, db
+        )
+    except StockReservationExpired as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=e.message)
+    except StockReservationError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=e.message)
 
     return CheckoutResponse(
         order_id=order.id,
@@ -31,6 +31,22 @@ REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 JWT_ISSUER = os.getenv("JWT_ISSUER", "ecommerce-platform")
 JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "ecommerce-clients")
 
+# =====================================================
+# SERVICE CLIENTS
+# =====================================================
+PRODUCT_SERVICE_URL = os.getenv(
+    "PRODUCT_SERVICE_URL", "http://localhost:8000/api/v1/products"
+)
+# Admin JWT for the Product Service stock endpoints (sent as a Bearer token)
+PRODUCT_SERVICE_TOKEN = os.getenv("PRODUCT_SERVICE_TOKEN", "")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 1.0))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 3.0))  # seconds
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))  # keep-alive connections per host
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", 2))
+# Concurrent calls of one fan_out; capped at HTTP_POOL_SIZE
+HTTP_FANOUT_WORKERS = int(os.getenv("HTTP_FANOUT_WORKERS", HTTP_POOL_SIZE))
+
 
 from pydantic_settings import BaseSettings
 
@@ -1,18 +1,13 @@
 from app.core.errors import DomainError
 from sqlalchemy.orm import Session
-from app.schemas.order import (
-    Order,
-    OrderItemCreate,
-    OrderCreate,
-    OrderItemResponse,
-    OrderResponse,
-)
+from app.schemas.order import OrderCreate
+from app.infrastructure.models import Order, OrderItem
 import requests
-from app.infrastructure.event_publisher import publish_event
+from app.infrastructure.outbox import enqueue_event
+from app.infrastructure.http_client import fan_out, product_client
+from app.domain.stock_reservations import release_reservation, reserve_stock
 
-
-PRODUCT_SERVICE_URL = "http://localhost:8000/api/v1/products"
-PROMOTION_SERVICE_URL = "http://localhost:8001/api/v1/promotions"
+PRODUCT_BATCH_SIZE = 200  # Product Service caps ids per batch call
 
 
 class OrderError(DomainError):
@@ -20,51 +15,83 @@ class OrderError(DomainError):
     message: str = "An error occurred while processing the order"
 
 
+def _apply_promotion(product: dict) -> float:
+    """Discount per unit from the first active promotion of the product"""
+    promotions = product.get("promotions") or []
+    if not promotions:
+        return 0.0
+
+    promo = promotions[0]  # take first active promotion
+    if promo["discount_type"] == "fixed":
+        return promo["discount_value"]  # fixed amount off
+    if promo["discount_type"] == "percentage":
+        return product["price"] * (promo["discount_value"] / 100)
+    return 0.0
+
+
+def _fetch_product_batch(product_ids: list) -> list:
+    try:
+        response = product_client.post("/batch", json={"ids": product_ids})
+    except requests.RequestException as e:
+        raise OrderError(message=f"Product Service unavailable: {e}")
+
+    if response.status_code != 200:
+        raise OrderError(message="Could not fetch products for the order")
+
+    return response.json()
+
+
+def _fetch_products(product_ids: list) -> dict:
+    """Products with active promotions, keyed by id.
+
+    Carts larger than one batch are split and the batches fetched concurrently,
+    so the lookup costs about one round trip whatever the cart size."""
+    chunks = [
+        product_ids[start : start + PRODUCT_BATCH_SIZE]
+        for start in range(0, len(product_ids), PRODUCT_BATCH_SIZE)
+    ]
+    return {
+        product["id"]: product
+        for batch in fan_out(_fetch_product_batch, chunks)
+        for product in batch
+    }
+
+
 def create_order(order_data: OrderCreate, db: Session):
     # Validate order data, check product availability, calculate totals, etc.
     # If any validation fails, raise OrderError with a specific message
 
+    # Fetch every product of the cart (with its active promotions) in one go,
+    # so pricing costs the same whatever the number of items
+    products = _fetch_products(
+        list(dict.fromkeys(item.product_id for item in order_data.items))
+    )
+
     total_amount = 0.0
     order_items = []
 
     for item in order_data.items:
-        # Fetch product details from product service
-        product_response = requests.get(f"{PRODUCT_SERVICE_URL}/{item.product_id}")
+        product = products.get(item.product_id)
 
-        if product_response.status_code != 200:
+        if product is None:
             raise OrderError(message=f"Product {item.product_id} not found")
 
-        product = product_response.json()
-
-        if product["stock"] < item.quantity:
+        if product["available_stock"] < item.quantity:
             raise OrderError(
                 message=f"Insufficient stock for product {item.product_id}"
             )
 
-        # Fetch active promotions for the product
-        r = requests.get(
-            f"{PROMOTION_SERVICE_URL}?product_id={item.product_id}&active=true"
-        )
-
-        promotions = r.json()
-        discount = 0.0
-        if promotions:
-            # Assume we apply the first active promotion for simplicity
-            promo = promotions[0]  # take first active promotion
-            if promo["discount_type"] == "fixed":
-                discount = promo["discount_value"]  # fixed amount off
-            elif promo["discount_type"] == "percentage":
-                discount = product["price"] * (promo["discount_value"] / 100)
+        discount = _apply_promotion(product)
 
         unit_price_after_discount = max(product["price"] - discount, 0)
 
         total_amount += unit_price_after_discount * item.quantity
 
         order_items.append(
-            OrderItemResponse(
+            OrderItem(
                 product_id=item.product_id,
                 product_name=product["name"],
-                unit_price=product["price"],
+                price=product["price"],
                 quantity=item.quantity,
                 discount_applied=discount,
             )
@@ -77,27 +104,32 @@ def create_order(order_data: OrderCreate, db: Session):
         status="pending",
         items=order_items,
     )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
 
-    # Reduce stock via Product Service
-    for item in order_data.items:
-        requests.post(
-            f"{PRODUCT_SERVICE_URL}/{item.product_id}/stock",
-            json={"quantity": -item.quantity},
+    # Hold the whole cart's stock before saving the order; Product Service
+    # holds every item or none, and drops the hold if checkout never comes
+    db_order.stock_reservation_id = reserve_stock(order_data.items)
+
+    try:
+        db.add(db_order)
+        db.flush()
+
+        # order_created is stored with the order and published by the relay
+        enqueue_event(
+            db,
+            exchange="orders",
+            event_type="order_created",
+            data={
+                "order_id": db_order.id,
+                "user_id": db_order.user_id,
+                "total": db_order.total_amount,
+            },
         )
-
-    # Publish order_created event
-    publish_event(
-        exchange="orders",
-        event_type="order_created",
-        data={
-            "order_id": db_order.id,
-            "user_id": db_order.user_id,
-            "total": db_order.total_amount,
-        },
-    )
+        db.commit()
+    except Exception:
+        db.rollback()
+        release_reservation(db_order.stock_reservation_id)
+        raise
+    db.refresh(db_order)
 
     return db_order
 
@@ -107,9 +139,17 @@ def create_order(order_data: OrderCreate, db: Session):
 
 Stock validation is synchronous here for simplicity
 
+Products and their active promotions come from one batch call to Product Service
+
+Calls share a pooled keep-alive session with timeouts and run concurrently
+
 Promotions applied automatically
 
-Event-driven: order_created triggers downstream services (notifications, analytics, etc.)
+Event-driven: order_created triggers downstream services (notifications, analytics, etc.);
+it is written to the outbox in the order's transaction, so it is sent exactly when the order exists
 
 Stock is decremented via Product Service API → keeps services decoupled
+
+The whole cart is held by one time-bounded stock reservation: checkout confirms it,
+cancel/refund releases it, and an abandoned order's hold expires by itself
 """
@@ -1,6 +1,7 @@
 from app.infrastructure.models import Order
 from sqlalchemy.orm import Session
-from app.infrastructure.event_publisher import publish_event
+from app.infrastructure.outbox import enqueue_event
+from app.domain.stock_reservations import confirm_reservation, release_reservation
 
 
 def process_payment(order: Order, method: str, token: str) -> bool:
@@ -23,6 +24,12 @@ def checkout_order(order_id: int, payment_method: str, payment_token: str, db: S
     if order.payment_status == "paid":
         raise ValueError("Order already paid")
 
+    # Take the stock before charging: if the hold expired or cannot be
+    # confirmed, StockReservationExpired / StockReservationError fails
+    # checkout and the order stays pending
+    if order.stock_reservation_id:
+        confirm_reservation(order.stock_reservation_id)
+
     success = process_payment(order, payment_method, payment_token)
 
     if success:
@@ -33,13 +40,15 @@ def checkout_order(order_id: int, payment_method: str, payment_token: str, db: S
         order.payment_status = "failed"
         order.status = "pending"
 
-    db.commit()
-    db.refresh(order)
+        if order.stock_reservation_id:
+            # Nothing was charged: give the confirmed units back
+            release_reservation(order.stock_reservation_id)
 
     # publish order_paid or order_payment_failed_events
     event_type = "order_paid" if success else "order_payment_failed"
 
-    publish_event(
+    enqueue_event(
+        db,
         exchange="orders",
         event_type=event_type,
         data={
@@ -49,6 +58,8 @@ def checkout_order(order_id: int, payment_method: str, payment_token: str, db: S
             "status": order.status,
         },
     )
+    db.commit()
+    db.refresh(order)
 
     return order
 
@@ -58,5 +69,8 @@ def checkout_order(order_id: int, payment_method: str, payment_token: str, db: S
 
 Payment processing is decoupled; can swap gateways
 
+The order's stock reservation is confirmed before the payment is captured; a
+failed payment releases it again, so the order has to be placed again
+
 Events inform inventory, notifications, analytics services
 """
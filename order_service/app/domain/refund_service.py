@@ -2,7 +2,8 @@
 
 from sqlalchemy.orm import Session
 from app.infrastructure.models import Order
-from app.infrastructure.event_publisher import publish_event
+from app.infrastructure.outbox import enqueue_event
+from app.domain.stock_reservations import release_reservation
 
 
 def request_refund(order_id: int, reason: str, db: Session):
@@ -14,15 +15,16 @@ def request_refund(order_id: int, reason: str, db: Session):
 
     order.refund_status = "requested"
     order.status = "cancelled"
+
+    # Publish refund event
+    enqueue_event(
+        db, "orders", "order_refunded", {"order_id": order.id, "reason": reason}
+    )
     db.commit()
     db.refresh(order)
 
-    # Return stock to Product Service
-    for item in order.items:
-        # call Product Service API to increment stock
-        pass  # existing logic
-
-    # Publish refund event
-    publish_event("orders", "order_refunded", {"order_id": order.id, "reason": reason})
+    # Return stock to Product Service by releasing the order's reservation
+    if order.stock_reservation_id:
+        release_reservation(order.stock_reservation_id)
 
     return order
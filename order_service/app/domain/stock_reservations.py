@@ -0,0 +1,83 @@
+import logging
+
+import requests
+
+from app.core.errors import DomainError
+from app.infrastructure.http_client import product_client
+
+logger = logging.getLogger(__name__)
+
+
+class StockReservationError(DomainError):
+    code = "STOCK_RESERVATION_ERROR"
+    message = "Could not reserve stock for the order"
+
+
+class StockReservationExpired(StockReservationError):
+    code = "STOCK_RESERVATION_EXPIRED"
+    message = "Stock reservation expired"
+
+
+def reserve_stock(items) -> str:
+    """Hold the stock of a whole cart; returns the reservation id.
+
+    Product Service holds every item or none, and releases the hold by
+    itself if the order is not checked out before the TTL."""
+    payload = {
+        "items": [
+            {"product_id": item.product_id, "quantity": item.quantity}
+            for item in items
+        ]
+    }
+    try:
+        response = product_client.post("/stock/reservations/", json=payload)
+    except requests.RequestException as e:
+        raise StockReservationError(message=f"Product Service unavailable: {e}")
+
+    if response.status_code == 409:
+        detail = response.json().get("detail", {})
+        raise StockReservationError(
+            message=(
+                "Insufficient stock for products "
+                f"{detail.get('insufficient_product_ids') or detail.get('missing_product_ids')}"
+            )
+        )
+    if response.status_code != 201:
+        raise StockReservationError(
+            message=f"Could not reserve stock: HTTP {response.status_code}"
+        )
+
+    return response.json()["id"]
+
+
+def confirm_reservation(reservation_id: str):
+    """Checkout: the held units leave stock for good"""
+    try:
+        response = product_client.post(f"/stock/reservations/{reservation_id}/confirm")
+    except requests.RequestException as e:
+        raise StockReservationError(message=f"Product Service unavailable: {e}")
+
+    if response.status_code == 410:
+        raise StockReservationExpired()
+    if response.status_code != 200:
+        raise StockReservationError(
+            message=f"Could not confirm stock reservation: HTTP {response.status_code}"
+        )
+
+
+def release_reservation(reservation_id: str) -> bool:
+    """Cancel / refund: give the units back. Failures are logged, not raised;
+    an unconfirmed hold still expires on its own."""
+    try:
+        response = product_client.post(f"/stock/reservations/{reservation_id}/release")
+    except requests.RequestException as e:
+        logger.error(f"Could not release stock reservation {reservation_id}: {e}")
+        return False
+
+    if response.status_code != 200:
+        logger.error(
+            f"Could not release stock reservation {reservation_id}: "
+            f"HTTP {response.status_code}"
+        )
+        return False
+    return True
@@ -0,0 +1,98 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import (
+    HTTP_CONNECT_RETRIES,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_FANOUT_WORKERS,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    PRODUCT_SERVICE_TOKEN,
+    PRODUCT_SERVICE_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class ServiceClient:
+    """
+    Keep-alive HTTP client for calls to another service.
+
+    - one requests.Session per client, so TCP connections are pooled and reused
+    - every call gets a (connect, read) timeout unless the caller passes one
+    - only connection errors are retried: the request never reached the
+      server, so retrying is safe even for non-idempotent POSTs
+    - with a token, every call is authenticated with it as a Bearer token
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        pool_size: int = HTTP_POOL_SIZE,
+        connect_retries: int = HTTP_CONNECT_RETRIES,
+        token: str = "",
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=connect_retries,
+            connect=connect_retries,
+            read=0,
+            status=0,
+            backoff_factor=0.05,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self._session.request(method, f"{self.base_url}{path}", **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+# Shared by all requests of the process, and never larger than the
+# connection pool, so concurrent calls never wait for a free connection.
+_fan_out_executor = ThreadPoolExecutor(
+    max_workers=min(HTTP_FANOUT_WORKERS, HTTP_POOL_SIZE), thread_name_prefix="http-fan-out"
+)
+
+
+def fan_out(call: Callable[[T], R], items: Iterable[T]) -> List[R]:
+    """
+    Run `call` for every item concurrently and return results in item order.
+
+    Total latency is roughly the slowest call instead of the sum of all of them.
+    The first exception raised by a call is re-raised here.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [call(item) for item in items]
+    return list(_fan_out_executor.map(call, items))
+
+
+product_client = ServiceClient(PRODUCT_SERVICE_URL, token=PRODUCT_SERVICE_TOKEN)
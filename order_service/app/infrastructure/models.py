@@ -1,11 +1,22 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Table
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    String,
+    Table,
+)
 from sqlalchemy.orm import relationship
 from app.infrastructure.database import Base
 from datetime import datetime
 
 
 class Order(Base):
-    __table_name__ = "orders"
+    __tablename__ = "orders"
     id = Column(Integer, primary_key=True)
     user_id = Column(String, nullable=False)
     total_amount = Column(Float, nullable=False)
@@ -15,6 +26,9 @@ class Order(Base):
     refund_status = Column(String, default="none")  # none, requested, processed
     payment_status = Column(String, default="unpaid")  # unpaid, paid, failed
     payment_method = Column(String, nullable=True)
+    stock_reservation_id = Column(
+        String, nullable=True
+    )  # hold on the cart's stock in Product Service
     created_at = Column(String, default=datetime.now().isoformat())
 
     items = relationship(
@@ -23,7 +37,7 @@ class Order(Base):
 
 
 class OrderItem(Base):
-    __table_name__ = "order_items"
+    __tablename__ = "order_items"
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
     product_id = Column(Integer, nullable=False)
@@ -35,3 +49,19 @@ class OrderItem(Base):
     order = relationship(
         "Order", back_populates="items"
     )  # Many-to-one relationship with Order
+
+
+class OutboxEvent(Base):
+    """
+    Domain event written in the same transaction as the change it describes.
+
+    The outbox relay (infrastructure/outbox.py) publishes rows in id order
+    and deletes them once the broker has confirmed them.
+    """
+
+    __tablename__ = "outbox_events"
+    id = Column(BigInteger, primary_key=True)  # also the event_id consumers see
+    exchange = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
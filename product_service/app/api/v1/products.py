@@ -1,17 +1,36 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.schemas.product import ProductCreate, ProductResponse, ProductUpdate
+from app.schemas.product import (
+    ProductBatchRequest,
+    ProductCreate,
+    ProductDetailResponse,
+    ProductResponse,
+    ProductUpdate,
+)
 from app.domain.product_service import (
+    MAX_BATCH_SIZE,
+    InvalidCursor,
+    ProductNotFound,
     create_product,
+    export_products,
     list_products,
+    next_cursor,
+    get_products_by_ids,
     delete_product,
     update_product,
     adjust_stock,
+    adjust_stock_bulk,
+    set_stock_slots,
+    BatchTooLarge,
+    StockAdjustmentRejected,
 )
 from app.infrastructure.database import SessionLocal
 from app.api.dependencies import admin_required
-from typing import Optional
-from pydantic import BaseModel
+from app.core.config import EXPORT_BATCH_SIZE, STOCK_SLOTS_MAX
+from typing import List, Optional
+import json
+from pydantic import BaseModel, Field
 
 
 router = APIRouter()
@@ -43,6 +62,7 @@ def create_product_endpoint(
 
 @router.get("/", response_model=list[ProductResponse])
 def list_products_endpoint(
+    response: Response,
     db: Session = Depends(get_db),
     name: Optional[str] = Query(None, description="Filter by product name"),
     min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
@@ -53,6 +73,10 @@ def list_products_endpoint(
     sort_order: Optional[str] = Query("asc", description="Sort order: asc or desc"),
     limit: int = Query(50, ge=1, le=100, description="Number of products to return"),
     offset: int = Query(0, ge=0, description="Number of products to skip"),
+    cursor: Optional[str] = Query(
+        None,
+        description="Opaque cursor from the X-Next-Cursor header of the previous page",
+    ),
 ):
     """Search & Filtering Products
 
@@ -68,20 +92,101 @@ def list_products_endpoint(
 
     Sorting: Optional, e.g., by price or name
 
-    Pagination: Optional, to prepare for large datasets"""
+    Pagination: Optional, to prepare for large datasets
+
+    Cursor pagination: every full page sets an X-Next-Cursor header. Passing it
+    back as ?cursor= (with the same filters and sort) returns the next page
+    with a keyset seek instead of OFFSET, so deep pages stay fast."""
+
+    if cursor and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either cursor or offset, not both",
+        )
+
+    try:
+        products = list_products(
+            db,
+            name=name,
+            min_price=min_price,
+            max_price=max_price,
+            category_id=category_id,
+            tag_id=tag_id,
+            sort_by=sort_by,
+            sort_order=sort_order,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=InvalidCursor.message
+        )
+
+    cursor_for_next_page = next_cursor(products, sort_by, sort_order, limit)
+    if cursor_for_next_page:
+        response.headers["X-Next-Cursor"] = cursor_for_next_page
+
+    return products
+
+
+def _get_batch(ids: List[int], db: Session):
+    try:
+        return get_products_by_ids(ids, db)
+    except BatchTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_SIZE} product ids per batch",
+        )
+
+
+@router.get("/batch", response_model=list[ProductDetailResponse])
+def get_products_batch_endpoint(
+    ids: List[int] = Query(..., description="Product ids, e.g. ?ids=1&ids=2"),
+    db: Session = Depends(get_db),
+):
+    """Fetch many products (stock, category, tags, active promotions) at once.
+
+    Used by order_service to price a cart with one call instead of one per item.
+    Unknown ids are left out of the response."""
+    return _get_batch(ids, db)
 
-    return list_products(
-        db,
-        name,
-        min_price,
-        max_price,
-        sort_by,
-        sort_order,
-        limit,
-        offset,
-        category_id,
-        tag_id,
-    )
+
+@router.post("/batch", response_model=list[ProductDetailResponse])
+def post_products_batch_endpoint(
+    request: ProductBatchRequest, db: Session = Depends(get_db)
+):
+    """Same as GET /batch, for id lists too long for a query string"""
+    return _get_batch(request.ids, db)
+
+
+@router.get("/export")
+def export_products_endpoint(user=Depends(admin_required)):
+    """Stream every product (category, tags, active promotions) as NDJSON
+
+    One JSON object per line, in id order. Used by search_service to rebuild
+    its index from scratch; rows come from a server-side cursor, so neither
+    side holds the whole catalog in memory.
+    """
+
+    def lines():
+        # Not get_db: the session has to outlive this function, until the
+        # last line is sent
+        db = SessionLocal()
+        try:
+            chunk = []
+            for product in export_products(db):
+                chunk.append(json.dumps(product))
+                if len(chunk) == EXPORT_BATCH_SIZE:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+            if chunk:
+                yield "\n".join(chunk) + "\n"
+        finally:
+            db.rollback()
+            db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @router.delete("/{product_id}", status_code=204)
@@ -126,6 +231,74 @@ def adjust_stock_endpoint(
     return adjust_stock(product_id, adjustment.quantity, db)
 
 
+class StockSlots(BaseModel):
+    slots: int = Field(..., ge=0, le=STOCK_SLOTS_MAX)  # 0 = single stock row
+
+
+@router.put("/{product_id}/stock/slots", response_model=ProductResponse)
+def set_stock_slots_endpoint(
+    product_id: int,
+    body: StockSlots,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    """Turn hot-SKU mode on or off for a product
+
+    With N slots, stock decrements for the product lock one of N counters
+    instead of the product row, so concurrent buyers do not queue on it.
+    Its reported stock is then refreshed every STOCK_RECONCILE_INTERVAL.
+    """
+    try:
+        return set_stock_slots(product_id, body.slots, db)
+    except ProductNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=ProductNotFound.message
+        )
+
+
+class StockAdjustmentItem(BaseModel):
+    product_id: int
+    quantity: int  # positive or negative
+
+
+class BulkStockAdjustment(BaseModel):
+    items: List[StockAdjustmentItem] = Field(..., min_length=1)
+
+
+@router.post("/stock/bulk", response_model=list[ProductResponse])
+def adjust_stock_bulk_endpoint(
+    adjustment: BulkStockAdjustment,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    """Adjust the stock of several products atomically
+
+    Used by order_service to take a whole cart out of stock in one call.
+
+    Either every adjustment is applied or none is; a rejection returns 409
+    with the ids that are missing or would drop below their reserved units.
+    """
+    try:
+        return adjust_stock_bulk(
+            [(item.product_id, item.quantity) for item in adjustment.items], db
+        )
+    except BatchTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_SIZE} products per adjustment",
+        )
+    except StockAdjustmentRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": e.code,
+                "message": e.message,
+                "missing_product_ids": e.missing_ids,
+                "insufficient_product_ids": e.insufficient_ids,
+            },
+        )
+
+
 """Only admins can create/update/delete
 
 Public users can still GET /products"""
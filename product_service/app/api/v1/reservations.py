@@ -0,0 +1,117 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app.schemas.reservation import ReservationCreate, ReservationResponse
+from app.domain.product_service import (
+    MAX_BATCH_SIZE,
+    BatchTooLarge,
+    StockAdjustmentRejected,
+)
+from app.domain.reservation_service import (
+    ReservationExpired,
+    ReservationNotFound,
+    ReservationNotHeld,
+    confirm_reservation,
+    get_reservation,
+    release_reservation,
+    reserve_stock,
+)
+from app.infrastructure.database import SessionLocal
+from app.api.dependencies import admin_required
+
+router = APIRouter()
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _raise_not_found():
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail=ReservationNotFound.message
+    )
+
+
+@router.post("/", response_model=ReservationResponse, status_code=201)
+def reserve_stock_endpoint(
+    request: ReservationCreate,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    """Hold stock for a cart until checkout or until the TTL passes
+
+    Either every item is held or none is (409 with the offending ids)."""
+    try:
+        return reserve_stock(
+            [(item.product_id, item.quantity) for item in request.items],
+            db,
+            ttl_seconds=request.ttl_seconds,
+        )
+    except BatchTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_SIZE} products per reservation",
+        )
+    except StockAdjustmentRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": e.code,
+                "message": e.message,
+                "missing_product_ids": e.missing_ids,
+                "insufficient_product_ids": e.insufficient_ids,
+            },
+        )
+
+
+@router.get("/{reservation_id}", response_model=ReservationResponse)
+def get_reservation_endpoint(
+    reservation_id: str,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    try:
+        return get_reservation(reservation_id, db)
+    except ReservationNotFound:
+        _raise_not_found()
+
+
+@router.post("/{reservation_id}/confirm", response_model=ReservationResponse)
+def confirm_reservation_endpoint(
+    reservation_id: str,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    """Checkout: the held units leave stock for good"""
+    try:
+        return confirm_reservation(reservation_id, db)
+    except ReservationNotFound:
+        _raise_not_found()
+    except ReservationExpired:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE, detail=ReservationExpired.message
+        )
+    except ReservationNotHeld:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=ReservationNotHeld.message
+        )
+
+
+@router.post("/{reservation_id}/release", response_model=ReservationResponse)
+def release_reservation_endpoint(
+    reservation_id: str,
+    db: Session = Depends(get_db),
+    user=Depends(admin_required),
+):
+    """Cancel / refund: held or confirmed units go back to available stock"""
+    try:
+        return release_reservation(reservation_id, db)
+    except ReservationNotFound:
+        _raise_not_found()
@@ -31,6 +31,39 @@ REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 JWT_ISSUER = os.getenv("JWT_ISSUER", "ecommerce-platform")
 JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "ecommerce-clients")
 
+# =====================================================
+# CACHING
+# =====================================================
+PRODUCT_LIST_CACHE_TTL = float(os.getenv("PRODUCT_LIST_CACHE_TTL", 30))  # seconds
+PRODUCT_LIST_CACHE_SIZE = int(os.getenv("PRODUCT_LIST_CACHE_SIZE", 1024))  # entries
+# Invalidation counters kept by the in-process cache before they start over
+PRODUCT_LIST_CACHE_COUNTERS = int(os.getenv("PRODUCT_LIST_CACHE_COUNTERS", 100_000))
+# Set this with more than one worker or replica: the cache then lives in Redis
+# and invalidations reach every process at once. Without it each process
+# caches on its own and serves another's stale entries until they expire
+PRODUCT_LIST_CACHE_REDIS_URL = os.getenv("PRODUCT_LIST_CACHE_REDIS_URL", "")
+
+# =====================================================
+# STOCK RESERVATIONS
+# =====================================================
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", 900))
+RESERVATION_MAX_TTL_SECONDS = int(os.getenv("RESERVATION_MAX_TTL_SECONDS", 3600))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", 5))
+RESERVATION_SWEEP_BATCH_SIZE = int(os.getenv("RESERVATION_SWEEP_BATCH_SIZE", 500))
+
+# =====================================================
+# HOT-SKU STOCK SLOTS
+# =====================================================
+STOCK_SLOTS_MAX = int(os.getenv("STOCK_SLOTS_MAX", 64))  # per product
+STOCK_RECONCILE_INTERVAL = float(
+    os.getenv("STOCK_RECONCILE_INTERVAL", 1)
+)  # seconds between Product.stock refreshes for slotted products
+
+# =====================================================
+# BULK EXPORT
+# =====================================================
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))  # rows per cursor fetch
+
 
 from pydantic_settings import BaseSettings
 
@@ -1,3 +1,8 @@
 class DomainError(Exception):
     code: str = "DOMAIN_ERROR"
     message: str = "A domain error occurred"
+
+    def __init__(self, message: str = None):
+        if message is not None:
+            self.message = message
+        super().__init__(self.message)
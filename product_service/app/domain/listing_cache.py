@@ -0,0 +1,154 @@
+"""
+Read-through cache for GET /api/v1/products.
+
+- Entries are keyed on the normalized filter tuple plus sort and page
+- Invalidation is driven by the same product events product_service publishes,
+  through version counters kept in the cache backend, so every process
+  sharing a backend sees every invalidation:
+    - each product has a counter, bumped by every event about it; an entry
+      records the counters of the products it lists
+    - product_created / product_deleted, and updates that change a filter or
+      sort field, also bump the counter of the category and tags the product
+      had and has, and the one of unfiltered listings, since rows may have
+      moved between pages; an entry filtered by category (or else by tag)
+      records that counter, any other entry the unfiltered one
+    - product_stock_adjusted, and updates that leave every filter and sort
+      field alone, only bump the product's own counter
+  An entry is served only while every counter it recorded is unchanged
+- A read that started before an invalidation never stores its result,
+  so a slow query cannot put stale rows back into the cache
+- The backend is in-process unless PRODUCT_LIST_CACHE_REDIS_URL is set,
+  which deployments with more than one worker should do
+"""
+
+import json
+from typing import List, NamedTuple, Optional
+
+from app.core.config import (
+    PRODUCT_LIST_CACHE_COUNTERS,
+    PRODUCT_LIST_CACHE_REDIS_URL,
+    PRODUCT_LIST_CACHE_SIZE,
+    PRODUCT_LIST_CACHE_TTL,
+)
+from app.infrastructure.cache import CacheBackend, LocalLRUCache, RedisCache
+
+
+class ListingFilters(NamedTuple):
+    name: Optional[str]
+    min_price: Optional[float]
+    max_price: Optional[float]
+    category_id: Optional[int]
+    tag_id: Optional[int]
+
+    @classmethod
+    def normalize(cls, name, min_price, max_price, category_id, tag_id):
+        # ilike is case-insensitive, so "Phone" and "phone" share entries
+        name = name.strip().lower() if name and name.strip() else None
+        return cls(name, min_price, max_price, category_id, tag_id)
+
+
+# Fields that decide whether, and where, a product shows up in a listing
+_LISTING_FIELDS = ("name", "price", "category", "tags")
+
+
+# Counter bumped by every invalidation, to tell reads that raced one
+_SEQUENCE = "products:version"
+
+
+def _product_counter(product_id) -> str:
+    return f"products:version:product:{product_id}"
+
+
+def _scope_counter(category_id=None, tag_id=None) -> str:
+    """The counter of the listings a product can enter or leave"""
+    if category_id is not None:
+        return f"products:version:category:{category_id}"
+    if tag_id is not None:
+        return f"products:version:tag:{tag_id}"
+    return "products:version:all"
+
+
+class ProductListingCache:
+    def __init__(self, backend: CacheBackend, ttl: float = PRODUCT_LIST_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(filters: ListingFilters, sort_by, sort_order, limit, offset, cursor):
+        return "products:" + json.dumps(
+            [list(filters), sort_by, sort_order, limit, offset, cursor],
+            separators=(",", ":"),
+        )
+
+    def generation(self) -> int:
+        """Token to pass to put(); taken before running the query"""
+        return self.backend.get_counters([_SEQUENCE])[0]
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if self.backend.get_counters(entry["depends_on"]) != entry["versions"]:
+            self.backend.delete_many([key])
+            return None
+        return entry["products"]
+
+    def put(
+        self, key: str, filters: ListingFilters, products: List[dict], generation: int
+    ):
+        depends_on = [_scope_counter(filters.category_id, filters.tag_id)] + [
+            _product_counter(product["id"]) for product in products
+        ]
+        versions = self.backend.get_counters(depends_on + [_SEQUENCE])
+        if versions.pop() != generation:
+            return  # invalidated while the query ran
+
+        self.backend.set(
+            key,
+            {"depends_on": depends_on, "versions": versions, "products": products},
+            self.ttl,
+        )
+
+    def invalidate(self, event_type: str, data: dict, previous: dict = None):
+        """Make stale the entries a product event can change"""
+        counters = [_product_counter(data.get("id"))]
+        moved = event_type != "product_stock_adjusted" and not (
+            event_type == "product_updated"
+            and previous
+            and all(previous.get(field) == data.get(field) for field in _LISTING_FIELDS)
+        )
+        if moved:
+            counters.append(_scope_counter())
+            for version in (previous, data):
+                if not version:
+                    continue
+                category = version.get("category") or {}
+                if category.get("id") is not None:
+                    counters.append(_scope_counter(category_id=category["id"]))
+                for tag in version.get("tags") or []:
+                    counters.append(_scope_counter(tag_id=tag["id"]))
+
+        self.backend.incr(_SEQUENCE)
+        for counter in dict.fromkeys(counters):
+            self.backend.incr(counter)
+
+    def clear(self):
+        self.backend.incr(_SEQUENCE)
+        self.backend.clear()
+
+
+def _default_backend() -> CacheBackend:
+    if PRODUCT_LIST_CACHE_REDIS_URL:
+        return RedisCache(PRODUCT_LIST_CACHE_REDIS_URL)
+    return LocalLRUCache(
+        max_entries=PRODUCT_LIST_CACHE_SIZE, max_counters=PRODUCT_LIST_CACHE_COUNTERS
+    )
+
+
+listing_cache = ProductListingCache(_default_backend())
+
+
+def use_backend(backend: CacheBackend):
+    """Swap in another backend, e.g. a shared one, at startup"""
+    listing_cache.clear()
+    listing_cache.backend = backend
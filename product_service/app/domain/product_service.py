@@ -1,15 +1,32 @@
 from app.schemas.product import (
     ProductCreate,
     ProductResponse,
+    ProductDetailResponse,
+    ProductPromotionResponse,
     ProductUpdate,
     CategoryResponse,
     TagResponse,
 )
-from app.infrastructure.models import Product, Tag
+from app.infrastructure.models import Product, ProductStockSlot, Promotion, Tag
 from app.core.errors import DomainError
-from sqlalchemy.orm import Session
-from typing import Optional
-from app.infrastructure.event_publisher import publish_event
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import Dict, Iterator, List, Optional
+from collections import defaultdict
+import base64
+import binascii
+import json
+from app.infrastructure.outbox import enqueue_event
+from app.core.config import EXPORT_BATCH_SIZE
+from app.domain.listing_cache import ListingFilters, listing_cache
+from app.domain.stock_shards import (
+    available_in_slots,
+    collapse_slots,
+    lock_products,
+    return_to_slots,
+    split_into_slots,
+    take_from_slots,
+)
 
 
 class ProductAlreadyExists(DomainError):
@@ -27,6 +44,38 @@ class InsufficientStock(DomainError):
     message = "Not enough stock available"
 
 
+MAX_BATCH_SIZE = 200
+
+
+class BatchTooLarge(DomainError):
+    code = "BATCH_TOO_LARGE"
+    message = f"At most {MAX_BATCH_SIZE} products can be fetched per batch"
+
+
+class StockAdjustmentRejected(DomainError):
+    code = "STOCK_ADJUSTMENT_REJECTED"
+    message = "Stock adjustment rejected, no product was changed"
+
+    def __init__(self, missing_ids: List[int], insufficient_ids: List[int]):
+        super().__init__(self.message)
+        self.missing_ids = missing_ids
+        self.insufficient_ids = insufficient_ids
+
+
+class InvalidCursor(DomainError):
+    code = "INVALID_CURSOR"
+    message = "Cursor is malformed or was issued for another sort order"
+
+
+# Columns list_products can sort by. Each one is paired with Product.id in a
+# composite index (see Product.__table_args__) so keyset pages are index seeks.
+SORTABLE_COLUMNS = {
+    "id": Product.id,
+    "name": Product.name,
+    "price": Product.price,
+}
+
+
 def create_product(product: ProductCreate, db: Session) -> ProductResponse:
     existing = db.query(Product).filter(Product.name == product.name).first()
     if existing:
@@ -45,17 +94,20 @@ def create_product(product: ProductCreate, db: Session) -> ProductResponse:
         db_product.tags = tags
 
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    db.flush()
 
-    response = _product_to_response(db_product)
+    response = _product_to_response(_load_product(db, db_product.id))
 
-    # Publish event after successful creation
-    publish_event(
+    # Outbox row commits with the product; the relay publishes it
+    enqueue_event(
+        db,
         exchange="product_events",
         event_type="product_created",
         data=response.model_dump(),
     )
+    db.commit()
+
+    listing_cache.invalidate("product_created", response.model_dump())
 
     return response
 
@@ -91,6 +143,10 @@ Pagination is fully integrated with filters and sorting
 Domain layer still handles all logic — API just passes parameters
 
 Safe defaults and caps prevent abuse
+
+Cursor mode (keyset pagination) skips OFFSET entirely: the cursor holds the
+last row's sort key and id, and the next page starts with
+WHERE (sort_key, id) > (last_key, last_id), so deep pages cost as much as the first
 """
 
 
@@ -105,65 +161,190 @@ def list_products(
     sort_order: Optional[str] = "asc",
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
 ):
-    products = db.query(Product)
+    sort_by, sort_order = _normalize_sort(sort_by, sort_order)
+
+    # Read-through cache, keyed on the normalized filters, sort and page
+    filters = ListingFilters.normalize(name, min_price, max_price, category_id, tag_id)
+    cache_key = listing_cache.make_key(
+        filters, sort_by, sort_order, limit, 0 if cursor else offset, cursor
+    )
+    cached = listing_cache.get(cache_key)
+    if cached is not None:
+        return [ProductResponse.model_validate(product) for product in cached]
+    cache_generation = listing_cache.generation()
+
+    # Category and tags are loaded with the page, not once per product
+    query = _with_relations(db.query(Product))
 
     # Apply filters
     if name:
         query = query.filter(Product.name.ilike(f"%{name}%"))
 
-    if min_price:
+    if min_price is not None:
         query = query.filter(Product.price >= min_price)
 
-    if max_price:
-        query == query.filter(Product.price <= max_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
 
-    if category_id:
+    if category_id is not None:
         query = query.filter(Product.category_id == category_id)
 
-    if tag_id:
+    if tag_id is not None:
         query = query.join(Product.tags).filter(Tag.id == tag_id)
 
-    # Apply sorting
-    sort_column = getattr(Product, sort_by, Product.id)
-    if sort_order.lower() == "desc":
-        sort_column = sort_column.desc()
+    # Apply sorting, with id as tie-breaker so the order is total
+    sort_column = SORTABLE_COLUMNS[sort_by]
+    descending = sort_order == "desc"
+
+    if cursor:
+        last_key, last_id = _decode_cursor(cursor, sort_by, sort_order)
+        if sort_by == "id":
+            after = Product.id < last_id if descending else Product.id > last_id
+        else:
+            row, last_row = tuple_(sort_column, Product.id), tuple_(last_key, last_id)
+            after = row < last_row if descending else row > last_row
+        query = query.filter(after)
+
+    if sort_by == "id":
+        order_by = [Product.id.desc() if descending else Product.id]
+    elif descending:
+        order_by = [sort_column.desc(), Product.id.desc()]
+    else:
+        order_by = [sort_column, Product.id]
+
+    query = query.order_by(*order_by)
+
+    # Apply pagination; a cursor replaces the offset
+    if not cursor:
+        query = query.offset(offset)
+    query = query.limit(limit)
+
+    products = [_product_to_response(product) for product in query.all()]
+
+    listing_cache.put(
+        cache_key,
+        filters,
+        [product.model_dump(mode="json") for product in products],
+        cache_generation,
+    )
+
+    return products
+
+
+def _normalize_sort(sort_by: Optional[str], sort_order: Optional[str]) -> tuple:
+    sort_by = sort_by if sort_by in SORTABLE_COLUMNS else "id"
+    sort_order = "desc" if sort_order and sort_order.lower() == "desc" else "asc"
+    return sort_by, sort_order
+
+
+def next_cursor(
+    products: List[ProductResponse], sort_by: str, sort_order: str, limit: int
+) -> Optional[str]:
+    """Opaque cursor for the page after `products`, or None on the last page"""
+    if len(products) < limit:
+        return None
+
+    sort_by, sort_order = _normalize_sort(sort_by, sort_order)
+    last = products[-1]
+    payload = {"s": sort_by, "o": sort_order, "k": getattr(last, sort_by), "id": last.id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    query = query.order_by(sort_column)
 
-    # Apply pagination
-    query = query.offset(offset).limit(limit)
+def _decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        last_key, last_id = payload["k"], int(payload["id"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor()
 
-    products = query.all()
+    if payload.get("s") != sort_by or payload.get("o") != sort_order:
+        raise InvalidCursor()
 
+    return last_key, last_id
+
+
+def get_products_by_ids(
+    product_ids: List[int], db: Session
+) -> List[ProductDetailResponse]:
+    """
+    Fetch many products at once, e.g. to price a whole cart.
+
+    One IN lookup loads the products with their category joined, and one
+    selectin query each loads tags and active promotions, so the number of
+    statements does not grow with the number of ids.
+    Unknown ids are skipped; results follow the order of the requested ids.
+    """
+    unique_ids = list(dict.fromkeys(product_ids))
+    if len(unique_ids) > MAX_BATCH_SIZE:
+        raise BatchTooLarge()
+
+    products = (
+        _with_relations(db.query(Product))
+        .options(selectinload(Product.promotions.and_(Promotion.active == True)))
+        .filter(Product.id.in_(unique_ids))
+        .all()
+    )
+
+    by_id = {product.id: product for product in products}
     return [
-        ProductResponse(
-            id=product.id,
-            name=product.name,
-            description=product.description,
-            price=product.price,
-        )
-        for product in products
+        _product_to_detail_response(by_id[product_id])
+        for product_id in unique_ids
+        if product_id in by_id
     ]
 
 
+def export_products(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Every product with its category, tags and active promotions, in id order,
+    shaped like the product event payloads (used to rebuild the search index).
+
+    Rows are streamed from a server-side cursor batch_size at a time, and the
+    tags and promotions of each batch come from one SELECT ... IN, so memory
+    stays bounded by the batch however large the catalog is. The export runs
+    in one REPEATABLE READ transaction: a consistent view of the catalog.
+    """
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    query = (
+        _with_relations(db.query(Product))
+        .options(selectinload(Product.promotions.and_(Promotion.active == True)))
+        .order_by(Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for product in query:
+        yield _product_to_detail_response(product).model_dump()
+
+
 def delete_product(product_id: int, db: Session):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = (
+        _with_relations(db.query(Product)).filter(Product.id == product_id).first()
+    )
     if not product:
         raise DomainError(message="Product not found")
+    previous = _product_to_response(product).model_dump()
+    db.query(ProductStockSlot).filter(ProductStockSlot.product_id == product_id).delete(
+        synchronize_session=False
+    )
     db.delete(product)
-    db.commit()
-
-    # publish event after successful deletion
-    publish_event(
+    enqueue_event(
+        db,
         exchange="product_events",
         event_type="product_deleted",
         data={"id": product_id},
     )
+    db.commit()
+
+    listing_cache.invalidate("product_deleted", {"id": product_id}, previous=previous)
 
 
 def update_product(product_id: int, updates: ProductUpdate, db: Session):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    # tags are loaded up front: replacing the collection needs the old one
+    product = (
+        _with_relations(db.query(Product)).filter(Product.id == product_id).first()
+    )
 
     if not product:
         raise ProductNotFound()
@@ -174,6 +355,8 @@ def update_product(product_id: int, updates: ProductUpdate, db: Session):
         if existing:
             raise ProductAlreadyExists()
 
+    previous = _product_to_response(product).model_dump()
+
     # Apply updates
     if updates.name is not None:
         product.name = updates.name
@@ -191,27 +374,55 @@ def update_product(product_id: int, updates: ProductUpdate, db: Session):
         tags = db.query(Tag).filter(Tag.id.in_(updates.tag_ids)).all()
         product.tags = tags
 
-    db.commit()
-    db.refresh(product)
+    db.flush()
 
-    resopnse = _product_to_response(product)
+    resopnse = _product_to_response(_load_product(db, product_id))
 
-    # publish event after successful update
-    publish_event(
+    enqueue_event(
+        db,
         exchange="product_events",
         event_type="product_updated",
         data=resopnse.model_dump(),
     )
+    db.commit()
+
+    listing_cache.invalidate(
+        "product_updated", resopnse.model_dump(), previous=previous
+    )
 
     return resopnse
 
 
+def _with_relations(query):
+    """Eager-load what _product_to_response touches.
+
+    category is many-to-one, so it is joined into the same SELECT; tags are a
+    collection, so they come from one extra SELECT ... IN for the whole result
+    instead of one lazy load per product.
+    """
+    return query.options(joinedload(Product.category), selectinload(Product.tags))
+
+
+def _load_product(db: Session, product_id: int) -> Product:
+    """(Re)load a product with its relations, e.g. after a commit expired it"""
+    return (
+        _with_relations(db.query(Product))
+        .filter(Product.id == product_id)
+        .populate_existing()
+        .one()
+    )
+
+
 def _product_to_response(product: Product) -> ProductResponse:
     return ProductResponse(
         id=product.id,
         name=product.name,
         description=product.description,
         price=product.price,
+        stock=product.stock,
+        reserved_stock=product.reserved,
+        available_stock=product.stock - product.reserved,
+        stock_slots=product.stock_slots or 0,
         category=(
             CategoryResponse(id=product.category.id, name=product.category.name)
             if product.category
@@ -221,45 +432,189 @@ def _product_to_response(product: Product) -> ProductResponse:
     )
 
 
+def _product_to_detail_response(product: Product) -> ProductDetailResponse:
+    return ProductDetailResponse(
+        **_product_to_response(product).model_dump(),
+        promotions=[
+            ProductPromotionResponse(
+                id=promo.id,
+                name=promo.name,
+                discount_type=promo.discount_type,
+                discount_value=promo.discount_value,
+            )
+            for promo in product.promotions
+        ],
+    )
+
+
 def adjust_stock(product_id: int, quantity: int, db: Session):
     """
     Adjust stock by a positive or negative quantity.
     Negative quantity = decrement stock.
     with_for_update() ensures row-level locking → prevents race conditions
     Event is published asynchronously for other services
+
+    Slotted (hot-SKU) products only lock one stock slot; their event is
+    published by the StockReconciler, rolled up with the other decrements.
     """
-    product = (
-        db.query(Product).filter(Product.id == product_id).with_for_update().first()
-    )  # with_for_update() ensures row-level locking → prevents race conditions
+    locked, slotted = lock_products(db, [product_id])
+    product = locked.get(product_id) or slotted.get(product_id)
 
     if not product:
         raise ProductNotFound()
 
-    if product.stock + quantity < 0:
+    if product.stock_slots:
+        if quantity < 0:
+            if not take_from_slots(db, product, -quantity):
+                db.rollback()
+                raise InsufficientStock()
+        elif quantity > 0:
+            return_to_slots(db, product, quantity)
+        db.commit()
+        return _with_slot_totals(db, [_load_product(db, product_id)])[0]
+
+    # Units held by reservations cannot be adjusted away
+    if product.stock + quantity < product.reserved:
         raise InsufficientStock()
 
     product.stock += quantity
+    level = {"id": product.id, "stock": product.stock}
+    enqueue_event(
+        db,
+        exchange="product_events",
+        event_type="product_stock_adjusted",
+        data=level,
+    )
     db.commit()
-    db.refresh(product)
 
-    # publish event after successful stock adjustment
-    publish_event(
+    listing_cache.invalidate("product_stock_adjusted", level)
+
+    return _product_to_response(_load_product(db, product_id))
+
+
+def set_stock_slots(product_id: int, slots: int, db: Session) -> ProductResponse:
+    """
+    Switch a product into (slots > 0) or out of (slots = 0) hot-SKU mode,
+    or change its number of slots. Stock totals are reconciled on the way.
+    """
+    product = (
+        db.query(Product).filter(Product.id == product_id).with_for_update().first()
+    )
+    if not product:
+        raise ProductNotFound()
+
+    if product.stock_slots:
+        collapse_slots(db, product)
+        db.flush()  # the old slot rows must be gone before new ones are added
+    if slots:
+        split_into_slots(db, product, slots)
+    level = {"id": product.id, "stock": product.stock}
+    enqueue_event(
+        db,
         exchange="product_events",
         event_type="product_stock_adjusted",
-        data={
-            "id": product.id,
-            "stock": product.stock,
-        },
+        data=level,
     )
+    db.commit()
 
-    return _product_to_response(product)
+    listing_cache.invalidate("product_stock_adjusted", level)
+    return _product_to_response(_load_product(db, product_id))
 
 
+def adjust_stock_bulk(adjustments: List[tuple], db: Session) -> List[ProductResponse]:
+    """
+    Apply several (product_id, quantity) adjustments in one transaction.
+
+    - quantities for the same product are summed first
+    - rows are locked in ascending id order, so two carts sharing hot
+      products always lock them in the same order and cannot deadlock
+    - if any product is missing or would drop below its reserved units,
+      nothing is changed
+    - a single product_stock_bulk_adjusted event carries every new stock level
+    """
+    totals: Dict[int, int] = defaultdict(int)
+    for product_id, quantity in adjustments:
+        totals[product_id] += quantity
+
+    if len(totals) > MAX_BATCH_SIZE:
+        raise BatchTooLarge()
+
+    product_ids = sorted(totals)
+    locked, slotted = lock_products(db, product_ids)
+
+    missing_ids = [
+        product_id
+        for product_id in product_ids
+        if product_id not in locked and product_id not in slotted
+    ]
+    insufficient_ids = [
+        product.id
+        for product in locked.values()
+        if product.stock + totals[product.id] < product.reserved
+    ]
+    if not missing_ids and not insufficient_ids:
+        for product in slotted.values():
+            quantity = totals[product.id]
+            if quantity < 0 and not take_from_slots(db, product, -quantity):
+                insufficient_ids.append(product.id)
+            elif quantity > 0:
+                return_to_slots(db, product, quantity)
+    if missing_ids or insufficient_ids:
+        db.rollback()  # release the row locks right away
+        raise StockAdjustmentRejected(missing_ids, sorted(insufficient_ids))
+
+    for product in locked.values():
+        product.stock += totals[product.id]
+
+    # Slotted products are announced by the StockReconciler
+    levels = [
+        {"id": product.id, "stock": product.stock} for product in locked.values()
+    ]
+    if levels:
+        enqueue_event(
+            db,
+            exchange="product_events",
+            event_type="product_stock_bulk_adjusted",
+            data={"items": levels},
+        )
+    db.commit()
+
+    for level in levels:
+        listing_cache.invalidate("product_stock_adjusted", level)
+
+    products = (
+        _with_relations(db.query(Product))
+        .filter(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .populate_existing()
+        .all()
+    )
+    return _with_slot_totals(db, products)
+
+
+def _with_slot_totals(db: Session, products: List[Product]) -> List[ProductResponse]:
+    """
+    Responses for freshly adjusted products. Product.stock of a slotted
+    product lags until the next reconcile, so its live slot total is used.
+    """
+    responses = [_product_to_response(product) for product in products]
+    slotted_ids = [product.id for product in products if product.stock_slots]
+    if slotted_ids:
+        available = available_in_slots(db, slotted_ids)
+        for response in responses:
+            if response.id in available:
+                response.available_stock = available[response.id]
+                response.stock = response.available_stock + response.reserved_stock
+    return responses
+
 """
 ✅ Notes:
 
 1. Event data contains product info for created/updated events
 
+   Events go to the outbox in the same transaction as the change, so a
+   rolled-back change never publishes and a committed one always does
+
 2. Deleted event only needs product ID
 
 3. Keeps domain layer aware of events, but publishing is a thin infrastructure hook 
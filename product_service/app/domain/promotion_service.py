@@ -6,7 +6,7 @@ from app.schemas.promotion import (
     PromotionUpdate,
 )  # request/response schemas
 from app.infrastructure.models import Promotion, Product  # table definition
-from app.infrastructure.event_publisher import publish_event  # event publishing
+from app.infrastructure.outbox import enqueue_event  # event publishing
 
 
 class PromotionNotFound(DomainError):
@@ -14,6 +14,19 @@ class PromotionNotFound(DomainError):
     message = "Promotion not found"
 
 
+def _promotion_event(promo: Promotion) -> dict:
+    # The promotion as listed on its product (ProductPromotionResponse), so
+    # consumers such as search can patch the product without fetching it
+    return {
+        "id": promo.id,
+        "product_id": promo.product_id,
+        "name": promo.name,
+        "discount_type": promo.discount_type,
+        "discount_value": promo.discount_value,
+        "active": promo.active,
+    }
+
+
 def create_promotion(promo: PromotionCreate, db: Session) -> PromotionResponse:
     existing = db.query(Promotion).filter(promo.name == promo.name).first()
 
@@ -33,14 +46,16 @@ def create_promotion(promo: PromotionCreate, db: Session) -> PromotionResponse:
         product_id=promo.product_id,
     )
     db.add(db_promo)
-    db.commit()
-    db.refresh(db_promo)
+    db.flush()
 
-    publish_event(
+    enqueue_event(
+        db,
         exchange="promotions",
         event_type="promotion_created",
-        data={"id": db_promo.id, "product_id": db_promo.product_id},
+        data=_promotion_event(db_promo),
     )
+    db.commit()
+    db.refresh(db_promo)
 
     return PromotionResponse(
         id=db_promo.id,
@@ -112,14 +127,14 @@ def update_promotion(
     if updates.active is not None:
         promo.active = updates.active
 
-    db.commit()
-    db.refresh(promo)
-
-    publish_event(
+    enqueue_event(
+        db,
         exchange="promotions",
         event_type="promotion_updated",
-        data={"id": promo.id, "product_id": promo.product_id},
+        data=_promotion_event(promo),
     )
+    db.commit()
+    db.refresh(promo)
 
     return PromotionResponse(
         id=-promo.id,
@@ -138,10 +153,10 @@ def delete_promotion(promo_id: int, db: Session):
         raise PromotionNotFound()
 
     db.delete(promo)
-    db.commit()
-
-    publish_event(
+    enqueue_event(
+        db,
         exchange="promotions",
         event_type="promotion_deleted",
         data={"id": promo.id, "product_id": promo.product_id},
     )
+    db.commit()
@@ -0,0 +1,336 @@
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import (
+    RESERVATION_SWEEP_BATCH_SIZE,
+    RESERVATION_SWEEP_INTERVAL,
+    RESERVATION_TTL_SECONDS,
+)
+from app.core.errors import DomainError
+from app.domain.listing_cache import listing_cache
+from app.domain.product_service import (
+    MAX_BATCH_SIZE,
+    BatchTooLarge,
+    StockAdjustmentRejected,
+)
+from app.domain.stock_shards import lock_products, return_to_slots, take_from_slots
+from app.infrastructure.database import SessionLocal
+from app.infrastructure.outbox import enqueue_event
+from app.infrastructure.models import StockReservation, StockReservationItem
+from app.schemas.reservation import ReservationItem, ReservationResponse
+
+logger = logging.getLogger(__name__)
+
+
+class ReservationNotFound(DomainError):
+    code = "RESERVATION_NOT_FOUND"
+    message = "Reservation not found"
+
+
+class ReservationExpired(DomainError):
+    code = "RESERVATION_EXPIRED"
+    message = "Reservation expired and its stock was released"
+
+
+class ReservationNotHeld(DomainError):
+    code = "RESERVATION_NOT_HELD"
+    message = "Reservation was already released or expired"
+
+
+def reserve_stock(
+    items: List[tuple], db: Session, ttl_seconds: Optional[int] = None
+) -> ReservationResponse:
+    """
+    Hold (product_id, quantity) pairs for `ttl_seconds`.
+
+    Held units stay in Product.stock but count in Product.reserved, so
+    available = stock - reserved. Either every item is held or none is.
+    For slotted products the held units are taken out of the slots.
+    """
+    totals = _sum_quantities(items)
+    if len(totals) > MAX_BATCH_SIZE:
+        raise BatchTooLarge()
+
+    locked, slotted = lock_products(db, totals)
+
+    missing_ids = [
+        product_id
+        for product_id in totals
+        if product_id not in locked and product_id not in slotted
+    ]
+    insufficient_ids = [
+        product.id
+        for product in locked.values()
+        if product.stock - product.reserved < totals[product.id]
+    ]
+    if not missing_ids and not insufficient_ids:
+        for product in slotted.values():
+            if not take_from_slots(db, product, totals[product.id]):
+                insufficient_ids.append(product.id)
+    if missing_ids or insufficient_ids:
+        db.rollback()  # release the row locks right away
+        raise StockAdjustmentRejected(missing_ids, sorted(insufficient_ids))
+
+    for product in locked.values():
+        product.reserved += totals[product.id]
+
+    reservation = StockReservation(
+        id=str(uuid.uuid4()),
+        status="held",
+        expires_at=datetime.utcnow()
+        + timedelta(seconds=ttl_seconds or RESERVATION_TTL_SECONDS),
+        items=[
+            StockReservationItem(product_id=product_id, quantity=quantity)
+            for product_id, quantity in totals.items()
+        ],
+    )
+    db.add(reservation)
+
+    response = _reservation_to_response(reservation)
+    levels = _stock_levels(locked.values())
+    db.commit()
+
+    _stock_changed(levels)
+    return response
+
+
+def get_reservation(reservation_id: str, db: Session) -> ReservationResponse:
+    reservation = (
+        db.query(StockReservation)
+        .options(selectinload(StockReservation.items))
+        .filter(StockReservation.id == reservation_id)
+        .first()
+    )
+    if not reservation:
+        raise ReservationNotFound()
+    return _reservation_to_response(reservation)
+
+
+def confirm_reservation(reservation_id: str, db: Session) -> ReservationResponse:
+    """Turn a live hold into a real decrement (checkout). Idempotent."""
+    reservation = _lock_reservation(db, reservation_id)
+
+    if reservation.status == "confirmed":
+        return _reservation_to_response(reservation)
+    if reservation.status == "expired":
+        raise ReservationExpired()
+    if reservation.status != "held":
+        raise ReservationNotHeld()
+
+    if reservation.expires_at <= datetime.utcnow():
+        # The sweeper has not reached it yet; release it now
+        levels = _release_holds(db, [reservation], "expired")
+        db.commit()
+        _stock_changed(levels)
+        raise ReservationExpired()
+
+    # Slotted products gave up the units when they were held; the
+    # reconciler sees the hold is gone and lowers their stock
+    locked, _ = lock_products(db, _sum_quantities(_item_pairs(reservation)))
+    for item in reservation.items:
+        product = locked.get(item.product_id)
+        if product is not None:
+            product.stock -= item.quantity
+            product.reserved -= item.quantity
+    reservation.status = "confirmed"
+
+    response = _reservation_to_response(reservation)
+    levels = _stock_levels(locked.values())
+    _enqueue_stock_levels(db, levels)
+    db.commit()
+
+    _stock_changed(levels)
+    return response
+
+
+def release_reservation(reservation_id: str, db: Session) -> ReservationResponse:
+    """
+    Give the stock back (cancel / refund). Idempotent.
+
+    A held reservation frees its reserved units; a confirmed one puts the
+    decremented units back into stock.
+    """
+    reservation = _lock_reservation(db, reservation_id)
+
+    if reservation.status == "held":
+        levels = _release_holds(db, [reservation], "released")
+    elif reservation.status == "confirmed":
+        locked, slotted = lock_products(db, _sum_quantities(_item_pairs(reservation)))
+        for item in reservation.items:
+            if item.product_id in locked:
+                locked[item.product_id].stock += item.quantity
+            elif item.product_id in slotted:
+                return_to_slots(db, slotted[item.product_id], item.quantity)
+        reservation.status = "released"
+        levels = _stock_levels(locked.values())
+        _enqueue_stock_levels(db, levels)
+    else:
+        return _reservation_to_response(reservation)
+
+    response = _reservation_to_response(reservation)
+    db.commit()
+
+    _stock_changed(levels)
+    return response
+
+
+def expire_reservations(db: Session, batch_size: int = RESERVATION_SWEEP_BATCH_SIZE) -> int:
+    """
+    Expire up to `batch_size` stale holds in one transaction.
+
+    Uses the partial (status='held', expires_at) index, and SKIP LOCKED so
+    sweepers in several workers split the work instead of queueing on it.
+    """
+    reservations = (
+        db.query(StockReservation)
+        .options(selectinload(StockReservation.items))
+        .filter(
+            StockReservation.status == "held",
+            StockReservation.expires_at <= datetime.utcnow(),
+        )
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not reservations:
+        return 0
+
+    levels = _release_holds(db, reservations, "expired")
+    db.commit()
+
+    _stock_changed(levels)
+    return len(reservations)
+
+
+class ReservationSweeper:
+    """Background thread that expires stale holds in batches"""
+
+    def __init__(
+        self,
+        interval: float = RESERVATION_SWEEP_INTERVAL,
+        batch_size: int = RESERVATION_SWEEP_BATCH_SIZE,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="reservation-sweeper", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def sweep(self) -> int:
+        expired = 0
+        while True:
+            db = SessionLocal()
+            try:
+                count = expire_reservations(db, self.batch_size)
+            finally:
+                db.close()
+            expired += count
+            if count < self.batch_size:
+                return expired
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                expired = self.sweep()
+                if expired:
+                    logger.info(f"Expired {expired} stock reservation(s)")
+            except Exception as e:
+                logger.error(f"Reservation sweep failed: {e}")
+
+
+def _sum_quantities(items) -> Dict[int, int]:
+    totals: Dict[int, int] = defaultdict(int)
+    for product_id, quantity in items:
+        totals[product_id] += quantity
+    return dict(totals)
+
+
+def _item_pairs(reservation: StockReservation) -> List[tuple]:
+    return [(item.product_id, item.quantity) for item in reservation.items]
+
+
+def _lock_reservation(db: Session, reservation_id: str) -> StockReservation:
+    reservation = (
+        db.query(StockReservation)
+        .options(selectinload(StockReservation.items))
+        .filter(StockReservation.id == reservation_id)
+        .with_for_update()
+        .first()
+    )
+    if not reservation:
+        raise ReservationNotFound()
+    return reservation
+
+
+def _release_holds(
+    db: Session, reservations: List[StockReservation], status: str
+) -> List[dict]:
+    totals = _sum_quantities(
+        pair for reservation in reservations for pair in _item_pairs(reservation)
+    )
+    locked, slotted = lock_products(db, totals)
+    for product_id, quantity in totals.items():
+        if product_id in locked:
+            product = locked[product_id]
+            product.reserved = max(product.reserved - quantity, 0)
+        elif product_id in slotted:
+            return_to_slots(db, slotted[product_id], quantity)
+    for reservation in reservations:
+        reservation.status = status
+    return _stock_levels(locked.values())
+
+
+def _stock_levels(products) -> List[dict]:
+    # Read before commit: afterwards every attribute is expired and
+    # would be reloaded one product at a time
+    return [
+        {"id": product.id, "stock": product.stock, "reserved": product.reserved}
+        for product in products
+    ]
+
+
+def _enqueue_stock_levels(db: Session, levels: List[dict]):
+    # Holds only move units between available and reserved; other services
+    # are told when stock itself changes (confirm, or release after confirm)
+    if levels:
+        enqueue_event(
+            db,
+            exchange="product_events",
+            event_type="product_stock_bulk_adjusted",
+            data={"items": levels},
+        )
+
+
+def _stock_changed(levels: List[dict]):
+    for level in levels:
+        listing_cache.invalidate("product_stock_adjusted", level)
+
+
+def _reservation_to_response(reservation: StockReservation) -> ReservationResponse:
+    return ReservationResponse(
+        id=reservation.id,
+        status=reservation.status,
+        expires_at=reservation.expires_at,
+        items=[
+            ReservationItem(product_id=item.product_id, quantity=item.quantity)
+            for item in reservation.items
+        ],
+    )
@@ -0,0 +1,262 @@
+"""
+Hot-SKU mode: a product's available stock split over N counter slots.
+
+- Every write to a normal product locks its products row, so all buyers of
+  one doorbuster SKU queue behind each other
+- With stock_slots = N > 0 the available units (stock - reserved) live in
+  N ProductStockSlot rows instead. A decrement locks one random slot that
+  can cover it (SKIP LOCKED), so N writers can proceed at once
+- Only when no single slot can cover a decrement are all slots locked, in
+  slot order, and drained together
+- The products row is never written on the hot path; StockReconciler
+  refreshes Product.stock / Product.reserved from the slots and the held
+  reservations every STOCK_RECONCILE_INTERVAL seconds, and publishes one
+  product_stock_bulk_adjusted event (via the outbox) for whatever changed
+"""
+
+import logging
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app.core.config import STOCK_RECONCILE_INTERVAL
+from app.domain.listing_cache import listing_cache
+from app.infrastructure.database import SessionLocal
+from app.infrastructure.models import (
+    Product,
+    ProductStockSlot,
+    StockReservation,
+    StockReservationItem,
+)
+from app.infrastructure.outbox import enqueue_event
+
+logger = logging.getLogger(__name__)
+
+# pg advisory lock id; one reconciler at a time across all workers
+_RECONCILE_LOCK_KEY = 0x5107C5
+
+
+def lock_products(
+    db: Session, product_ids: Iterable[int]
+) -> Tuple[Dict[int, Product], Dict[int, Product]]:
+    """
+    Returns (locked, slotted).
+
+    Normal products are locked FOR UPDATE in ascending id order so concurrent
+    carts cannot deadlock; slotted products are only read, their slots are
+    locked per decrement. Ids in neither dict do not exist.
+    """
+    product_ids = sorted(set(product_ids))
+    locked = {
+        product.id: product
+        for product in db.query(Product)
+        .filter(Product.id.in_(product_ids), Product.stock_slots == 0)
+        .order_by(Product.id)
+        .with_for_update()
+        .populate_existing()
+        .all()
+    }
+
+    rest = [product_id for product_id in product_ids if product_id not in locked]
+    slotted = {}
+    if rest:
+        slotted = {
+            product.id: product
+            for product in db.query(Product)
+            .filter(Product.id.in_(rest))
+            .order_by(Product.id)  # slots are locked in product id order too
+            .all()
+        }
+    return locked, slotted
+
+
+def take_from_slots(db: Session, product: Product, quantity: int) -> bool:
+    """Remove `quantity` available units; False if there are not enough"""
+    slot = (
+        db.query(ProductStockSlot)
+        .filter(
+            ProductStockSlot.product_id == product.id,
+            ProductStockSlot.stock >= quantity,
+        )
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if slot is not None:
+        slot.stock -= quantity
+        return True
+
+    # Stock is spread too thin (or every fitting slot is busy): lock them all
+    slots = _lock_slots(db, product.id)
+    if sum(slot.stock for slot in slots) < quantity:
+        return False
+
+    remaining = quantity
+    for slot in slots:
+        taken = min(slot.stock, remaining)
+        slot.stock -= taken
+        remaining -= taken
+        if not remaining:
+            break
+    return True
+
+
+def return_to_slots(db: Session, product: Product, quantity: int):
+    """Add `quantity` available units back to a random slot"""
+    db.query(ProductStockSlot).filter(
+        ProductStockSlot.product_id == product.id,
+        ProductStockSlot.slot == random.randrange(product.stock_slots),
+    ).update(
+        {ProductStockSlot.stock: ProductStockSlot.stock + quantity},
+        synchronize_session=False,
+    )
+
+
+def available_in_slots(db: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+    """Live available units of slotted products, for responses"""
+    rows = (
+        db.query(ProductStockSlot.product_id, func.sum(ProductStockSlot.stock))
+        .filter(ProductStockSlot.product_id.in_(list(product_ids)))
+        .group_by(ProductStockSlot.product_id)
+        .all()
+    )
+    return {product_id: int(total) for product_id, total in rows}
+
+
+def split_into_slots(db: Session, product: Product, slots: int):
+    """Spread the locked product's available units evenly over `slots` slots"""
+    available = product.stock - product.reserved
+    share, extra = divmod(available, slots)
+    db.add_all(
+        ProductStockSlot(
+            product_id=product.id, slot=slot, stock=share + (1 if slot < extra else 0)
+        )
+        for slot in range(slots)
+    )
+    product.stock_slots = slots
+
+
+def collapse_slots(db: Session, product: Product):
+    """Fold the slots back into the locked product row and drop them"""
+    slots = _lock_slots(db, product.id)
+    product.reserved = db.execute(_held_units(product.id)).scalar()
+    product.stock = sum(slot.stock for slot in slots) + product.reserved
+    for slot in slots:
+        db.delete(slot)
+    product.stock_slots = 0
+
+
+def reconcile_slotted_stock(
+    db: Session, product_ids: Optional[List[int]] = None
+) -> List[dict]:
+    """
+    Refresh Product.stock / Product.reserved of slotted products.
+
+    A single UPDATE, so slot totals and held units come from one snapshot.
+    Returns the levels that changed; an empty list if another worker is
+    reconciling right now.
+    """
+    if not db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _RECONCILE_LOCK_KEY}
+    ).scalar():
+        db.rollback()
+        return []
+
+    available = (
+        select(func.coalesce(func.sum(ProductStockSlot.stock), 0))
+        .where(ProductStockSlot.product_id == Product.id)
+        .scalar_subquery()
+    )
+    held = _held_units(Product.id).scalar_subquery()
+
+    stmt = (
+        update(Product)
+        .where(
+            Product.stock_slots > 0,
+            or_(Product.reserved != held, Product.stock != available + held),
+        )
+        .values(reserved=held, stock=available + held)
+        .returning(Product.id, Product.stock, Product.reserved)
+    )
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+
+    levels = [
+        {"id": row.id, "stock": row.stock, "reserved": row.reserved}
+        for row in db.execute(stmt, execution_options={"synchronize_session": False})
+    ]
+    if levels:
+        # One rolled-up event per pass instead of one per decrement
+        enqueue_event(
+            db,
+            exchange="product_events",
+            event_type="product_stock_bulk_adjusted",
+            data={"items": levels},
+        )
+    db.commit()
+    return levels
+
+
+class StockReconciler:
+    """Background thread that keeps slotted products' totals fresh"""
+
+    def __init__(self, interval: float = STOCK_RECONCILE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="stock-reconciler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def reconcile(self) -> List[dict]:
+        db = SessionLocal()
+        try:
+            levels = reconcile_slotted_stock(db)
+        finally:
+            db.close()
+
+        for level in levels:
+            listing_cache.invalidate("product_stock_adjusted", level)
+        return levels
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"Stock reconcile failed: {e}")
+
+
+def _lock_slots(db: Session, product_id: int) -> List[ProductStockSlot]:
+    return (
+        db.query(ProductStockSlot)
+        .filter(ProductStockSlot.product_id == product_id)
+        .order_by(ProductStockSlot.slot)
+        .with_for_update()
+        .all()
+    )
+
+
+def _held_units(product_id):
+    # Units of live holds; they are out of the slots but still in stock
+    return (
+        select(func.coalesce(func.sum(StockReservationItem.quantity), 0))
+        .join(StockReservation, StockReservation.id == StockReservationItem.reservation_id)
+        .where(
+            StockReservationItem.product_id == product_id,
+            StockReservation.status == "held",
+        )
+    )
@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional
+
+
+class CacheBackend:
+    """
+    Storage interface for read-through caches.
+
+    Keys are strings and values are JSON-compatible, so a shared backend
+    (Redis, Memcached, ...) can implement this by serializing values.
+    A missing, expired or evicted key simply returns None from get().
+
+    Counters (incr / get_counters) are kept apart from the cached values:
+    they never expire and are not evicted for space (in Redis: INCR / MGET,
+    with a volatile-* eviction policy so only keys with a TTL are evicted).
+    A counter that was never incremented reads 0 (LocalLRUCache: the same
+    value until it is).
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[str]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically add 1 to a counter and return the new value"""
+        raise NotImplementedError
+
+    def get_counters(self, keys: Iterable[str]) -> List[int]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LocalLRUCache(CacheBackend):
+    """
+    In-process cache with LRU eviction and a per-entry TTL.
+
+    Values are stored by reference, so callers must not mutate them.
+    Each process has its own: with several workers, one only sees another's
+    invalidations once its entries expire (use RedisCache there).
+
+    Counters are kept up to max_counters. Past that they all start over at a
+    new epoch, above any value one has had, so no counter reads a value an
+    entry recorded before; the entries, all made stale by that, are dropped.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_counters: int = 100_000):
+        self._max_entries = max_entries
+        self._max_counters = max_counters
+        self._entries = OrderedDict()  # key -> (expires_at, value), LRU first
+        self._counters = {}  # key -> int, not evicted for space
+        self._epoch = 0  # what a counter not in _counters reads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        # Counters stay: an entry cached again must not see an old count
+        with self._lock:
+            self._entries.clear()
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            if key not in self._counters and len(self._counters) >= self._max_counters:
+                self._epoch = max([self._epoch, *self._counters.values()]) + 1
+                self._counters.clear()
+                self._entries.clear()
+            value = self._counters[key] = self._counters.get(key, self._epoch) + 1
+            return value
+
+    def get_counters(self, keys: Iterable[str]) -> List[int]:
+        with self._lock:
+            return [self._counters.get(key, self._epoch) for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "counters": len(self._counters),
+            }
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by every worker (and replica) pointed at one Redis, so an
+    invalidation in one is seen by all at once.
+
+    Values are stored as JSON with a TTL; counters are plain keys without one
+    (INCR / MGET). Run Redis with a volatile-* maxmemory-policy, so that only
+    values are evicted for space. Needs the redis package.
+    """
+
+    def __init__(self, url: str, prefix: str = "product_service:"):
+        import redis  # only needed when this backend is configured
+
+        self._redis = redis.Redis.from_url(url)
+        self._values = prefix + "value:"
+        self._counters = prefix + "counter:"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._redis.get(self._values + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float):
+        raw = json.dumps(value, separators=(",", ":"))
+        self._redis.set(self._values + key, raw, px=max(1, int(ttl * 1000)))
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = [self._values + key for key in keys]
+        if keys:
+            self._redis.delete(*keys)
+
+    def clear(self):
+        # Counters stay, as in LocalLRUCache
+        keys = []
+        for key in self._redis.scan_iter(match=self._values + "*", count=1000):
+            keys.append(key)
+            if len(keys) == 1000:
+                self._redis.delete(*keys)
+                keys = []
+        if keys:
+            self._redis.delete(*keys)
+
+    def incr(self, key: str) -> int:
+        return self._redis.incr(self._counters + key)
+
+    def get_counters(self, keys: Iterable[str]) -> List[int]:
+        keys = [self._counters + key for key in keys]
+        if not keys:
+            return []
+        return [int(value or 0) for value in self._redis.mget(keys)]
@@ -1,6 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Table
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    Integer,
+    String,
+    Float,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Table,
+    text,
+)
 from sqlalchemy.orm import relationship
 from app.infrastructure.database import Base
+from datetime import datetime
 
 # Many-to-many association table for products and tags
 product_tags = Table(
@@ -12,31 +26,61 @@ product_tags = Table(
 
 
 class Category(Base):
-    __table_name__ = "categories"
+    __tablename__ = "categories"
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
 
 
 class Tag(Base):
-    __table_name__ = "tags"
+    __tablename__ = "tags"
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
 
+    products = relationship("Product", secondary="product_tags", back_populates="tags")
+
 
 class Product(Base):
-    __table__name = "products"
+    __tablename__ = "products"
+    __table_args__ = (
+        # Keyset pagination: WHERE (sort_key, id) > (...) ORDER BY sort_key, id
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_price_id", "price", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     description = Column(String, nullable=True)
     price = Column(Float, nullable=False)
     stock = Column(Integer, nullable=False, default=0)  # New field
-
-    category_id = Column(Integer, ForeignKey("categories.id", nullable=True))
+    reserved = Column(
+        Integer, nullable=False, default=0
+    )  # units held by live reservations; available = stock - reserved
+    stock_slots = Column(
+        Integer, nullable=False, default=0
+    )  # >0: hot-SKU mode, available units live in ProductStockSlot rows
+
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     category = relationship("Category")
 
     tags = relationship("Tag", secondary="product_tags", back_populates="products")
 
+    promotions = relationship("Promotion", back_populates="product")
+
+
+class ProductStockSlot(Base):
+    """
+    One of the N counters a hot product's available stock is split into.
+
+    Decrements lock a single random slot instead of the product row, so
+    concurrent buyers of the same SKU rarely wait on each other.
+    Product.stock / Product.reserved are reconciled from these rows.
+    """
+
+    __tablename__ = "product_stock_slots"
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False, default=0)
+
 
 """✅ Notes:
 
@@ -58,7 +102,7 @@ Backrefs allow easy reverse lookup
 
 
 class User(Base):
-    __table__name = "users"
+    __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, nullable=False)
@@ -99,7 +143,7 @@ class Promotion(Base):
     active allows enabling/disabling promotions
     """
 
-    __table_name__ = "promotions"
+    __tablename__ = "promotions"
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     discount_type = Column(String, nullable=False)  # "Fixed" or "Percentage"
@@ -112,3 +156,59 @@ class Promotion(Base):
 
     # Relationship back to Parent (Product)
     product = relationship("Product", back_populates="promotions")
+
+
+class StockReservation(Base):
+    """
+    A time-bounded hold on stock for one cart
+
+    held → confirmed (checkout) → released (refund/cancel)
+    held → released (cancel) or expired (TTL passed, released by the sweeper)
+    """
+
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # The sweeper only ever scans live holds by expiry
+        Index(
+            "ix_stock_reservations_held_expires_at",
+            "expires_at",
+            postgresql_where=text("status = 'held'"),
+        ),
+    )
+
+    id = Column(String(36), primary_key=True)  # uuid4
+    status = Column(String, nullable=False, default="held")
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    items = relationship("StockReservationItem", back_populates="reservation")
+
+
+class StockReservationItem(Base):
+    __tablename__ = "stock_reservation_items"
+    id = Column(Integer, primary_key=True)
+    reservation_id = Column(
+        String(36), ForeignKey("stock_reservations.id"), nullable=False, index=True
+    )
+    product_id = Column(
+        Integer, ForeignKey("products.id"), nullable=False, index=True
+    )  # indexed: held units per slotted product are summed on reconcile
+    quantity = Column(Integer, nullable=False)
+
+    reservation = relationship("StockReservation", back_populates="items")
+
+
+class OutboxEvent(Base):
+    """
+    Domain event written in the same transaction as the change it describes.
+
+    The outbox relay (infrastructure/outbox.py) publishes rows in id order
+    and deletes them once the broker has confirmed them.
+    """
+
+    __tablename__ = "outbox_events"
+    id = Column(BigInteger, primary_key=True)  # also the event_id consumers see
+    exchange = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
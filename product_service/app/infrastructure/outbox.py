@@ -0,0 +1,383 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.infrastructure.database import SessionLocal, engine
+from app.infrastructure.event_publisher import get_publisher
+from app.infrastructure.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_MAX_IN_FLIGHT = int(os.getenv("OUTBOX_MAX_IN_FLIGHT", 5000))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))
+# Ids are taken at insert but become visible at commit, so a slow transaction
+# can commit a lower id after higher ones were sent. An id the relay read past
+# is looked up again until every transaction that could have taken it has
+# ended, and for at least this many seconds (see OutboxRelay._gap_rows)
+OUTBOX_GAP_WAIT = float(os.getenv("OUTBOX_GAP_WAIT", 30.0))
+
+# pg advisory lock id; the worker holding it is the only relay of this database
+OUTBOX_LOCK_KEY = 0x0B7B0C5
+
+
+def enqueue_event(db: Session, exchange: str, event_type: str, data: dict):
+    """
+    Record an event in the caller's transaction.
+
+    It is published only if, and after, the transaction commits; the commit
+    wakes the relay, so the request itself never waits on the broker.
+    """
+    db.add(OutboxEvent(exchange=exchange, event_type=event_type, payload=data))
+    db.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay_after_commit(session):
+    if session.info.pop("outbox_pending", False):
+        get_relay().wake()
+
+
+class RelayStats:
+    """Thread-safe throughput / lag counters for the relay."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.handed_off = 0
+        self.relayed = 0
+        self.passes = 0
+        self.lag_seconds = 0.0  # age of the oldest unpublished event
+
+    def incr(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def set_lag(self, lag_seconds: float):
+        with self._lock:
+            self.lag_seconds = lag_seconds
+
+    def snapshot(self, in_flight: int = 0, leader: bool = False) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                "leader": leader,
+                "handed_off": self.handed_off,
+                "relayed": self.relayed,
+                "relayed_per_second": self.relayed / uptime,
+                "passes": self.passes,
+                "in_flight": in_flight,
+                "lag_seconds": self.lag_seconds,
+            }
+
+
+class OutboxRelay:
+    """
+    Drains outbox_events into RabbitMQ with ordered, at-least-once delivery.
+
+    - one relay per database: the worker holding the advisory lock relays,
+      the others stand by
+    - rows are handed to the publisher in id order, so per exchange they
+      reach the broker in commit order for any one entity (its writes are
+      serialized by row locks, so its events get increasing ids)
+    - each pass reads on from the last id handed off (an index seek, not a
+      scan of what is still in flight); ids it read past that were not
+      committed yet are looked up again until they commit, or until every
+      transaction that could hold them has ended (they were rolled back)
+    - a row is deleted only after the broker confirmed it; anything
+      unconfirmed when a worker dies is sent again by the next relay
+    - at most `max_in_flight` events are outstanding, so a broker outage
+      backs up in the table instead of in memory
+    """
+
+    def __init__(
+        self,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        max_in_flight: int = OUTBOX_MAX_IN_FLIGHT,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        gap_wait: float = OUTBOX_GAP_WAIT,
+    ):
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.gap_wait = gap_wait
+
+        self._lock = threading.Lock()
+        self._in_flight = set()  # ids handed to the publisher, not yet confirmed
+        self._confirmed = []  # ids confirmed by the broker, not yet deleted
+        self._last_handed_off = None  # None: start again from the head
+        # id read past but not committed yet -> (txid all transactions that
+        # could have taken it are below, monotonic time it may be dropped at)
+        self._gaps = {}
+        self._leader_connection = None
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.stats = RelayStats()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="outbox-relay", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return self.stats.snapshot(
+            in_flight=in_flight, leader=self._leader_connection is not None
+        )
+
+    def relay_once(self) -> bool:
+        """
+        Delete confirmed rows, then hand the next batch to the publisher.
+        Returns True when a full batch went out and more may be waiting.
+        """
+        if not self._acquire_leadership():
+            return False
+
+        db = SessionLocal()
+        try:
+            self._delete_confirmed(db)
+
+            with self._lock:
+                in_flight = len(self._in_flight)
+            room = min(self.batch_size, self.max_in_flight - in_flight)
+
+            head = db.query(OutboxEvent.created_at).order_by(OutboxEvent.id).first()
+            self.stats.incr("passes")
+            self.stats.set_lag(
+                (datetime.utcnow() - head.created_at).total_seconds() if head else 0.0
+            )
+            if room <= 0:
+                db.commit()
+                return False  # confirms wake us up
+
+            batch = self._gap_rows(db, room) + self._next_rows(db, room)
+            # Any transaction that took an id the rows skip had it before
+            # they were read, so its txid is below this
+            next_txid = db.execute(
+                text("SELECT txid_snapshot_xmax(txid_current_snapshot())")
+            ).scalar()
+            db.commit()
+            batch = batch[:room]
+
+            publisher = get_publisher()
+            handed_off = 0
+            for row in batch:
+                with self._lock:
+                    self._in_flight.add(row.id)
+                if not publisher.publish(
+                    row.exchange,
+                    row.event_type,
+                    row.payload,
+                    event_id=row.id,
+                    on_confirm=partial(self._on_confirm, row.id),
+                ):
+                    # Publisher buffer is full; retry from this row next pass
+                    with self._lock:
+                        self._in_flight.discard(row.id)
+                    break
+                handed_off += 1
+                self._handed_off(row.id, next_txid)
+
+            self.stats.incr("handed_off", handed_off)
+            return handed_off == room
+        finally:
+            db.close()
+
+    def _gap_rows(self, db: Session, room: int):
+        """
+        Rows committed since under an id the relay had already read past.
+
+        An id still missing once the oldest running transaction is newer
+        than every one that could have taken it was rolled back, and is
+        dropped. The transactions are checked before the rows are read, so
+        one committing in between is seen by the read.
+        """
+        if not self._gaps:
+            return []
+        oldest_running = db.execute(
+            text("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        ).scalar()
+        rows = (
+            db.query(OutboxEvent)
+            .filter(OutboxEvent.id.in_(list(self._gaps)))
+            .order_by(OutboxEvent.id)
+            .limit(room)
+            .all()
+        )
+        if len(rows) < room:
+            found = {row.id for row in rows}
+            now = time.monotonic()
+            self._gaps = {
+                event_id: (txid, not_before)
+                for event_id, (txid, not_before) in self._gaps.items()
+                if event_id in found or oldest_running < txid or now < not_before
+            }
+        return rows
+
+    def _next_rows(self, db: Session, room: int):
+        """The next rows after the last one handed off"""
+        query = db.query(OutboxEvent).order_by(OutboxEvent.id)
+        if self._last_handed_off is not None:
+            return query.filter(OutboxEvent.id > self._last_handed_off).limit(room).all()
+
+        # From the head, after a (re)start: skip what a previous leadership
+        # of this worker had sent and the broker confirmed, not yet deleted
+        with self._lock:
+            skip = self._in_flight.union(self._confirmed)
+        rows = query.limit(room + len(skip)).all()
+        return [row for row in rows if row.id not in skip]
+
+    def _handed_off(self, event_id: int, next_txid: int):
+        if event_id in self._gaps:
+            del self._gaps[event_id]
+            return
+        if self._last_handed_off is not None and event_id > self._last_handed_off + 1:
+            gap = (next_txid, time.monotonic() + self.gap_wait)
+            for missing in range(self._last_handed_off + 1, event_id):
+                self._gaps[missing] = gap
+        if self._last_handed_off is None or event_id > self._last_handed_off:
+            self._last_handed_off = event_id
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                more = self.relay_once()
+            except Exception as e:
+                logger.error(f"Outbox relay pass failed: {e}")
+                self._release_leadership()
+                more = False
+
+            if not more:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+        try:
+            db = SessionLocal()
+            try:
+                self._delete_confirmed(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Outbox relay could not delete confirmed events: {e}")
+        self._release_leadership()
+
+    def _on_confirm(self, event_id: int):
+        # Runs on the publisher's IO thread
+        with self._lock:
+            self._in_flight.discard(event_id)
+            self._confirmed.append(event_id)
+        self.stats.incr("relayed")
+        self._wake.set()
+
+    def _delete_confirmed(self, db: Session):
+        with self._lock:
+            confirmed, self._confirmed = self._confirmed, []
+        if not confirmed:
+            return
+        try:
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_(confirmed)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._confirmed.extend(confirmed)
+            raise
+
+    def _acquire_leadership(self) -> bool:
+        if self._leader_connection is not None:
+            try:
+                # The lock lives as long as this connection does
+                self._leader_connection.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                logger.warning("Outbox relay lost its database connection")
+                self._release_leadership()
+
+        connection = engine.connect()
+        try:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": OUTBOX_LOCK_KEY}
+            ).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+
+        logger.info("Outbox relay acquired leadership")
+        self._leader_connection = connection
+        return True
+
+    def _release_leadership(self):
+        connection, self._leader_connection = self._leader_connection, None
+        with self._lock:
+            # Whatever is still unconfirmed is sent again by the next leader
+            self._in_flight.clear()
+        self._last_handed_off = None
+        self._gaps = {}
+        if connection is not None:
+            try:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": OUTBOX_LOCK_KEY}
+                )
+                connection.commit()
+            except Exception:
+                pass
+            connection.close()
+
+
+_relay = None
+_relay_pid = None
+_relay_lock = threading.Lock()
+
+
+def get_relay() -> OutboxRelay:
+    """Return the relay for the current process, creating it on first use."""
+    global _relay, _relay_pid
+
+    pid = os.getpid()
+    if _relay is not None and _relay_pid == pid:
+        return _relay
+
+    with _relay_lock:
+        # A forked worker must not share its parent's thread or lock connection
+        if _relay is None or _relay_pid != pid:
+            _relay = OutboxRelay()
+            _relay_pid = pid
+            atexit.register(_relay.stop)
+        return _relay
+
+
+def get_outbox_stats() -> dict:
+    return get_relay().get_stats()
@@ -1,12 +1,36 @@
 from fastapi import FastAPI
 from app.api.v1.products import router as products_router
+from app.api.v1.reservations import router as reservations_router
 from app.core.logging import configure_logging
+from app.domain.reservation_service import ReservationSweeper
+from app.domain.stock_shards import StockReconciler
+from app.infrastructure.outbox import get_relay
 
 
 def create_app() -> FastAPI:
     configure_logging()
     app = FastAPI(title="Product Service", version="1.0.0")
+    app.include_router(
+        reservations_router,
+        prefix="/api/v1/products/stock/reservations",
+        tags=["reservations"],
+    )
     app.include_router(products_router, prefix="/api/v1/products", tags=["products"])
+
+    # Expires stale stock reservations in the background
+    sweeper = ReservationSweeper()
+    app.add_event_handler("startup", sweeper.start)
+    app.add_event_handler("shutdown", sweeper.stop)
+
+    # Refreshes the stock totals of products in hot-SKU mode
+    reconciler = StockReconciler()
+    app.add_event_handler("startup", reconciler.start)
+    app.add_event_handler("shutdown", reconciler.stop)
+
+    # Publishes outbox events, including any left over from a previous run
+    relay = get_relay()
+    app.add_event_handler("startup", relay.start)
+    app.add_event_handler("shutdown", relay.stop)
     return app
 
 
@@ -40,10 +40,29 @@ class ProductResponse(BaseModel):
     name: str
     description: Optional[str]
     price: float
+    stock: int = 0
+    reserved_stock: int = 0  # held by unexpired reservations
+    available_stock: int = 0  # stock - reserved_stock
+    stock_slots: int = 0  # >0: hot-SKU mode, see domain/stock_shards.py
     category: Optional[CategoryResponse]
     tags: List[TagResponse] = []
 
 
+class ProductPromotionResponse(BaseModel):
+    id: int
+    name: str
+    discount_type: str
+    discount_value: float
+
+
+class ProductDetailResponse(ProductResponse):
+    promotions: List[ProductPromotionResponse] = []  # active promotions only
+
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+
 # tag_ids & category_id are sent by clients
 
 # tags & category are returned in responses
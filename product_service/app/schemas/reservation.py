@@ -0,0 +1,24 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.core.config import RESERVATION_MAX_TTL_SECONDS
+
+
+class ReservationItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+
+class ReservationCreate(BaseModel):
+    items: List[ReservationItem] = Field(..., min_length=1)
+    ttl_seconds: Optional[int] = Field(
+        None, gt=0, le=RESERVATION_MAX_TTL_SECONDS
+    )  # defaults to RESERVATION_TTL_SECONDS
+
+
+class ReservationResponse(BaseModel):
+    id: str
+    status: str  # held, confirmed, released, expired
+    expires_at: datetime
+    items: List[ReservationItem]
@@ -0,0 +1,132 @@
+"""
+Contention benchmark: single stock row vs hot-SKU stock slots.
+
+Concurrent writers decrement one product's stock through adjust_stock(),
+first with the plain products row, then with the stock split over N slots,
+and the throughput and latency of both runs are printed side by side.
+
+Needs the product database (PRODUCT_DB_* env vars) with the schema created.
+Run from product_service/:
+
+    python -m benchmarks.stock_contention --writers 32 --ops 200 --slots 16
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.product_service import adjust_stock, set_stock_slots
+from app.domain.stock_shards import reconcile_slotted_stock
+from app.infrastructure.database import DATABASE_URL
+from app.infrastructure.models import Product, ProductStockSlot
+
+
+def run(Session, product_id: int, writers: int, ops: int) -> dict:
+    latencies = [[] for _ in range(writers)]
+    errors = [0] * writers
+    start = threading.Barrier(writers + 1)
+
+    def writer(index: int):
+        db = Session()
+        try:
+            start.wait()
+            for _ in range(ops):
+                began = time.perf_counter()
+                try:
+                    adjust_stock(product_id, -1, db)
+                except Exception:
+                    db.rollback()
+                    errors[index] += 1
+                latencies[index].append(time.perf_counter() - began)
+        finally:
+            db.close()
+
+    threads = [
+        threading.Thread(target=writer, args=(index,)) for index in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    samples = sorted(latency for per_writer in latencies for latency in per_writer)
+    return {
+        "ops": len(samples),
+        "errors": sum(errors),
+        "ops_per_sec": len(samples) / elapsed,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000,
+    }
+
+
+def stock_of(Session, product_id: int) -> int:
+    db = Session()
+    try:
+        reconcile_slotted_stock(db, [product_id])
+        return db.get(Product, product_id).stock
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=200, help="decrements per writer")
+    parser.add_argument("--slots", type=int, default=16)
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL, pool_size=args.writers + 2)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    initial = args.writers * args.ops * 2  # never runs out in either mode
+
+    db = Session()
+    product = Product(
+        name=f"bench-hot-sku-{uuid.uuid4()}", price=1.0, stock=initial, reserved=0
+    )
+    db.add(product)
+    db.commit()
+    product_id = product.id
+    db.close()
+
+    try:
+        results = {"single row": run(Session, product_id, args.writers, args.ops)}
+        expected = initial - results["single row"]["ops"]
+
+        db = Session()
+        set_stock_slots(product_id, args.slots, db)
+        db.close()
+        results[f"{args.slots} slots"] = run(Session, product_id, args.writers, args.ops)
+        expected -= results[f"{args.slots} slots"]["ops"]
+
+        print(f"{args.writers} writers x {args.ops} decrements on one product\n")
+        print(f"{'mode':<12}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for mode, result in results.items():
+            print(
+                f"{mode:<12}{result['ops_per_sec']:>10.0f}{result['p50_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['errors']:>8}"
+            )
+
+        final = stock_of(Session, product_id)
+        errors = sum(result["errors"] for result in results.values())
+        print(f"\nfinal stock {final}, expected {expected + errors}")
+    finally:
+        db = Session()
+        db.query(ProductStockSlot).filter(
+            ProductStockSlot.product_id == product_id
+        ).delete()
+        db.query(Product).filter(Product.id == product_id).delete()
+        db.commit()
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
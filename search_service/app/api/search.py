@@ -1,12 +1,29 @@
-from fastapi import APIRouter, Query
-from app.services.indexing_service import search_products
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.api.dependencies import admin_required
+from app.core.config import (
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+    SEARCH_MAX_OFFSET,
+    SUGGEST_DEFAULT_LIMIT,
+    SUGGEST_MAX_LIMIT,
+)
+from app.services import indexing_service
+from app.services.index_persistence import get_persistence
+from app.services.reindex import get_reindexer
+from app.services.shards import ShardedSearch
 from typing import List, Dict
 
 
 router = APIRouter()
 
 
-@router.get("/search", response_model=List[Dict])
+def _engine():
+    """What queries go to: the shard processes, or this process's index"""
+    persistence = get_persistence()
+    return persistence if isinstance(persistence, ShardedSearch) else indexing_service
+
+
+@router.get("/search", response_model=Dict)
 def search(
     query: str = Query(
         "", min_length=1, description="Search query for products and promotions"
@@ -16,16 +33,73 @@ def search(
     min_price: float = Query(None, description="Optional minimum price filter"),
     max_price: float = Query(None, description="Optional maximum price filter"),
     in_stock: bool = Query(False, description="Optional stock availability filter"),
+    limit: int = Query(
+        SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT, description="Page size"
+    ),
+    offset: int = Query(
+        0, ge=0, le=SEARCH_MAX_OFFSET, description="Number of ranked results to skip"
+    ),
+    sort: str = Query(
+        "relevance",
+        pattern="^(relevance|price_asc|price_desc)$",
+        description="Result order",
+    ),
 ):
-    results = search_products(
+    page = _engine().search_products(
         query,
         category_id=category_id,
         tag_id=tag_id,
         min_price=min_price,
         max_price=max_price,
-        in_stock=in_stock,
+        in_stock_only=in_stock,
+        limit=limit,
+        offset=offset,
+        sort=sort,
     )
-    return {"results": results}
+    return {
+        "total": page["total"],
+        "limit": limit,
+        "offset": offset,
+        "sort": sort,
+        "facets": page["facets"],
+        "results": page["results"],
+    }
+
+
+@router.get("/search/suggest", response_model=Dict)
+def suggest_endpoint(
+    q: str = Query(..., min_length=1, description="What the user has typed so far"),
+    limit: int = Query(SUGGEST_DEFAULT_LIMIT, ge=1, le=SUGGEST_MAX_LIMIT),
+):
+    """Search-as-you-type completions, for every keystroke of the search box"""
+    return {"query": q, "suggestions": _engine().suggest(q, limit)}
+
+
+@router.get("/search/stats", response_model=Dict)
+def search_stats():
+    """Result cache size and hit / miss / stale / eviction counts"""
+    return {"cache": _engine().cache_stats()}
+
+
+@router.post("/search/reindex", status_code=202)
+def start_reindex(user=Depends(admin_required)):
+    """Rebuild the index from product_service's export, in the background
+
+    The current index keeps serving (and following events) until the new one
+    is complete and swapped in. 409 if a rebuild is already running. Admins
+    only.
+    """
+    reindexer = get_reindexer()
+    if not reindexer.start():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="A reindex is already running"
+        )
+    return reindexer.status
+
+
+@router.get("/search/reindex", response_model=Dict)
+def reindex_status():
+    return get_reindexer().status
 
 
 """
@@ -33,6 +107,10 @@ Front-end or Product API can call this endpoint
 
 Supports filtered, full-text search
 
+Results are ranked with BM25 (name matches weigh more than tags, tags more than
+description) and paged with limit/offset; offset is capped so a page never
+needs more than SEARCH_MAX_OFFSET + SEARCH_MAX_LIMIT results to be sorted
+
 This code defines a search endpoint for the search and indexing service in an e-commerce microservices platform.
 The endpoint accepts various query parameters for searching products and promotions, and returns a list of matching results
 
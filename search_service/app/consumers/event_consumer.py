@@ -1,16 +1,32 @@
 """
-- Updates the index in real-time
+- Updates the index (and the /search/suggest completions) in real-time
 - Reacts to both product and promotion events
 
     - product_created
     - product_updated
-    - product_stock_updated
     - product_deleted
+    - product_stock_adjusted / product_stock_bulk_adjusted (stock levels
+      only, patched onto the indexed product)
     - promotion_created
     - promotion_updated
-    - promotion_deleted
+    - promotion_deleted (patched onto the product's promotions)
 
-- Uses RabbitMQ for event-driven communication
+- Uses RabbitMQ for event-driven communication; each exchange has a durable
+  queue per instance (SEARCH_INSTANCE_ID), and an event is acked only once it is journaled and applied, so a
+  restart replays what it missed (see services/index_persistence.py)
+- The broker keeps up to SEARCH_PREFETCH_COUNT unacked events in flight, so
+  a burst fills whole batches instead of arriving one round trip at a time
+- Events are applied in micro-batches (SEARCH_BATCH_SIZE events or
+  SEARCH_BATCH_INTERVAL seconds), with repeated updates of one product
+  coalesced into one write, and published to readers as a new index
+  version, never a half-applied one. Then the whole batch is acked at once
+- A message that is not a JSON event is logged and nacked without requeue,
+  so a dead-letter policy on the queue keeps it for inspection instead of
+  it being redelivered forever. An event that cannot be applied is logged
+  and skipped when its batch is (see IndexPersistence._flush)
+- On any other error the connection is closed, so the broker redelivers
+  the unacked events, and the consumer reconnects after
+  SEARCH_RECONNECT_DELAY seconds, doubled per failed attempt
 - Ensures the search index is always up-to-date with the latest product and promotion information
 
 # This code defines a consumer for a search and indexing service in an e-commerce microservices platform.
@@ -18,48 +34,98 @@
 
 """
 
-import pika, json
-from app.services.indexing_service import add_or_update_product, remove_product, INDEX
-from app.core.config import RABBITMQ_URL
+import json
+import logging
+import time
 
-EXCHANGES = ["products", "promotions"]
+import pika
+from app.services.index_persistence import get_persistence
+from app.core.config import (
+    RABBITMQ_URL,
+    SEARCH_BATCH_INTERVAL,
+    SEARCH_INSTANCE_ID,
+    SEARCH_PREFETCH_COUNT,
+    SEARCH_QUEUE_PREFIX,
+    SEARCH_RECONNECT_DELAY,
+    SEARCH_RECONNECT_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+EXCHANGES = ["product_events", "promotions"]
 
 
 def start_consumer():
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
+    """Consume events for as long as the process runs, reconnecting on errors"""
+    backoff = {"delay": SEARCH_RECONNECT_DELAY}
+
+    def connected():
+        backoff["delay"] = SEARCH_RECONNECT_DELAY
+
+    while True:
+        connection = None
+        try:
+            connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+            _consume(connection, on_connected=connected)
+        except Exception:
+            logger.exception(f"Search consumer failed, reconnecting in {backoff['delay']:.0f}s")
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()  # the broker requeues what was not acked
+            except Exception:
+                pass
+        time.sleep(backoff["delay"])
+        backoff["delay"] = min(backoff["delay"] * 2, SEARCH_RECONNECT_MAX_DELAY)
+
+
+def _consume(connection, on_connected=None):
+    """Consume on `connection` until it fails"""
     channel = connection.channel()
+    channel.basic_qos(prefetch_count=SEARCH_PREFETCH_COUNT)
+    persistence = get_persistence()
+    # Delivery tag of the last event recorded and not acked yet. Both queues
+    # are consumed on one channel, so one ack with multiple=True covers
+    # every event delivered up to it
+    unacked = {"tag": None}
 
-    for exchange in EXCHANGES:
+    def ack_if_applied():
+        if persistence.flush_if_due() and unacked["tag"] is not None:
+            channel.basic_ack(delivery_tag=unacked["tag"], multiple=True)
+            unacked["tag"] = None
+
+    def consume(exchange: str):
+        def callback(
+            ch, method, properties, body
+        ):  # why ch, method, properties? - these are parameters required by the pika library for the callback function. They provide information about the channel, the method that triggered the callback, message properties, and the message body itself.
+            try:
+                event = json.loads(body)  # Parse the incoming event data as JSON.
+            except ValueError as e:
+                event, error = None, e
+            else:
+                error = None if isinstance(event, dict) else "not a JSON object"
+            if error is not None:
+                logger.error(
+                    f"Rejecting a malformed message from {exchange} ({error}): {body[:200]!r}"
+                )
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            persistence.record(event, exchange=exchange)
+            unacked["tag"] = method.delivery_tag
+            ack_if_applied()  # applies the batch once full
+
+        queue = ".".join(filter(None, (SEARCH_QUEUE_PREFIX, SEARCH_INSTANCE_ID, exchange)))
         channel.exchange_declare(exchange=exchange, exchange_type="fanout")
-        queue = channel.queue_declare(queue="", exclusive=True).method.queue
+        channel.queue_declare(queue=queue, durable=True)
         channel.queue_bind(exchange=exchange, queue=queue)
+        channel.basic_consume(queue=queue, on_message_callback=callback)
 
-    def callback(
-        ch, method, properties, body
-    ):  # why ch, method, properties? - these are parameters required by the pika library for the callback function. They provide information about the channel, the method that triggered the callback, message properties, and the message body itself.
-        event = json.loads(body)  # Parse the incoming event data as JSON.
-        event_type = event.get("event_type")
-        data = event.get("data")
-
-        if event_type in [
-            "product_created",
-            "product_updated",
-            "product_stock_updated",
-        ]:
-            add_or_update_product(data)
-        elif event_type == "product_deleted":
-            remove_product(data["id"])
-        elif event_type in [
-            "promotion_created",
-            "promotion_updated",
-            "promotion_deleted",
-        ]:
-            product_id = data.get("product_id")
-            if product_id and product_id in INDEX:
-                add_or_update_product(INDEX[product_id])  # update promotions
-        else:
-            print(f"[INDEX] Unknown event: {event_type}")
-
-    channel.basic_consume(queue=queue, on_message_callback=callback, auto_ack=True)
-    print("Search & Indexing service started. Listening for events...")
-    channel.start_consuming()
+    for exchange in EXCHANGES:
+        consume(exchange)
+    logger.info("Search & Indexing service started. Listening for events...")
+    if on_connected is not None:
+        on_connected()
+    # Not start_consuming(): a batch must also be published (and acked)
+    # when no more events come in to fill it
+    while True:
+        connection.process_data_events(time_limit=SEARCH_BATCH_INTERVAL)
+        ack_if_applied()
@@ -0,0 +1,28 @@
+import threading
+
+from fastapi import FastAPI
+from app.api.search import router as search_router
+from app.consumers.event_consumer import start_consumer
+from app.core.logging import configure_logging
+from app.services.index_persistence import get_persistence
+
+
+def create_app() -> FastAPI:
+    configure_logging()
+    app = FastAPI(title="Search Service", version="1.0.0")
+    app.include_router(search_router, prefix="/api/v1", tags=["search"])
+
+    # Load the last snapshot and replay the journal before serving, then
+    # follow live events
+    persistence = get_persistence()
+
+    def start():
+        persistence.warm_start()
+        threading.Thread(target=start_consumer, name="search-consumer", daemon=True).start()
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", persistence.close)
+    return app
+
+
+app = create_app()
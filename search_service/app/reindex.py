@@ -0,0 +1,45 @@
+"""
+Rebuild the index of a running search_service from product_service.
+
+    SEARCH_ADMIN_TOKEN=<admin JWT> python -m app.reindex --url http://localhost:8001/api/v1
+
+Starts the rebuild (POST /search/reindex, admins only) and waits for it to
+finish; the service keeps serving from its current index meanwhile.
+--url is search_service's API (port 8001 by default; product_service,
+which it reindexes from, is on 8000: see PRODUCT_SERVICE_URL).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8001/api/v1")
+    parser.add_argument(
+        "--token", default=os.getenv("SEARCH_ADMIN_TOKEN", ""), help="admin JWT"
+    )
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds")
+    args = parser.parse_args()
+
+    url = f"{args.url.rstrip('/')}/search/reindex"
+    response = requests.post(
+        url, headers={"Authorization": f"Bearer {args.token}"}, timeout=10
+    )
+    if response.status_code not in (202, 409):
+        response.raise_for_status()
+
+    while True:
+        status = requests.get(url, timeout=10).json()
+        print(f"{status['state']}: {status.get('products', 0)} products", flush=True)
+        if status["state"] != "running":
+            return 0 if status["state"] == "done" else 1
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
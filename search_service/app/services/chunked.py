@@ -0,0 +1,200 @@
+"""
+Copy-on-write containers for index versions that share most of their data.
+
+An index version is cloned for every batch of events (see SearchIndex.clone),
+and copying its per-product maps whole made each batch cost a pass over the
+catalog. These containers keep their items in many small chunks instead:
+
+- ChunkedDict spreads its keys over dicts by hash, doubling the number of
+  dicts as it grows so each holds about _DICT_CHUNK_SIZE keys
+- ChunkedList keeps its items in lists of _LIST_CHUNK_SIZE, by index
+
+copy() only copies the list of chunks, and a copy copies a chunk the first
+time it changes it, so a batch costs the chunks it touches. Like the values
+in SearchIndex._owned, chunks a container may change are tracked by id();
+None = all of them (built in place, not a copy). Nothing is changed through
+a copy in the container it was copied from.
+
+A version being built in place keeps plain dicts and lists, which are
+cheaper to fill; copy_on_write() turns them into these when it is cloned.
+They pickle as the plain dict / list (string hashes differ per process).
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+_DICT_CHUNK_SIZE = 128
+_LIST_CHUNK_SHIFT = 10
+_LIST_CHUNK_SIZE = 1 << _LIST_CHUNK_SHIFT
+_LIST_CHUNK_MASK = _LIST_CHUNK_SIZE - 1
+
+_MISSING = object()
+
+
+class ChunkedDict:
+    __slots__ = ("_chunks", "_mask", "_len", "_owned")
+
+    def __init__(self, items: Optional[Dict] = None):
+        items = items or {}
+        count = 1
+        while count * _DICT_CHUNK_SIZE < len(items):
+            count *= 2
+        self._chunks: List[Dict] = [{} for _ in range(count)]
+        self._mask = count - 1
+        self._len = len(items)
+        self._owned: Optional[set] = None
+        chunks, mask = self._chunks, self._mask
+        for key, value in items.items():
+            chunks[hash(key) & mask][key] = value
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key) -> bool:
+        return key in self._chunks[hash(key) & self._mask]
+
+    def __getitem__(self, key):
+        return self._chunks[hash(key) & self._mask][key]
+
+    def get(self, key, default=None):
+        return self._chunks[hash(key) & self._mask].get(key, default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        chunk = self._chunks[hash(key) & self._mask]
+        if self._owned is not None and id(chunk) not in self._owned:
+            chunk = self._chunk_to_change(key)
+        if key not in chunk:
+            self._len += 1
+        chunk[key] = value
+        if self._len > len(self._chunks) * _DICT_CHUNK_SIZE:
+            self._split()
+
+    def __delitem__(self, key):
+        del self._chunk_to_change(key)[key]
+        self._len -= 1
+
+    def pop(self, key, default=_MISSING):
+        if key not in self:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        self._len -= 1
+        return self._chunk_to_change(key).pop(key)
+
+    def __iter__(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def keys(self) -> Iterator:
+        return iter(self)
+
+    def values(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk.values()
+
+    def items(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk.items()
+
+    def copy(self) -> "ChunkedDict":
+        other = ChunkedDict.__new__(ChunkedDict)
+        other._chunks = list(self._chunks)
+        other._mask = self._mask
+        other._len = self._len
+        other._owned = set()
+        return other
+
+    def __reduce__(self):
+        return ChunkedDict, (dict(self.items()),)
+
+    def _chunk_to_change(self, key) -> Dict:
+        number = hash(key) & self._mask
+        chunk = self._chunks[number]
+        if self._owned is not None and id(chunk) not in self._owned:
+            chunk = self._chunks[number] = dict(chunk)
+            self._owned.add(id(chunk))
+        return chunk
+
+    def _split(self):
+        # Twice the chunks: each splits on the next bit of the hash
+        count = len(self._chunks)
+        low, high = [], []
+        for chunk in self._chunks:
+            low_chunk, high_chunk = {}, {}
+            for key, value in chunk.items():
+                (high_chunk if hash(key) & count else low_chunk)[key] = value
+            low.append(low_chunk)
+            high.append(high_chunk)
+        self._chunks = low + high
+        self._mask = 2 * count - 1
+        if self._owned is not None:
+            self._owned = {id(chunk) for chunk in self._chunks}
+
+
+class ChunkedList:
+    __slots__ = ("_chunks", "_len", "_owned")
+
+    def __init__(self, items: Iterable = ()):
+        items = list(items)
+        self._chunks: List[List] = [
+            items[start : start + _LIST_CHUNK_SIZE]
+            for start in range(0, len(items), _LIST_CHUNK_SIZE)
+        ]
+        self._len = len(items)
+        self._owned: Optional[set] = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return self._chunks[index >> _LIST_CHUNK_SHIFT][index & _LIST_CHUNK_MASK]
+
+    def __setitem__(self, index: int, value):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        self._chunk_to_change(index >> _LIST_CHUNK_SHIFT)[index & _LIST_CHUNK_MASK] = value
+
+    def append(self, value):
+        if not self._len & _LIST_CHUNK_MASK:
+            chunk = []
+            self._chunks.append(chunk)
+            if self._owned is not None:
+                self._owned.add(id(chunk))
+        self._chunk_to_change(len(self._chunks) - 1).append(value)
+        self._len += 1
+
+    def __iter__(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def copy(self) -> "ChunkedList":
+        other = ChunkedList.__new__(ChunkedList)
+        other._chunks = list(self._chunks)
+        other._len = self._len
+        other._owned = set()
+        return other
+
+    def __reduce__(self):
+        return ChunkedList, (list(self),)
+
+    def _chunk_to_change(self, number: int) -> List:
+        chunk = self._chunks[number]
+        if self._owned is not None and id(chunk) not in self._owned:
+            chunk = self._chunks[number] = list(chunk)
+            self._owned.add(id(chunk))
+        return chunk
+
+
+def copy_on_write(items: Union[Dict, List, ChunkedDict, ChunkedList]):
+    """A copy of `items` sharing its chunks with later copies (see above)"""
+    if isinstance(items, dict):
+        return ChunkedDict(items)
+    if isinstance(items, list):
+        return ChunkedList(items)
+    return items.copy()
@@ -0,0 +1,197 @@
+"""
+Column store of the numeric product fields, indexed by doc id.
+
+Each column is a NumPy array with one slot per doc id, so a price range,
+stock or category predicate over the whole catalog is a few vectorized
+comparisons instead of a dict lookup per product. Removed docs are
+tombstoned in the `live` mask; their slots are reused with the doc id.
+
+The arrays are kept in blocks of _BLOCK_ROWS doc ids, so that an index
+version can share them with the next one: copy() shares every block, and a
+block is copied the first time the copy changes it (see services/chunked.py).
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+_BLOCK_SHIFT = 13
+_BLOCK_ROWS = 1 << _BLOCK_SHIFT
+_BLOCK_MASK = _BLOCK_ROWS - 1
+_NO_CATEGORY = -1
+# name -> (dtype, value of an unset slot)
+_ARRAYS = {
+    "product_id": (np.int64, 0),
+    "price": (np.float64, np.nan),
+    "stock": (np.int64, 0),
+    "category": (np.int64, _NO_CATEGORY),
+    "live": (bool, False),  # False = tombstone
+}
+
+
+class Columns:
+    def __init__(self):
+        self._blocks: Dict[str, List[np.ndarray]] = {name: [] for name in _ARRAYS}
+        self._size = 0  # one past the highest doc id ever set
+        self._owned: Optional[set] = None  # see services/chunked.py
+
+    def set(self, doc_id: int, doc: Dict, names: Iterable[str] = _ARRAYS):
+        """Set the columns `names` (all by default) of a doc id from `doc`"""
+        category = doc.get("category")
+        category_id = category.get("id") if isinstance(category, dict) else None
+        price = doc.get("price")
+        values = {
+            "product_id": doc["id"],
+            "price": np.nan if price is None else price,
+            "stock": doc.get("stock") or 0,
+            "category": _NO_CATEGORY if category_id is None else category_id,
+            "live": True,
+        }
+        self.update(doc_id, **{name: values[name] for name in names})
+
+    def update(self, doc_id: int, **values):
+        """Set some of the columns of a doc id"""
+        number, row = doc_id >> _BLOCK_SHIFT, doc_id & _BLOCK_MASK
+        while len(self._blocks["live"]) <= number:
+            self._add_block()
+        for name, value in values.items():
+            self._block_to_change(name, number)[row] = value
+        self._size = max(self._size, doc_id + 1)
+
+    def delete(self, doc_id: int):
+        self.update(doc_id, live=False)
+
+    def copy(self) -> "Columns":
+        other = Columns.__new__(Columns)
+        other._blocks = {name: list(blocks) for name, blocks in self._blocks.items()}
+        other._size = self._size
+        other._owned = set()
+        return other
+
+    def save(self, directory: str):
+        """Write each column to `directory` as <name>.npy"""
+        for name, (dtype, _) in _ARRAYS.items():
+            out = np.lib.format.open_memmap(
+                os.path.join(directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=(self._size,)
+            )
+            for number, block in enumerate(self._blocks[name]):
+                start = number << _BLOCK_SHIFT
+                out[start : start + _BLOCK_ROWS] = block[: max(self._size - start, 0)]
+            out.flush()
+            del out
+
+    @classmethod
+    def load(cls, directory: str) -> "Columns":
+        """
+        Map the columns saved in `directory` instead of reading them: pages
+        load on first touch, and writes stay private to this process
+        """
+        columns = cls()
+        for name, (dtype, fill) in _ARRAYS.items():
+            mapped = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c")
+            blocks = columns._blocks[name]
+            for start in range(0, len(mapped), _BLOCK_ROWS):
+                block = mapped[start : start + _BLOCK_ROWS]
+                if len(block) < _BLOCK_ROWS:
+                    # The last block is read in, to have room to grow
+                    block = np.concatenate([block, np.full(_BLOCK_ROWS - len(block), fill, dtype)])
+                blocks.append(block)
+            columns._size = len(mapped)
+        return columns
+
+    def select(
+        self,
+        category_id: Optional[int] = None,
+        in_stock_only: bool = False,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> np.ndarray:
+        """Live doc ids matching every given predicate, in doc id order"""
+        found = []
+        for number, live in enumerate(self._blocks["live"]):
+            start = number << _BLOCK_SHIFT
+            rows = min(self._size - start, _BLOCK_ROWS)
+            if rows <= 0:
+                break
+            mask = live[:rows].copy()
+            if category_id is not None:
+                mask &= self._blocks["category"][number][:rows] == category_id
+            if in_stock_only:
+                mask &= self._blocks["stock"][number][:rows] > 0
+            mask &= self._price_mask(self._blocks["price"][number][:rows], min_price, max_price)
+            found.append(np.flatnonzero(mask) + start)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def in_price_range(
+        self,
+        doc_ids: Iterable[int],
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> np.ndarray:
+        """The doc ids of `doc_ids` priced within [min_price, max_price]"""
+        doc_ids = np.fromiter(doc_ids, dtype=np.int64)
+        return doc_ids[self._price_mask(self._gather("price", doc_ids), min_price, max_price)]
+
+    def top_by_price(
+        self, doc_ids: Iterable[int], k: int, descending: bool = False
+    ) -> np.ndarray:
+        """
+        The k cheapest (or dearest) of `doc_ids`, in order; ties go to the
+        lower doc id and unpriced docs come last. Partitions before sorting,
+        so only k prices are ever sorted.
+        """
+        doc_ids = np.fromiter(doc_ids, dtype=np.int64)
+        if k <= 0 or not len(doc_ids):
+            return doc_ids[:0]
+        prices = self._gather("price", doc_ids)
+        keys = np.where(np.isnan(prices), np.inf, -prices if descending else prices)
+        if k < len(doc_ids):
+            # Keep everything tied with the k-th key, so ties still break by id
+            kth = np.partition(keys, k - 1)[k - 1]
+            keep = keys <= kth
+            doc_ids, keys = doc_ids[keep], keys[keep]
+        order = np.lexsort((doc_ids, keys))[:k]
+        return doc_ids[order]
+
+    @staticmethod
+    def _price_mask(prices: np.ndarray, min_price, max_price) -> np.ndarray:
+        # Missing prices count as 0, as the dict filter always did
+        prices = np.nan_to_num(prices, nan=0.0)
+        mask = np.ones(len(prices), dtype=bool)
+        if min_price is not None:
+            mask &= prices >= min_price
+        if max_price is not None:
+            mask &= prices <= max_price
+        return mask
+
+    def _gather(self, name: str, doc_ids: np.ndarray) -> np.ndarray:
+        """The values of a column at `doc_ids`, in their order"""
+        blocks = self._blocks[name]
+        if len(blocks) == 1:
+            return blocks[0][doc_ids]
+        # Group the doc ids by block (a radix sort on 16-bit block numbers),
+        # then take each group from its block
+        numbers = (doc_ids >> _BLOCK_SHIFT).astype(np.int16 if len(blocks) < 2**15 else np.int64)
+        values = np.empty(len(doc_ids), dtype=_ARRAYS[name][0])
+        order = np.argsort(numbers, kind="stable")
+        bounds = np.searchsorted(numbers[order], np.arange(len(blocks) + 1))
+        for number, block in enumerate(blocks):
+            group = order[bounds[number] : bounds[number + 1]]
+            if len(group):
+                values[group] = block[doc_ids[group] & _BLOCK_MASK]
+        return values
+
+    def _block_to_change(self, name: str, number: int) -> np.ndarray:
+        block = self._blocks[name][number]
+        if self._owned is not None and id(block) not in self._owned:
+            block = self._blocks[name][number] = block.copy()
+            self._owned.add(id(block))
+        return block
+
+    def _add_block(self):
+        for name, (dtype, fill) in _ARRAYS.items():
+            block = np.full(_BLOCK_ROWS, fill, dtype=dtype)
+            self._blocks[name].append(block)
+            if self._owned is not None:
+                self._owned.add(id(block))
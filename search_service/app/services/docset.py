@@ -0,0 +1,136 @@
+"""
+Sets of dense doc ids for filters and facets (a small roaring-style set).
+
+A DocSet is a plain Python set while it is small, and switches to a
+bitmap (one bit per doc id) once it is dense: a tag on a handful of
+products costs a handful of entries, while "in stock" costs N/8 bytes
+instead of a set entry per product. Bitmaps intersect as Python ints, so
+an AND over a million docs is one C loop, and popcount is int.bit_count().
+"""
+
+from typing import Iterable, Iterator, List
+
+# Members at which a set becomes a bitmap, and at which it goes back
+DENSE_MIN = 4096
+SPARSE_MAX = DENSE_MIN // 4
+
+# Bit positions set in each byte value, for decoding bitmaps
+_BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)
+)
+
+
+class DocSet:
+    __slots__ = ("_members", "_bits", "_count", "_int")
+
+    def __init__(self, docs: Iterable[int] = ()):
+        self._members = set()
+        self._bits = None  # bytearray once dense; bit d = doc id d
+        self._count = 0
+        self._int = None  # cached int view of _bits
+        for doc in docs:
+            self.add(doc)
+
+    @property
+    def dense(self) -> bool:
+        return self._bits is not None
+
+    def __len__(self) -> int:
+        return self._count if self._bits is not None else len(self._members)
+
+    def __contains__(self, doc: int) -> bool:
+        if self._bits is None:
+            return doc in self._members
+        byte = doc >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (doc & 7) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        if self._bits is None:
+            return iter(self._members)
+        return iter(bits_to_docs(bytes(self._bits)))
+
+    def copy(self) -> "DocSet":
+        other = DocSet()
+        other._members = set(self._members)
+        other._bits = bytearray(self._bits) if self._bits is not None else None
+        other._count = self._count
+        other._int = self._int  # ints are immutable, the cache stays valid
+        return other
+
+    def add(self, doc: int):
+        if self._bits is None:
+            self._members.add(doc)
+            if len(self._members) >= DENSE_MIN:
+                self._to_bitmap()
+            return
+
+        byte, mask = doc >> 3, 1 << (doc & 7)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._count += 1
+            self._int = None
+
+    def discard(self, doc: int):
+        if self._bits is None:
+            self._members.discard(doc)
+            return
+
+        if doc in self:
+            self._bits[doc >> 3] &= ~(1 << (doc & 7)) & 0xFF
+            self._count -= 1
+            self._int = None
+            if self._count <= SPARSE_MAX:
+                self._members = set(self)
+                self._bits = None
+                self._count = 0
+
+    def to_int(self) -> int:
+        """The set as a bitmap int (bit d set for doc d)"""
+        if self._bits is None:
+            bits = bytearray(max(self._members, default=0) // 8 + 1)
+            for doc in self._members:
+                bits[doc >> 3] |= 1 << (doc & 7)
+            return int.from_bytes(bits, "little")
+        if self._int is None:
+            self._int = int.from_bytes(self._bits, "little")
+        return self._int
+
+    def _to_bitmap(self):
+        members, self._members = self._members, set()
+        self._bits = bytearray(max(members) // 8 + 1)
+        self._count = 0
+        for doc in members:
+            self.add(doc)
+
+
+def bits_to_docs(data: bytes) -> List[int]:
+    """Doc ids of the bits set in a little-endian bitmap"""
+    docs = []
+    for index, value in enumerate(data):
+        if value:
+            base = index << 3
+            docs.extend(base + bit for bit in _BYTE_BITS[value])
+    return docs
+
+
+def intersect_all(sets: List[DocSet]) -> List[int]:
+    """Doc ids present in every set"""
+    sets = sorted(sets, key=len)
+    smallest, rest = sets[0], sets[1:]
+    if not smallest.dense:
+        return [doc for doc in smallest if all(doc in other for other in rest)]
+
+    value = smallest.to_int()
+    for other in rest:
+        value &= other.to_int()
+    return bits_to_docs(value.to_bytes((value.bit_length() + 7) // 8, "little"))
+
+
+def count_common(a: DocSet, b: DocSet) -> int:
+    """|a ∩ b| without building the intersection"""
+    if a.dense and b.dense:
+        return (a.to_int() & b.to_int()).bit_count()
+    small, large = (a, b) if not a.dense and (b.dense or len(a) <= len(b)) else (b, a)
+    return sum(1 for doc in small if doc in large)
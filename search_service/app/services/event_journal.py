@@ -0,0 +1,89 @@
+"""
+Append-only log of the events consumed since the last snapshot.
+
+Every consumed event is written here, with its sequence number, before it
+is applied. The journal is synced before the events are acked upstream, so
+whatever a crash loses from its buffer was not acked and is redelivered.
+On startup the snapshot is loaded and only the entries after its sequence
+number are replayed.
+
+The journal is a directory of segments named by the first sequence number
+they hold. A snapshot seals the open segment (rotate()) and, once written,
+deletes the segments it covers, while new events go to a new segment.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".ndjson"
+
+
+class EventJournal:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file = None
+
+    def append(self, seq: int, event: Dict):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # "w": a segment with this name can only hold a torn first entry
+            self._file = open(os.path.join(self.directory, f"{seq:012d}{_SUFFIX}"), "w")
+        self._file.write(json.dumps({"seq": seq, "event": event}) + "\n")
+
+    def sync(self):
+        """Flush and fsync what was appended so far, before acking it upstream"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def replay(self, after: int) -> Iterator[Tuple[int, Dict]]:
+        """(seq, event) of every entry with seq > `after`, in order"""
+        for path in self.segments():
+            with open(path, "rb") as segment:
+                for line in segment:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last write before a crash
+                        logger.warning(f"Ignoring a partial entry at the end of {path}")
+                        break
+                    if not (
+                        isinstance(entry, dict)
+                        and isinstance(entry.get("seq"), int)
+                        and isinstance(entry.get("event"), dict)
+                    ):
+                        logger.error(f"Skipping a malformed entry in {path}: {line[:200]!r}")
+                        continue
+                    if entry["seq"] > after:
+                        yield entry["seq"], entry["event"]
+
+    def segments(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.endswith(_SUFFIX)
+        ]
+
+    def rotate(self) -> List[str]:
+        """Seal the open segment; the segments holding every entry so far"""
+        self.close()
+        return self.segments()
+
+    def remove(self, segments: List[str]):
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,139 @@
+"""
+Typo-tolerant term lookup over the indexed vocabulary (symmetric delete).
+
+Every vocabulary term is stored under itself and each string obtained by
+deleting one of its characters. Two terms one edit apart always share such
+a string, so a misspelled query term only needs its own deletes looked up -
+a few dozen dict probes - and the few candidates found verified with a
+bounded edit distance. Nothing is compared against the whole vocabulary or
+the product names at query time.
+
+How many edits a query term may be off by grows with its length
+(max_edits()): short terms are left exact, since "cap" is one edit from too
+many words. Long ones may be two edits off, found by looking up their
+deletes of up to two characters against the stored single deletes: that
+covers any two inserted / deleted / swapped characters and one substitution
+with one of those, but not two substitutions, which would take storing every
+two-character delete - several times the memory for the whole vocabulary.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from app.core.config import SEARCH_FUZZY_MIN_LENGTH, SEARCH_FUZZY_TWO_EDITS_LENGTH
+from app.services.chunked import copy_on_write
+
+
+# Characters deleted from vocabulary terms in the stored variants
+_STORED_DELETES = 1
+
+
+def max_edits(term: str) -> int:
+    if len(term) < SEARCH_FUZZY_MIN_LENGTH or term.isdigit():
+        return 0  # short words and numbers (sizes, model numbers) stay exact
+    return 1 if len(term) < SEARCH_FUZZY_TWO_EDITS_LENGTH else 2
+
+
+def deletes(term: str, edits: int) -> Set[str]:
+    """`term` and every string `edits` or fewer deletions away from it"""
+    variants = {term}
+    frontier = {term}
+    for _ in range(edits):
+        frontier = {
+            variant[:i] + variant[i + 1 :]
+            for variant in frontier
+            for i in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, bound: int) -> int:
+    """
+    Optimal string alignment distance (insert, delete, substitute, swap two
+    neighbours) between a and b, or bound + 1 once it must exceed `bound`
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], previous2[j - 2] + 1)
+        if min(row) > bound:
+            return bound + 1
+        previous2, previous = previous, row
+    return previous[-1] if previous[-1] <= bound else bound + 1
+
+
+def _settings() -> Tuple[int, int]:
+    return SEARCH_FUZZY_MIN_LENGTH, SEARCH_FUZZY_TWO_EDITS_LENGTH
+
+
+class FuzzyVocabulary:
+    def __init__(self, terms: Iterable[str] = ()):
+        # delete variant -> the vocabulary term it comes from, or a tuple of
+        # them when several do. Replaced rather than modified, so a copy()
+        # only needs a copy-on-write copy of the map
+        self._variants: Dict[str, Union[str, Tuple[str, ...]]] = {}
+        # What the variants were generated with; a snapshot taken under
+        # other settings is rebuilt on load (see is_current())
+        self.settings = _settings()
+        for term in terms:
+            self.add(term)
+
+    def __len__(self) -> int:
+        return len(self._variants)
+
+    def is_current(self) -> bool:
+        return self.settings == _settings()
+
+    def copy(self) -> "FuzzyVocabulary":
+        other = FuzzyVocabulary()
+        other._variants = copy_on_write(self._variants)
+        other.settings = self.settings
+        return other
+
+    def add(self, term: str):
+        for variant in self._stored(term):
+            terms = self._terms(variant)
+            if term not in terms:
+                terms += (term,)
+                self._variants[variant] = terms if len(terms) > 1 else term
+
+    def remove(self, term: str):
+        for variant in self._stored(term):
+            terms = tuple(t for t in self._terms(variant) if t != term)
+            if not terms:
+                self._variants.pop(variant, None)
+            else:
+                self._variants[variant] = terms if len(terms) > 1 else terms[0]
+
+    def lookup(self, term: str) -> List[Tuple[str, int]]:
+        """(vocabulary term, edits) for the terms near `term`, itself excluded"""
+        edits = max_edits(term)
+        if not edits:
+            return []
+        candidates = set()
+        for variant in deletes(term, edits):
+            candidates.update(self._terms(variant))
+        candidates.discard(term)
+
+        matches = []
+        for candidate in candidates:
+            distance = edit_distance(term, candidate, edits)
+            if distance <= edits:
+                matches.append((candidate, distance))
+        return matches
+
+    def _terms(self, variant: str) -> Tuple[str, ...]:
+        terms = self._variants.get(variant, ())
+        return (terms,) if isinstance(terms, str) else terms
+
+    @staticmethod
+    def _stored(term: str) -> Set[str]:
+        # Terms too short to be looked up fuzzily can still be what a longer
+        # misspelling ("mugg") is near, so they are stored as themselves
+        return deletes(term, min(max_edits(term), _STORED_DELETES))
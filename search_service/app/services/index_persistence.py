@@ -0,0 +1,286 @@
+"""
+The single writer of the search index, which also keeps it recoverable.
+
+- record() journals a consumed event and queues it; queued events are
+  applied as one batch to a copy-on-write clone of the index, which is then
+  published (indexing_service.apply_batch), once SEARCH_BATCH_SIZE events
+  are queued or the oldest has waited SEARCH_BATCH_INTERVAL (flush_if_due).
+  The journal is fsynced with every batch, and flush_if_due() tells the
+  consumer when everything it recorded is applied and may be acked
+- warm_start() loads the current snapshot (if any) and replays the journal
+  entries after it, instead of waiting for every product to be re-published
+- Once SEARCH_SNAPSHOT_MIN_EVENTS events and SEARCH_SNAPSHOT_INTERVAL
+  seconds have passed since the last snapshot, the current version is
+  snapshotted in a background thread: published versions never change, so
+  the writer carries on meanwhile
+- While a rebuilt index is being built (services/reindex.py), events are
+  also kept aside, and replayed onto it just before it is published
+
+With SEARCH_SHARDS > 1, get_persistence() is a ShardedSearch instead, which
+runs one of these per shard process (services/shards.py).
+
+A data dir belongs to one process: both hold a lock on it (lock_data_dir).
+"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import (
+    SEARCH_BATCH_INTERVAL,
+    SEARCH_BATCH_SIZE,
+    SEARCH_DATA_DIR,
+    SEARCH_SHARDS,
+    SEARCH_SNAPSHOT_INTERVAL,
+    SEARCH_SNAPSHOT_MIN_EVENTS,
+)
+from app.services import indexing_service
+from app.services.event_journal import EventJournal
+from app.services.search_index import SearchIndex
+from app.services.snapshots import load_snapshot, save_snapshot
+from app.services.suggest_index import SuggestIndex
+
+logger = logging.getLogger(__name__)
+
+
+def lock_data_dir(data_dir: str):
+    """
+    Lock data_dir for as long as this process runs, or raise if another
+    process has it: two processes would write over each other's journal
+    and snapshots, and split the events of their shared queues.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    lock_file = open(os.path.join(data_dir, "lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(
+            f"Search data dir {data_dir} is in use by another process: run one "
+            f"worker per SEARCH_INSTANCE_ID, and give each replica its own"
+        ) from None
+    return lock_file
+
+
+class IndexPersistence:
+    def __init__(self, data_dir: str = SEARCH_DATA_DIR):
+        self._data_dir_lock = lock_data_dir(data_dir)
+        self.snapshot_dir = os.path.join(data_dir, "snapshots")
+        self.journal = EventJournal(os.path.join(data_dir, "journal"))
+        self.seq = 0  # sequence number of the last journaled event
+        self.event_ids: Dict[str, int] = {}  # last upstream event id per exchange
+        self.ready = threading.Event()
+        self._pending: List[Dict] = []  # journaled, not yet published
+        self._pending_since = 0.0
+        self._unsnapshotted = 0
+        self._snapshot_at = time.monotonic()
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()  # one writer: consumer, reindex or shutdown
+        self._captured: Optional[List[Dict]] = None  # events during a rebuild
+        self._rebuild: Optional[Tuple[SearchIndex, SuggestIndex]] = None
+
+    def warm_start(self):
+        """
+        Publish the current snapshot with the journal replayed onto it.
+
+        Only the snapshot's columns are memory-mapped; its postings,
+        documents, facet sets and completions are unpickled into memory, so
+        loading still takes time and memory in proportion to the catalog.
+        A journal entry that cannot be applied is logged and skipped: the
+        product it is about may be stale until its next event or a reindex.
+        """
+        began = time.perf_counter()
+        loaded = load_snapshot(self.snapshot_dir)
+        if loaded is not None:
+            index, suggestions, position = loaded
+            indexing_service.publish(index, suggestions)
+            self.seq = position["seq"]
+            self.event_ids = dict(position.get("event_ids") or {})
+
+        # Nothing reads the index yet, so the journal is applied in place
+        replayed = skipped = 0
+        for seq, event in self.journal.replay(after=self.seq):
+            try:
+                indexing_service.apply_event(event)
+            except Exception as e:
+                logger.error(
+                    f"Skipping journal entry {seq} ({event.get('event_type')}) "
+                    f"that could not be applied: {e!r}"
+                )
+                skipped += 1
+            self._track(seq, event)
+            replayed += 1
+        self._unsnapshotted = replayed
+
+        logger.info(
+            f"Search index ready in {time.perf_counter() - began:.2f}s: "
+            f"{len(indexing_service.INDEX)} products, {replayed} events replayed"
+            + (f", {skipped} skipped" if skipped else "")
+        )
+        self.ready.set()
+        if replayed >= SEARCH_SNAPSHOT_MIN_EVENTS:
+            self.snapshot()
+
+    def record(self, event: Dict, exchange: str = None):
+        """Journal one consumed event and queue it for the next batch"""
+        with self._lock:
+            seq = self.seq + 1
+            self.journal.append(seq, {**event, "exchange": exchange})
+            self._track(seq, event, exchange)
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(event)
+            if self._captured is not None:
+                self._captured.append(event)
+
+    def flush_if_due(self) -> bool:
+        """
+        Publish the queued events if the batch is full or has waited long
+        enough. True when every recorded event is applied and durable.
+        """
+        if self._pending and (
+            len(self._pending) >= SEARCH_BATCH_SIZE
+            or time.monotonic() - self._pending_since >= SEARCH_BATCH_INTERVAL
+        ):
+            self.flush()
+        return not self._pending
+
+    def flush(self):
+        """Publish a new version with every queued event applied"""
+        with self._lock:
+            self._flush()
+        if (
+            self._unsnapshotted >= SEARCH_SNAPSHOT_MIN_EVENTS
+            and time.monotonic() - self._snapshot_at >= SEARCH_SNAPSHOT_INTERVAL
+        ):
+            self.snapshot()
+
+    def begin_rebuild(self):
+        """
+        Start a new, empty index to add_to_rebuild(); the events consumed
+        from now on are kept for it
+        """
+        with self._lock:
+            self._captured = []
+            self._rebuild = (SearchIndex(), SuggestIndex())
+
+    def add_to_rebuild(self, products: List[Dict]):
+        """Index product payloads (as exported) into the index being rebuilt"""
+        # Only the reindex thread touches the new index until it is published
+        for product in products:
+            if product.get("id") is not None:
+                indexing_service.add_or_update_product(product, target=self._rebuild)
+
+    def finish_rebuild(self) -> int:
+        """
+        Catch the rebuilt index up with the live one, publish it, and
+        snapshot it. The number of products in it.
+        """
+        with self._lock:
+            (index, suggestions), self._rebuild = self._rebuild, None
+            captured, self._captured = self._captured or [], None
+            # Not published yet, so it can be changed in place
+            for event in captured:
+                indexing_service.apply_event(event, target=(index, suggestions))
+            self._unsnapshotted += len(self._pending)
+            self._pending = []  # all of them are in `captured`
+            self.journal.sync()
+            indexing_service.publish(index, suggestions)
+        logger.info(
+            f"Rebuilt index of {len(index)} products published, "
+            f"{len(captured)} events caught up"
+        )
+        self.snapshot()
+        return len(index)
+
+    def abort_rebuild(self):
+        with self._lock:
+            self._captured = None
+            self._rebuild = None
+
+    def snapshot(self):
+        """Snapshot the current version in the background"""
+        with self._lock:
+            if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+                return
+            self._flush()
+            index, suggestions = indexing_service.current()
+            position = {"seq": self.seq, "event_ids": dict(self.event_ids)}
+            # Events from now on go to a new segment, which this snapshot
+            # does not cover
+            covered = self.journal.rotate()
+            self._unsnapshotted = 0
+            self._snapshot_at = time.monotonic()
+            self._snapshot_thread = threading.Thread(
+                target=self._write_snapshot,
+                args=(index, suggestions, position, covered),
+                name="search-snapshot",
+                daemon=True,
+            )
+            self._snapshot_thread.start()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.journal.close()
+            snapshot_thread = self._snapshot_thread
+        # A rebuilt index is in no journal: let its snapshot finish
+        if snapshot_thread is not None:
+            snapshot_thread.join()
+        self._data_dir_lock.close()
+
+    def _flush(self):
+        if self._pending:
+            try:
+                indexing_service.apply_batch(self._pending)
+            except Exception as e:
+                # Nothing of the batch was published: apply its events one
+                # by one, skipping those that fail, as warm_start() does
+                logger.error(
+                    f"Batch of {len(self._pending)} events could not be applied ({e!r}), "
+                    f"applying them one by one"
+                )
+                for event in self._pending:
+                    try:
+                        indexing_service.apply_batch([event])
+                    except Exception as e:
+                        logger.error(
+                            f"Skipping event {event.get('event_type')} "
+                            f"that could not be applied: {e!r}"
+                        )
+            self.journal.sync()
+            self._unsnapshotted += len(self._pending)
+            self._pending = []
+
+    def _write_snapshot(self, index, suggestions, position: Dict, covered: List[str]):
+        try:
+            save_snapshot(self.snapshot_dir, index, suggestions, position)
+        except Exception as e:
+            # The journal still has everything; the next snapshot retries
+            logger.error(f"Snapshot at seq {position['seq']} failed: {e}")
+            return
+        self.journal.remove(covered)
+
+    def _track(self, seq: int, event: Dict, exchange: str = None):
+        self.seq = seq
+        exchange = exchange or event.get("exchange")
+        if exchange and event.get("event_id") is not None:
+            self.event_ids[exchange] = event["event_id"]
+
+
+_persistence = None
+
+
+def get_persistence() -> IndexPersistence:
+    global _persistence
+    if _persistence is None:
+        if SEARCH_SHARDS > 1:
+            from app.services.shards import ShardedSearch  # runs IndexPersistence
+
+            _persistence = ShardedSearch(SEARCH_SHARDS)
+        else:
+            _persistence = IndexPersistence()
+    return _persistence
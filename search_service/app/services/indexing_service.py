@@ -1,4 +1,41 @@
-from typing import Dict, List
+import heapq
+import itertools
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import (
+    SEARCH_CACHE_DEPTH,
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_FACET_SIZE,
+    SUGGEST_DEFAULT_LIMIT,
+)
+from app.services.query_cache import CachedResult, QueryCache
+from app.services.records import ProductRecord
+from app.services.search_index import SearchIndex, top_k
+from app.services.suggest_index import SuggestIndex
+from app.services.tokenizer import tokenize
+
+logger = logging.getLogger(__name__)
+
+# What each event does to its product, for coalescing a batch: a "write"
+# replaces the whole product (but its promotions), a "stock" event sets its
+# stock level, a "promotion" one adds / replaces / removes one promotion
+_KINDS = {
+    "product_created": "write",
+    "product_updated": "write",
+    "product_deleted": "delete",
+    "product_stock_adjusted": "stock",
+    "product_stock_updated": "stock",
+    "promotion_created": "promotion",
+    "promotion_updated": "promotion",
+    "promotion_deleted": "promotion",
+}
+# An event is moot if a later one of its product is of one of these kinds
+_SUPERSEDED_BY = {
+    "write": {"write", "delete"},
+    "stock": {"stock", "write", "delete"},
+    "promotion": {"delete"},
+}
 
 
 # Simulated in-memort index for demo purposes
@@ -22,34 +59,203 @@ from typing import Dict, List
 
 
 # Simulated in-memort index for demo purposes
-INDEX: Dict[int, Dict] = {}
+# Inverted index over name, tags, category and description, and the sorted
+# completions of names and tags for search-as-you-type, published together
+# as one version. A published version is never modified: the writer applies
+# each batch to a clone and swaps the reference, so a reader takes _current
+# once and sees neither a half-applied batch nor a lock.
+# INDEX is the id -> document record map of the current version.
+_current: Tuple[SearchIndex, SuggestIndex] = (SearchIndex(), SuggestIndex())
+INDEX: Dict[int, ProductRecord] = _current[0].docs
+_versions = itertools.count(1)
+
+# Ranked results per query, valid for the index version they came from
+_cache = QueryCache()
+
+
+def publish(index: SearchIndex, suggestions: SuggestIndex):
+    """Make this the version readers see, with one reference assignment"""
+    global _current, INDEX
+    index.version = next(_versions)
+    _current = (index, suggestions)
+    INDEX = index.docs
+
+
+def current() -> Tuple[SearchIndex, SuggestIndex]:
+    return _current
+
+
+def version() -> int:
+    """Bumped on every publish"""
+    return _current[0].version
+
+
+def cache_stats() -> Dict:
+    return _cache.stats()
+
+
+def _in_place() -> Tuple[SearchIndex, SuggestIndex]:
+    # The current version is about to change under its readers: give it a
+    # new version number so results cached from it are not served again
+    _current[0].version = next(_versions)
+    return _current
+
 
+def apply_batch(events: List[Dict]):
+    """Apply events to a copy-on-write clone of the current version, then publish it"""
+    index, suggestions = _current
+    draft = (index.clone(), suggestions.clone())
+    writes = coalesce(events)
+    for event in writes:
+        apply_event(event, target=draft)
+    publish(*draft)
+    logger.debug(f"Published a batch of {len(events)} events ({len(writes)} after coalescing)")
 
-def add_or_update_product(product: Dict):
+
+def coalesce(events: List[Dict]) -> List[Dict]:
+    """
+    `events` without those a later event of the same product makes moot
+    (_SUPERSEDED_BY), e.g. every stock level but the last. Bulk stock events
+    are split per product first. Order is kept otherwise.
+    """
+    flat = []
+    for event in events:
+        if event.get("event_type") == "product_stock_bulk_adjusted":
+            flat.extend(
+                {"event_type": "product_stock_adjusted", "data": level}
+                for level in (event.get("data") or {}).get("items") or []
+            )
+        else:
+            flat.append(event)
+
+    kept = []
+    later: Dict = {}  # product id -> kinds of its events after this one
+    for event in reversed(flat):
+        kind = _KINDS.get(event.get("event_type"))
+        after = later.setdefault(product_of(event), set())
+        if not after & _SUPERSEDED_BY.get(kind, set()):
+            kept.append(event)
+        after.add(kind)
+    kept.reverse()
+    return kept
+
+
+def product_of(event: Dict):
+    """Id of the product an event is about (None for bulk events)"""
+    data = event.get("data") or {}
+    if event.get("event_type", "").startswith("promotion_"):
+        return data.get("product_id")
+    return data.get("id")
+
+
+def apply_event(event: Dict, target: Tuple[SearchIndex, SuggestIndex] = None):
+    """
+    Apply one product / promotion event to `target`. Without one, the current
+    version is modified in place: only for when nothing reads it yet.
+    """
+    event_type = event.get("event_type")
+    data = event.get("data")
+
+    if event_type in [
+        "product_created",
+        "product_updated",
+    ]:
+        add_or_update_product(data, target)
+    elif event_type == "product_deleted":
+        remove_product_from_index(data["id"], target)
+    elif event_type in [
+        "product_stock_adjusted",
+        "product_stock_updated",
+    ]:
+        # {"id", "stock"} only: patched, the rest of the product is kept
+        patch_product(data["id"], {"stock": data.get("stock")}, target)
+    elif event_type == "product_stock_bulk_adjusted":
+        for level in data.get("items") or []:
+            patch_product(level["id"], {"stock": level.get("stock")}, target)
+    elif event_type in [
+        "promotion_created",
+        "promotion_updated",
+        "promotion_deleted",
+    ]:
+        update_promotions(event_type, data, target)
+    else:
+        logger.warning(f"Ignoring unknown event: {event_type}")
+
+
+def to_doc(product: Dict) -> Dict:
+    """The indexed fields of a product event payload"""
+    return {
+        "id": product.get("id"),
+        "name": product.get("name"),
+        "description": product.get("description"),
+        "price": product.get("price"),
+        "stock": product.get("stock"),
+        "category": product.get("category"),
+        "tags": product.get("tags"),
+        "promotions": product.get("promotions"),
+    }
+
+
+def add_or_update_product(product: Dict, target: Tuple[SearchIndex, SuggestIndex] = None):
+    index, suggestions = target or _in_place()
 
     product_id = product.get("id")
 
     if product_id is not None:
-        INDEX[product_id] = {
-            "id": product_id,
-            "name": product.get("name"),
-            "description": product.get("description"),
-            "price": product.get("price"),
-            "stock": product.get("stock"),
-            "category": product.get("category"),
-            "tags": product.get("tags"),
-            "promotions": product.get("promotions"),
-        }
-
-    print(f"Product {product_id} indexed/updated successfully.")
-
-
-def remove_product_from_index(product_id: int):
-    if product_id in INDEX:
-        del INDEX[product_id]
-        print(f"Product {product_id} removed from index.")
-    else:
-        print(f"Product {product_id} is not found in the index.")
+        doc = to_doc(product)
+        previous = index.get(product_id)
+        if "promotions" not in product and previous is not None:
+            # Product events leave promotions out; promotion events keep them
+            doc["promotions"] = previous.get("promotions")
+        index.add(doc)
+        suggestions.add(doc, previous)
+
+
+def patch_product(
+    product_id: int, changes: Dict, target: Tuple[SearchIndex, SuggestIndex] = None
+):
+    """Change stock / price / promotions of an indexed product, without re-indexing it"""
+    index, suggestions = target or _in_place()
+    previous = index.get(product_id)
+    doc = index.patch(product_id, changes)
+    if doc is None:
+        logger.debug(f"Product {product_id} to patch is not in the index")
+        return
+    suggestions.add(doc, previous)  # the stock weighs its completions
+
+
+def update_promotions(
+    event_type: str, data: Dict, target: Tuple[SearchIndex, SuggestIndex] = None
+):
+    """Add, replace or remove one promotion of an indexed product"""
+    product_id = data.get("product_id")
+    product = (target or current())[0].get(product_id) if product_id else None
+    if product is None:
+        return
+    if event_type != "promotion_deleted" and "active" not in data:
+        return  # an event from before promotions were sent in full
+
+    promotions = [
+        promotion
+        for promotion in product.get("promotions") or []
+        if promotion.get("id") != data.get("id")
+    ]
+    # Only active promotions are listed, as in the product service
+    if event_type != "promotion_deleted" and data["active"]:
+        promotions.append(
+            {key: data.get(key) for key in ("id", "name", "discount_type", "discount_value")}
+        )
+        promotions.sort(key=lambda promotion: promotion["id"])
+    patch_product(product_id, {"promotions": promotions}, target)
+
+
+def remove_product_from_index(
+    product_id: int, target: Tuple[SearchIndex, SuggestIndex] = None
+):
+    index, suggestions = target or _in_place()
+    suggestions.remove(product_id)
+    if not index.remove(product_id):
+        logger.debug(f"Product {product_id} to remove is not in the index")
 
 
 def search_products(
@@ -59,56 +265,178 @@ def search_products(
     min_price: float = None,
     max_price: float = None,
     in_stock_only: bool = False,
-) -> List[Dict]:
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    offset: int = 0,
+    sort: str = "relevance",
+) -> Dict:
+    """
+    One page of matching products, best match first (or by price, with
+    sort="price_asc" / "price_desc").
+
+    Returns {"total": number of matches, "facets": category / tag counts of
+    all matches, "results": [product + "score", ...]}.
+    Only the top SEARCH_CACHE_DEPTH (or offset + limit) matches are ever
+    sorted, and they are cached until the index changes.
+    """
+    # One version for the whole request: doc ids mean nothing across a swap
+    index = _current[0]
+    k = offset + limit
+    cached = _ranked(
+        index, query, category_id, tag_id, min_price, max_price, in_stock_only, sort, k
+    )
+    return {
+        "total": cached.total,
+        "facets": cached.facets,
+        "results": [
+            {**index.doc(doc_id), "score": round(score, 4)}
+            for doc_id, score in cached.ranked(offset, k)
+        ],
+    }
+
+
+def search_shard(
+    query: str,
+    category_id: int = None,
+    tag_id: int = None,
+    min_price: float = None,
+    max_price: float = None,
+    in_stock_only: bool = False,
+    k: int = SEARCH_DEFAULT_LIMIT,
+    sort: str = "relevance",
+    facet_size: Optional[int] = None,
+) -> Dict:
+    """
+    This process's part of a scatter-gather search over shards (see
+    services/shards.py): like search_products, but the top `k` results come
+    with a merge key (higher is better, comparable across shards) and the
+    facets list their `facet_size` most common values (None: every value),
+    for their counts to be summed.
+
+    Returns {"total", "facets", "results": [(merge key, product + "score")]}.
+    """
+    index = _current[0]
+    cached = _ranked(
+        index, query, category_id, tag_id, min_price, max_price, in_stock_only, sort, k,
+        facet_size=facet_size,
+    )
     results = []
-    for product in INDEX.values():
-        if query and query.lower() not in product.get("name", "").lower():
-            continue
-
-        if (
-            category_id
-            and product.get("category") != category_id
-            and product.get("category") is not None
-        ):
-            continue
-
-        if (
-            tag_id
-            and tag_id not in product.get("tags", [])
-            and product.get("tags") is not None
-        ):
-            continue
-
-        if tag_id and not any(t["id"] == tag_id for t in product.get("tags", [])):
-            continue
-
-            # above 2 if conditions. which one is correct?
-            # we can use either of them. the first one checks if the tag_id is not in the list of tags,
-            # while the second one checks if any tag in the list of tags has the same id as the tag_id.
-            # both conditions will work correctly, but the second one is more efficient
-            # because it uses a generator expression to check for the presence of the tag_id in the list of tags,
-            # which can short-circuit and return True as soon as a match is found,
-            # while the first one will check all tags in the list even if a match is found early on.
-
-        if min_price is not None and product.get("price", 0) < min_price:
-            continue
-
-        # why we did not use tag_id is not None in the above if condition?
-        # we did not use tag_id is not None because if tag_id is None, it will not enter the if condition and
-        # will not filter products based on tags, which is the intended behavior.
-        # If we used tag_id is not None, it would always enter the if condition and filter products based on tags, even when tag_id is None, which would not be correct.
-
-        # can I use if min_price: instead of if min_price is not None:?
-        # It is generally better to use if min_price is not None: instead of if min_price:
-        # because if min_price is 0, it would evaluate to False in the if min_price: condition, which would not be the intended behavior.
-        # Using if min_price is not None: ensures that we are specifically checking for the presence of a value for min_price, rather than relying on its truthiness, which can lead to unintended consequences when min_price is 0 or any other falsy value.
-
-        if max_price is not None and product.get("price", 0) > max_price:
-            continue
-
-        if in_stock_only and product.get("stock", 0) <= 0:
-            continue
-
-        results.append(product)
-
-    return results
+    has_terms = bool(tokenize(query))
+    for (doc_id, score), fuzzy in zip(cached.ranked(0, k), cached.fuzzy_matches(0, k)):
+        doc = index.doc(doc_id)
+        product_id = doc["id"]
+        if sort in ("price_asc", "price_desc"):
+            price = doc.get("price")
+            priced = price is not None
+            key = (priced, (price if sort == "price_desc" else -price) if priced else 0, -product_id)
+        elif has_terms:
+            key = (-fuzzy, score, -product_id)
+        else:
+            key = (-product_id,)
+        results.append((key, {**doc, "score": round(score, 4)}))
+    return {"total": cached.total, "facets": cached.facets, "results": results}
+
+
+def _ranked(
+    index: SearchIndex,
+    query: str,
+    category_id: int,
+    tag_id: int,
+    min_price: float,
+    max_price: float,
+    in_stock_only: bool,
+    sort: str,
+    k: int,
+    facet_size: int = SEARCH_FACET_SIZE,
+) -> CachedResult:
+    """The cached top k (at least) of a query, ranked now if not cached"""
+    terms = tokenize(query)
+    key = (
+        tuple(sorted(set(terms))),
+        category_id,
+        tag_id,
+        min_price,
+        max_price,
+        in_stock_only,
+        sort,
+        facet_size,
+    )
+    cached = _cache.get(key, index.version, k)
+    if cached is None:
+        cached = _rank(
+            index,
+            terms,
+            category_id,
+            tag_id,
+            min_price,
+            max_price,
+            in_stock_only,
+            sort,
+            max(k, SEARCH_CACHE_DEPTH),
+            facet_size,
+        )
+        _cache.put(key, cached)
+    return cached
+
+
+def _rank(
+    index: SearchIndex,
+    terms: List[str],
+    category_id: int,
+    tag_id: int,
+    min_price: float,
+    max_price: float,
+    in_stock_only: bool,
+    sort: str,
+    k: int,
+    facet_size: int,
+) -> CachedResult:
+    """The top k matches of a query with its total and facets"""
+    # Only the products holding every query term (or a near spelling of a
+    # rare one) are looked at; facet filters are set intersections and the
+    # price range a column scan
+    expansions = index.expand(terms)
+    doc_ids = index.filter(
+        index.match(expansions) if terms else None,
+        category_id=category_id,
+        tag_id=tag_id,
+        in_stock_only=in_stock_only,
+        min_price=min_price,
+        max_price=max_price,
+    )
+
+    fuzzy = None
+    if sort in ("price_asc", "price_desc"):
+        ranked = [
+            (doc_id, 0.0)
+            for doc_id in index.columns.top_by_price(
+                doc_ids, k, descending=sort == "price_desc"
+            ).tolist()
+        ]
+    elif terms:
+        scores, fuzzy = index.bm25(expansions, doc_ids)
+        ranked = top_k(scores, k, fuzzy)
+    else:
+        # Nothing to rank by; keep a stable order
+        ranked = [(doc_id, 0.0) for doc_id in heapq.nsmallest(k, doc_ids)]
+
+    facets = index.facet_counts(doc_ids, facet_size)
+    return CachedResult(index.version, len(doc_ids), facets, ranked, fuzzy)
+
+
+def suggest(prefix: str, limit: int = SUGGEST_DEFAULT_LIMIT) -> List[Dict]:
+    """Completions of a partly typed query, from product names and tags"""
+    return _current[1].suggest(prefix, limit)
+
+
+def suggest_shard(prefix: str, count: int) -> List[Tuple[str, str, float]]:
+    """
+    This process's heaviest `count` (key, display text, weight) completions,
+    to be added up by key with the other shards' (see services/shards.py)
+    """
+    prefix = " ".join(tokenize(prefix))
+    return _current[1].completions(prefix, count) if prefix else []
+
+
+def suggest_weights(keys: List[str]) -> Dict[str, Tuple[str, float]]:
+    """This process's (display text, weight) of the given completion keys"""
+    return _current[1].weights(keys)
@@ -0,0 +1,135 @@
+"""
+Cache of ranked search results, bounded by bytes rather than entries.
+
+- Key: the normalized query (sorted unique terms) and every filter / sort
+  option; not the page, so paging through one query is one entry
+- Value: the ranked doc ids (as compact arrays) down to some depth, the
+  total and the facet counts
+- Each entry is tagged with the index version it was computed on. Any
+  published batch of events makes a new version, so stale entries are
+  recognized with one comparison on lookup and dropped then, with no
+  invalidation pass over the cache
+- Least recently used entries are evicted once the estimated size of all
+  entries goes over the byte budget
+"""
+
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from app.core.config import SEARCH_CACHE_BYTES
+
+# Rough fixed cost of an entry: OrderedDict slot, key tuple, entry object
+_ENTRY_OVERHEAD = 400
+
+
+class CachedResult:
+    __slots__ = ("version", "total", "facets", "doc_ids", "scores", "fuzzy", "size")
+
+    def __init__(
+        self,
+        version: int,
+        total: int,
+        facets: Dict,
+        ranked: List[Tuple[int, float]],
+        fuzzy: Optional[Dict[int, int]] = None,
+    ):
+        self.version = version
+        self.total = total
+        self.facets = facets
+        self.doc_ids = array("q", (doc_id for doc_id, _ in ranked))
+        self.scores = array("d", (score for _, score in ranked))
+        # Query terms each result matched only fuzzily (see SearchIndex.bm25)
+        self.fuzzy = array("h", (fuzzy.get(doc_id, 0) for doc_id in self.doc_ids)) if fuzzy else None
+        self.size = (
+            _ENTRY_OVERHEAD
+            + sys.getsizeof(self.doc_ids)
+            + sys.getsizeof(self.scores)
+            + (sys.getsizeof(self.fuzzy) if fuzzy else 0)
+            + _deep_size(facets)
+        )
+
+    def covers(self, k: int) -> bool:
+        """Whether the top `k` results are all here"""
+        return len(self.doc_ids) >= min(k, self.total)
+
+    def ranked(self, start: int, stop: int) -> List[Tuple[int, float]]:
+        return list(zip(self.doc_ids[start:stop], self.scores[start:stop]))
+
+    def fuzzy_matches(self, start: int, stop: int) -> List[int]:
+        if self.fuzzy is None:
+            return [0] * len(self.doc_ids[start:stop])
+        return list(self.fuzzy[start:stop])
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = SEARCH_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, CachedResult]" = OrderedDict()  # LRU first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # found, but computed on an older index version
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: int, k: int) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version != version:
+                self._drop(key)
+                self.stale += 1
+                entry = None
+            if entry is None or not entry.covers(k):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResult):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key: Hashable):
+        self._bytes -= self._entries.pop(key).size
+
+
+def _deep_size(value) -> int:
+    """sys.getsizeof of a JSON-like value and everything in it"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    return size
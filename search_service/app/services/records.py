@@ -0,0 +1,99 @@
+"""
+Compact records of the indexed products.
+
+A product event payload kept as is costs a dict per product, another per
+category and per tag, and a list for the tags and for the promotions. A
+ProductRecord keeps the same fields in slots instead, with each category
+and tag as one (id, name) tuple shared by every product that has it, and
+the lists as tuples (all products without promotions share the empty one).
+Dicts are only made again, by to_dict(), for the products a response or an
+update needs.
+
+Records are never modified once indexed, since index versions share them:
+a change makes a new record.
+"""
+
+import sys
+from typing import Dict, Optional, Tuple
+
+# (id, name) -> the one tuple for that category or tag, shared by all the
+# records having it. A renamed one gets a new tuple; the old stays behind,
+# which is a few bytes per rename.
+_facets: Dict[Tuple, Tuple] = {}
+
+
+def _facet(value):
+    """A category / tag as its shared (id, name) tuple; as given if not just {id, name}"""
+    if not isinstance(value, dict) or value.keys() != {"id", "name"}:
+        return value
+    key = (value["id"], value["name"])
+    shared = _facets.get(key)
+    if shared is None:
+        name = sys.intern(key[1]) if isinstance(key[1], str) else key[1]
+        shared = _facets[key] = (key[0], name)
+    return shared
+
+
+def _facet_dict(value):
+    if isinstance(value, tuple):
+        return {"id": value[0], "name": value[1]}
+    return dict(value) if isinstance(value, dict) else value
+
+
+class ProductRecord:
+    # The fields of indexing_service.to_doc()
+    __slots__ = ("id", "name", "description", "price", "stock", "category", "tags", "promotions")
+
+    def __init__(
+        self,
+        id: int,
+        name: Optional[str],
+        description: Optional[str],
+        price: Optional[float],
+        stock: Optional[int],
+        category,
+        tags: Optional[Tuple],
+        promotions: Optional[Tuple],
+    ):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.price = price
+        self.stock = stock
+        self.category = category
+        self.tags = tags
+        self.promotions = promotions
+
+    @classmethod
+    def of(cls, doc: Dict) -> "ProductRecord":
+        """The record of a document (a product event payload)"""
+        tags = doc.get("tags")
+        promotions = doc.get("promotions")
+        return cls(
+            doc.get("id"),
+            doc.get("name"),
+            doc.get("description"),
+            doc.get("price"),
+            doc.get("stock"),
+            _facet(doc.get("category")),
+            None if tags is None else tuple(_facet(tag) for tag in tags),
+            None if promotions is None else tuple(promotions),
+        )
+
+    def to_dict(self) -> Dict:
+        """The document again, as a new dict"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "price": self.price,
+            "stock": self.stock,
+            "category": _facet_dict(self.category),
+            "tags": None if self.tags is None else [_facet_dict(tag) for tag in self.tags],
+            "promotions": None if self.promotions is None else list(self.promotions),
+        }
+
+    def __reduce__(self):
+        # Pickled as the constructor arguments: smaller than a slots state
+        # dict per record, and shared facet tuples stay shared on load
+        return ProductRecord, tuple(getattr(self, field) for field in self.__slots__)
@@ -0,0 +1,98 @@
+"""
+Rebuild the search index from scratch from product_service's export.
+
+GET /products/export streams every product as NDJSON; a fresh SearchIndex
+and SuggestIndex are built from it in a background thread while the live
+index keeps serving and consuming events. Events consumed meanwhile are
+replayed onto the new index, which is then swapped in with one reference
+assignment (see IndexPersistence.finish_rebuild). Products are handed over
+in chunks, so a sharded index gets one message per shard and chunk.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from app.core.config import (
+    PRODUCT_SERVICE_TOKEN,
+    PRODUCT_SERVICE_URL,
+    REINDEX_READ_TIMEOUT,
+)
+from app.services.index_persistence import IndexPersistence, get_persistence
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1000  # exported products per add_to_rebuild()
+
+
+def exported_products(
+    url: str = PRODUCT_SERVICE_URL, token: str = PRODUCT_SERVICE_TOKEN
+) -> Iterator[Dict]:
+    """Products from the export endpoint, one at a time as they arrive"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    with requests.get(
+        f"{url.rstrip('/')}/export",
+        headers=headers,
+        stream=True,
+        timeout=(5, REINDEX_READ_TIMEOUT),
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+class Reindexer:
+    def __init__(self, persistence: IndexPersistence = None):
+        self.persistence = persistence or get_persistence()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.status: Dict = {"state": "idle"}
+
+    def start(self) -> bool:
+        """Start a rebuild in the background; False if one is running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {"state": "running", "products": 0, "started_at": time.time()}
+            self._thread = threading.Thread(target=self._run, name="search-reindex", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        began = time.perf_counter()
+        self.persistence.begin_rebuild()
+        try:
+            chunk = []
+            for product in exported_products():
+                chunk.append(product)
+                if len(chunk) == _CHUNK:
+                    self._add(chunk)
+                    chunk = []
+            self._add(chunk)
+            count = self.persistence.finish_rebuild()
+        except Exception as e:
+            self.persistence.abort_rebuild()
+            logger.error(f"Reindex failed, keeping the current index: {e}")
+            self.status.update(state="failed", error=str(e), finished_at=time.time())
+            return
+
+        elapsed = time.perf_counter() - began
+        logger.info(f"Reindexed {count} products in {elapsed:.1f}s")
+        self.status.update(state="done", finished_at=time.time(), seconds=round(elapsed, 1))
+
+    def _add(self, products: List[Dict]):
+        if products:
+            self.persistence.add_to_rebuild(products)
+            self.status["products"] += len(products)
+
+
+_reindexer = Reindexer()
+
+
+def get_reindexer() -> Reindexer:
+    return _reindexer
@@ -0,0 +1,556 @@
+"""
+In-memory inverted index over the product catalog.
+
+- Every indexed text field (name, tags, category, description) is tokenized
+  with the same tokenizer as queries
+- postings maps term -> {doc id -> term frequency per field}, so a query
+  only touches the posting lists of its own terms
+- The terms of every document are remembered, so an update or delete removes
+  exactly its old postings instead of scanning the vocabulary
+- Matches are ranked with BM25F: per-field term frequencies are length
+  normalized and boosted, then saturated once per term
+- Query terms that are unknown or rare (likely misspelled) are expanded to
+  the indexed terms a few edits away, through a symmetric-delete dictionary
+  of the vocabulary (services/fuzzy.py); such matches score lower and rank
+  after exact ones
+- Category, tag and in-stock filters are DocSet intersections, and the same
+  sets give facet counts for the result
+- Price, stock and category are also kept as NumPy columns, so price ranges
+  and price ordering are vectorized
+- Stock, price and promotion changes are patch()ed: the document, stock set
+  and columns change, the postings and facet sets are left alone
+- Documents are kept as compact ProductRecords (services/records.py) and
+  only turned back into dicts for the products a response returns
+- clone() gives a copy-on-write version to apply a batch of changes to,
+  while readers keep using the published one untouched; a clone's
+  per-product maps are chunked (services/chunked.py), so it costs what the
+  batch changes rather than a copy of the catalog
+"""
+
+import heapq
+import math
+import operator
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import (
+    SEARCH_BM25_B,
+    SEARCH_BM25_K1,
+    SEARCH_FACET_SIZE,
+    SEARCH_FIELD_BOOSTS,
+    SEARCH_FUZZY_BELOW_DOCS,
+    SEARCH_FUZZY_MAX_EXPANSIONS,
+    SEARCH_FUZZY_PENALTY,
+)
+from app.services.chunked import copy_on_write
+from app.services.columns import Columns
+from app.services.docset import DocSet, count_common, intersect_all
+from app.services.fuzzy import FuzzyVocabulary
+from app.services.records import ProductRecord
+from app.services.tokenizer import tokenize
+
+# Order of the per-field term frequencies stored in each posting
+FIELDS = ("name", "tags", "category", "description")
+
+# Results up to this size have their facets counted doc by doc
+FACET_SCAN_LIMIT = 50_000
+
+# A query term and the indexed terms it matches, as (term, edits away)
+Expansion = List[Tuple[str, int]]
+
+# Document fields no posting, facet set or completion is made of
+PATCHABLE_FIELDS = frozenset({"price", "stock", "promotions"})
+
+# The record fields FIELDS are tokenized from
+_text_fields = operator.attrgetter("name", "tags", "category", "description")
+
+
+def field_texts(doc: Dict) -> Tuple[str, ...]:
+    """The text of every field in FIELDS, as found in a product event"""
+    tags = doc.get("tags") or []
+    category = doc.get("category")
+    return (
+        doc.get("name") or "",
+        " ".join(name_of(tag) for tag in tags),
+        name_of(category) if category else "",
+        doc.get("description") or "",
+    )
+
+
+def facets_of(doc: Dict) -> Tuple[Optional[int], Tuple[int, ...]]:
+    """(category id, tag ids) of a product event"""
+    category = doc.get("category")
+    category_id = category.get("id") if isinstance(category, dict) else None
+    tag_ids = tuple(
+        tag["id"]
+        for tag in doc.get("tags") or []
+        if isinstance(tag, dict) and tag.get("id") is not None
+    )
+    return category_id, tag_ids
+
+
+def name_of(value) -> str:
+    # Product events carry {"id", "name"} objects; tolerate bare names too
+    if isinstance(value, dict):
+        return value.get("name") or ""
+    return str(value)
+
+
+class SearchIndex:
+    """
+    Products get a dense internal doc id (freed ids are reused), which keys
+    the postings and the facet sets below.
+
+    - categories / tags: facet value id -> DocSet of the docs having it
+    - in_stock: DocSet of the docs with stock > 0
+    - columns: price / stock / category arrays, for range filters and sorting
+    Filters are then set intersections and array comparisons rather than
+    per-product checks.
+    """
+
+    def __init__(self):
+        self.docs: Dict[int, ProductRecord] = {}  # product id -> document
+        self.doc_ids: Dict[int, int] = {}  # product id -> doc id
+        self.product_ids: List[Optional[int]] = []  # doc id -> product id
+        self._free_doc_ids: List[int] = []
+
+        self.postings: Dict[str, Dict[int, Tuple[int, ...]]] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._lengths: Dict[int, Tuple[int, ...]] = {}  # tokens per field
+        self._total_lengths = [0] * len(FIELDS)
+        self.fuzzy = FuzzyVocabulary()  # the keys of postings, typo tolerant
+
+        self.live = DocSet()
+        self.in_stock = DocSet()
+        self.categories: Dict[int, DocSet] = {}
+        self.tags: Dict[int, DocSet] = {}
+        self.facet_names: Dict[Tuple[str, int], str] = {}  # (facet, id) -> name
+        self._doc_facets: Dict[int, Tuple[Optional[int], Tuple[int, ...]]] = {}
+        self.columns = Columns()
+        self.version = 0  # set when published, see indexing_service.publish
+        # ids of the inner posting dicts / DocSets this version may modify;
+        # None = all of them (not cloned from another version)
+        self._owned: Optional[set] = None
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __getstate__(self) -> Dict:
+        # Columns are snapshotted as .npy files, not pickled (see snapshots.py)
+        state = dict(vars(self))
+        del state["columns"], state["_owned"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        vars(self).update(state)
+        self.columns = Columns()
+        self._owned = None
+        fuzzy = state.get("fuzzy")
+        if fuzzy is None or not fuzzy.is_current():
+            # Snapshot from before typo tolerance, or other fuzzy settings
+            self.fuzzy = FuzzyVocabulary(self.postings)
+        if self.docs and isinstance(next(iter(self.docs.values())), dict):
+            # Snapshot from before compact records
+            self.docs = {
+                product_id: ProductRecord.of(doc) for product_id, doc in self.docs.items()
+            }
+
+    def clone(self) -> "SearchIndex":
+        """
+        A writable version sharing everything with this one until changed.
+
+        The per-product maps, postings and columns of the clone are chunked
+        (see services/chunked.py) and share their chunks with this version
+        until the clone changes them; posting dicts and DocSets are shared
+        and only copied the first time the clone modifies them. Only the
+        small facet maps are copied whole. This index is never modified
+        through the clone, so readers holding it see a consistent version.
+        """
+        other = SearchIndex.__new__(SearchIndex)
+        other.docs = copy_on_write(self.docs)
+        other.doc_ids = copy_on_write(self.doc_ids)
+        other.product_ids = copy_on_write(self.product_ids)
+        other._free_doc_ids = list(self._free_doc_ids)
+        other.postings = copy_on_write(self.postings)
+        other._doc_terms = copy_on_write(self._doc_terms)
+        other._lengths = copy_on_write(self._lengths)
+        other._total_lengths = list(self._total_lengths)
+        other.fuzzy = self.fuzzy  # copied once the vocabulary changes
+        other.live = self.live
+        other.in_stock = self.in_stock
+        other.categories = dict(self.categories)
+        other.tags = dict(self.tags)
+        other.facet_names = dict(self.facet_names)
+        other._doc_facets = copy_on_write(self._doc_facets)
+        other.columns = self.columns.copy()
+        other.version = self.version
+        other._owned = set()
+        return other
+
+    def add(self, doc: Dict):
+        """Index `doc`, replacing any previous version of the same product"""
+        product_id = doc["id"]
+        doc_id = self.doc_ids.get(product_id)
+        previous = None
+        if doc_id is None:
+            doc_id = self._allocate(product_id)
+        else:
+            previous = self.docs[product_id]
+
+        # Most updates are stock or price changes: postings and facet sets
+        # are only touched when the text or the category / tags changed
+        record = ProductRecord.of(doc)
+        if previous is None or _text_fields(previous) != _text_fields(record):
+            if previous is not None:
+                self._unlink_terms(doc_id)
+            self._link_terms(doc_id, field_texts(doc))
+
+        facets = facets_of(doc)
+        if previous is None or self._doc_facets[doc_id] != facets:
+            if previous is not None:
+                self._unlink_facets(doc_id)
+            self._link_facets(doc_id, doc, facets)
+
+        self._set_in_stock(doc_id, (doc.get("stock") or 0) > 0)
+        self.docs[product_id] = record
+        self.columns.set(doc_id, doc)
+
+    def patch(self, product_id: int, changes: Dict) -> Optional[Dict]:
+        """
+        Change PATCHABLE_FIELDS of an indexed product without re-indexing its
+        text or facets. The new document, or None if the product is not indexed.
+        """
+        unknown = changes.keys() - PATCHABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Cannot patch {sorted(unknown)}, use add()")
+        doc_id = self.doc_ids.get(product_id)
+        if doc_id is None:
+            return None
+
+        # A new record: versions sharing the old one must not see the change
+        doc = {**self.docs[product_id].to_dict(), **changes}
+        if "stock" in changes:
+            self._set_in_stock(doc_id, (doc.get("stock") or 0) > 0)
+        # Only the columns changed: a block of each is copied in a clone
+        self.columns.set(doc_id, doc, changes.keys() & {"price", "stock"})
+        self.docs[product_id] = ProductRecord.of(doc)
+        return doc
+
+    def remove(self, product_id: int) -> bool:
+        doc_id = self.doc_ids.pop(product_id, None)
+        if doc_id is None:
+            return False
+        self._unlink_terms(doc_id)
+        self._unlink_facets(doc_id)
+        self._set_in_stock(doc_id, False)
+        self.live = self._own(self.live)
+        self.live.discard(doc_id)
+        self.columns.delete(doc_id)
+        self.product_ids[doc_id] = None
+        self._free_doc_ids.append(doc_id)
+        del self.docs[product_id]
+        return True
+
+    def get(self, product_id: int) -> Optional[Dict]:
+        """The document of a product, as a new dict"""
+        record = self.docs.get(product_id)
+        return record.to_dict() if record is not None else None
+
+    def doc(self, doc_id: int) -> Dict:
+        """The document of a doc id, as a new dict"""
+        return self.docs[self.product_ids[doc_id]].to_dict()
+
+    def expand(self, terms: Iterable[str]) -> List[Expansion]:
+        """
+        What each distinct query term matches: itself if indexed, and if it
+        is in fewer than SEARCH_FUZZY_BELOW_DOCS products, the indexed terms
+        within fuzzy.max_edits() of it too, closest and most common first
+        """
+        expansions = []
+        for term in dict.fromkeys(terms):
+            postings = self.postings.get(term)
+            expansion = [(term, 0)] if postings else []
+            if len(postings or ()) < SEARCH_FUZZY_BELOW_DOCS:
+                near = self.fuzzy.lookup(term)
+                near.sort(key=lambda match: (match[1], -len(self.postings[match[0]]), match[0]))
+                expansion += near[:SEARCH_FUZZY_MAX_EXPANSIONS]
+            expansions.append(expansion)
+        return expansions
+
+    def match(self, expansions: Iterable[Expansion]) -> List[int]:
+        """
+        Doc ids of the products matching every query term (AND), a term
+        matching through any of its expansions (OR)
+        """
+        posting_lists = []
+        for expansion in expansions:
+            if not expansion:
+                return []
+            if len(expansion) == 1:
+                posting_lists.append(self.postings[expansion[0][0]])
+            else:
+                posting_lists.append(set().union(*(self.postings[term] for term, _ in expansion)))
+        if not posting_lists:
+            return []
+
+        # Walk the shortest list and probe the others
+        posting_lists.sort(key=len)
+        shortest, rest = posting_lists[0], posting_lists[1:]
+        return [
+            doc_id
+            for doc_id in shortest
+            if all(doc_id in postings for postings in rest)
+        ]
+
+    def filter(
+        self,
+        candidates: Optional[List[int]],
+        category_id: Optional[int] = None,
+        tag_id: Optional[int] = None,
+        in_stock_only: bool = False,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> List[int]:
+        """
+        Narrow `candidates` (doc ids; None = every product) by the facet
+        filters and price range, without looking at documents
+        """
+        ranged = min_price is not None or max_price is not None
+        if candidates is None and ranged:
+            # Browsing by price: one pass over the columns beats decoding sets
+            doc_ids = self.columns.select(category_id, in_stock_only, min_price, max_price)
+            if tag_id is not None:
+                tagged = self.tags.get(tag_id)
+                if tagged is None:
+                    return []
+                doc_ids = doc_ids[np.isin(doc_ids, np.fromiter(tagged, dtype=np.int64))]
+            return doc_ids.tolist()
+
+        sets = []
+        if category_id is not None:
+            sets.append(self.categories.get(category_id))
+        if tag_id is not None:
+            sets.append(self.tags.get(tag_id))
+        if in_stock_only:
+            sets.append(self.in_stock)
+        if any(docs is None or not len(docs) for docs in sets):
+            return []
+
+        if candidates is None:
+            return intersect_all(sets or [self.live])
+        if sets:
+            sets.sort(key=len)  # most selective first, so misses fail fast
+            candidates = [
+                doc_id for doc_id in candidates if all(doc_id in docs for docs in sets)
+            ]
+        if ranged:
+            candidates = self.columns.in_price_range(
+                candidates, min_price, max_price
+            ).tolist()
+        return candidates
+
+    def facet_counts(self, doc_ids: List[int], size: Optional[int] = SEARCH_FACET_SIZE) -> Dict:
+        """
+        Categories and tags of `doc_ids` with their counts, most common first;
+        the first `size` of each, or all of them with size=None.
+
+        Small results are counted doc by doc; large ones become a bitmap
+        that is intersected with each facet set and popcounted.
+        """
+        categories, tags = Counter(), Counter()
+        if len(doc_ids) <= FACET_SCAN_LIMIT:
+            for doc_id in doc_ids:
+                category_id, tag_ids = self._doc_facets[doc_id]
+                if category_id is not None:
+                    categories[category_id] += 1
+                tags.update(tag_ids)
+        else:
+            result = DocSet(doc_ids)
+            for category_id, docs in self.categories.items():
+                categories[category_id] = count_common(result, docs)
+            for tag_id, docs in self.tags.items():
+                tags[tag_id] = count_common(result, docs)
+
+        return {
+            facet: [
+                {"id": value_id, "name": self.facet_names.get((facet, value_id)), "count": count}
+                # Most common first, ties by id, so equal indexes agree
+                for value_id, count in heapq.nsmallest(
+                    len(counter) if size is None else size,
+                    counter.items(),
+                    key=lambda item: (-item[1], item[0]),
+                )
+                if count
+            ]
+            for facet, counter in (("categories", categories), ("tags", tags))
+        }
+
+    def bm25(
+        self,
+        expansions: Iterable[Expansion],
+        candidates: Iterable[int],
+        k1: float = SEARCH_BM25_K1,
+        b: float = SEARCH_BM25_B,
+    ) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """
+        BM25F score of each candidate doc id for the expanded query terms,
+        and for the docs matching some of them only fuzzily, how many.
+
+        A doc is scored for a query term by the first of its expansions it
+        contains (exact, then closest), times SEARCH_FUZZY_PENALTY per edit.
+        """
+        count = len(self.docs)
+        scores = dict.fromkeys(candidates, 0.0)
+        fuzzy: Dict[int, int] = {}
+        if not count or not scores:
+            return scores, fuzzy
+
+        boosts = [SEARCH_FIELD_BOOSTS.get(field, 1.0) for field in FIELDS]
+        average_lengths = [total / count or 1.0 for total in self._total_lengths]
+
+        for expansion in expansions:
+            scored = set() if len(expansion) > 1 else None
+            for term, edits in expansion:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                frequency = len(postings)
+                idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+                idf *= SEARCH_FUZZY_PENALTY ** edits
+
+                # Walk whichever side is shorter
+                if len(postings) < len(scores):
+                    matches = [doc_id for doc_id in postings if doc_id in scores]
+                else:
+                    matches = [doc_id for doc_id in scores if doc_id in postings]
+                if scored is not None:
+                    matches = [doc_id for doc_id in matches if doc_id not in scored]
+                    scored.update(matches)
+
+                for doc_id in matches:
+                    lengths = self._lengths[doc_id]
+                    weighted = 0.0
+                    for field, tf in enumerate(postings[doc_id]):
+                        if tf:
+                            norm = 1 - b + b * lengths[field] / average_lengths[field]
+                            weighted += boosts[field] * tf / norm
+                    scores[doc_id] += idf * weighted * (k1 + 1) / (k1 + weighted)
+                    if edits:
+                        fuzzy[doc_id] = fuzzy.get(doc_id, 0) + 1
+        return scores, fuzzy
+
+    def _allocate(self, product_id: int) -> int:
+        if self._free_doc_ids:
+            doc_id = self._free_doc_ids.pop()
+            self.product_ids[doc_id] = product_id
+        else:
+            doc_id = len(self.product_ids)
+            self.product_ids.append(product_id)
+        self.doc_ids[product_id] = doc_id
+        self.live = self._own(self.live)
+        self.live.add(doc_id)
+        return doc_id
+
+    def _link_terms(self, doc_id: int, texts: Tuple[str, ...]):
+        tokens = [tokenize(text) for text in texts]
+        counts = [Counter(field_tokens) for field_tokens in tokens]
+        terms = set().union(*counts)
+        new_terms = []
+        for term in terms:
+            postings = self._writable(self.postings, term, dict)
+            if not postings:  # just created: postings are never left empty
+                new_terms.append(term)
+            postings[doc_id] = tuple(field_counts[term] for field_counts in counts)
+        if new_terms:
+            self.fuzzy = self._own(self.fuzzy)
+            for term in new_terms:
+                self.fuzzy.add(term)
+
+        self._doc_terms[doc_id] = tuple(terms)
+        lengths = self._lengths[doc_id] = tuple(len(field_tokens) for field_tokens in tokens)
+        for field, length in enumerate(lengths):
+            self._total_lengths[field] += length
+
+    def _unlink_terms(self, doc_id: int):
+        lengths = self._lengths.pop(doc_id, None)
+        if lengths is not None:
+            for field, length in enumerate(lengths):
+                self._total_lengths[field] -= length
+        for term in self._doc_terms.pop(doc_id, ()):
+            if term not in self.postings:
+                continue
+            postings = self._writable(self.postings, term, dict)
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self.fuzzy = self._own(self.fuzzy)
+                self.fuzzy.remove(term)
+
+    def _link_facets(self, doc_id: int, doc: Dict, facets):
+        category_id, tag_ids = facets
+        if category_id is not None:
+            self._writable(self.categories, category_id, DocSet).add(doc_id)
+            self.facet_names[("categories", category_id)] = doc["category"].get("name")
+        for tag in doc.get("tags") or []:
+            if isinstance(tag, dict) and tag.get("id") is not None:
+                self._writable(self.tags, tag["id"], DocSet).add(doc_id)
+                self.facet_names[("tags", tag["id"])] = tag.get("name")
+        self._doc_facets[doc_id] = facets
+
+    def _unlink_facets(self, doc_id: int):
+        category_id, tag_ids = self._doc_facets.pop(doc_id, (None, ()))
+        for facet, value_ids in ((self.categories, (category_id,)), (self.tags, tag_ids)):
+            for value_id in value_ids:
+                if value_id not in facet:
+                    continue
+                docs = self._writable(facet, value_id, DocSet)
+                docs.discard(doc_id)
+                if not len(docs):
+                    del facet[value_id]
+
+    def _set_in_stock(self, doc_id: int, in_stock: bool):
+        if (doc_id in self.in_stock) != in_stock:
+            self.in_stock = self._own(self.in_stock)
+            if in_stock:
+                self.in_stock.add(doc_id)
+            else:
+                self.in_stock.discard(doc_id)
+
+    def _own(self, value):
+        """`value` if this version may modify it, else a copy that it may"""
+        if self._owned is None or id(value) in self._owned:
+            return value
+        value = value.copy()
+        self._owned.add(id(value))
+        return value
+
+    def _writable(self, mapping: Dict, key, factory):
+        """mapping[key], made modifiable by this version (created if missing)"""
+        value = mapping.get(key)
+        if value is None:
+            value = mapping[key] = factory()
+            if self._owned is not None:
+                self._owned.add(id(value))
+        elif self._owned is not None and id(value) not in self._owned:
+            value = mapping[key] = self._own(value)
+        return value
+
+
+def top_k(
+    scores: Dict[int, float], k: int, fuzzy: Optional[Dict[int, int]] = None
+) -> List[Tuple[int, float]]:
+    """
+    The k best (doc id, score) pairs, best first; ties go to the lower id.
+    With `fuzzy` (doc id -> query terms it matched only fuzzily, see bm25()),
+    docs with fewer such terms come first whatever their score.
+    A heap keeps this O(n log k) instead of sorting every match.
+    """
+    if k <= 0:
+        return []
+    if not fuzzy:
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+    return heapq.nlargest(
+        k, scores.items(), key=lambda item: (-fuzzy.get(item[0], 0), item[1], -item[0])
+    )
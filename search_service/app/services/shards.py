@@ -0,0 +1,415 @@
+"""
+The search index partitioned across worker processes (SEARCH_SHARDS > 1).
+
+- Products are spread over the shards by a hash of their id. Each shard is a
+  process running the single-process engine on its part of the catalog: its
+  own index, result cache and IndexPersistence (journal and snapshots under
+  SEARCH_DATA_DIR/shard-<n>), so it warm-starts and snapshots by itself
+- ShardedSearch stands in for IndexPersistence, which the consumer and the
+  reindexer write through, and for the search functions of
+  indexing_service, which the API reads through
+- Consumed events are batched here as in IndexPersistence, each routed to
+  the shard of its product. All shards apply their part of a batch in
+  parallel, and the batch counts as applied (and is acked) once all have
+- A query goes to every shard at once. Each returns its top offset + limit
+  with a merge key, its total and the counts of its SEARCH_FACET_SIZE *
+  SEARCH_SHARD_FACET_FACTOR most common values of each facet; the results
+  are merged with a heap and the counts summed
+- BM25 uses each shard's own term statistics, as scatter-gather search
+  usually does; with products spread by hash they stay close to global ones
+- A shard serves queries and writes on separate pipes and threads, so a
+  batch being applied does not hold queries up, as in a single process.
+  Each shard has SEARCH_SHARD_READ_PIPES query pipes, taken by one query
+  at a time, so concurrent queries do not wait for each other's replies
+- A pipe whose reply went unread (its call failed on another shard) is
+  closed rather than reused. A call to a shard whose process is gone, or
+  has no pipe of the kind left, fails with ShardError instead of waiting
+"""
+
+import heapq
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import (
+    SEARCH_BATCH_INTERVAL,
+    SEARCH_BATCH_SIZE,
+    SEARCH_DATA_DIR,
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_FACET_SIZE,
+    SEARCH_SHARD_FACET_FACTOR,
+    SEARCH_SHARD_READ_PIPES,
+    SUGGEST_DEFAULT_LIMIT,
+)
+from app.core.logging import configure_logging
+from app.services import indexing_service
+from app.services.index_persistence import IndexPersistence, lock_data_dir
+from app.services.suggest_index import distinct_texts
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks that the process of a shard waited on still runs
+_ALIVE_CHECK_INTERVAL = 1.0
+
+
+class ShardError(Exception):
+    """A shard process failed a request"""
+
+
+def shard_of(product_id, shards: int) -> int:
+    # crc32 rather than hash(): the same in every process and every run
+    return zlib.crc32(str(product_id).encode()) % shards
+
+
+class _Shard:
+    """A shard process and its pipes: a pool for queries, one for writes"""
+
+    def __init__(self, context, number: int, data_dir: str):
+        self.number = number
+        reads = [context.Pipe() for _ in range(SEARCH_SHARD_READ_PIPES)]
+        writes, self.writes = context.Pipe()
+        self.connections = [end for _, end in reads] + [self.writes]
+        # "reads" / "writes" -> the pipes free for a call, each taken by
+        # one call at a time
+        self.free = {"reads": queue.Queue(), "writes": queue.Queue()}
+        for _, end in reads:
+            self.free["reads"].put(end)
+        self.free["writes"].put(self.writes)
+        self.open = {"reads": len(reads), "writes": 1}  # pipes not discarded
+        self._lock = threading.Lock()
+        self.process = context.Process(
+            target=_serve,
+            args=(data_dir, [end for end, _ in reads], writes),
+            name=f"search-shard-{number}",
+            daemon=True,
+        )
+        self.process.start()
+        for end, _ in reads:
+            end.close()
+        writes.close()
+
+    def check_alive(self):
+        if not self.process.is_alive():
+            raise ShardError(f"shard {self.number} exited with code {self.process.exitcode}")
+
+    def take(self, pipe: str):
+        """A free pipe of the kind, once one is; ShardError if none can be"""
+        while True:
+            self.check_alive()
+            if not self.open[pipe]:
+                raise ShardError(f"shard {self.number} has no {pipe} pipe left")
+            try:
+                return self.free[pipe].get(timeout=_ALIVE_CHECK_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def discard(self, pipe: str, connection):
+        """Close a pipe whose reply was not read, which the next call would get"""
+        connection.close()
+        with self._lock:
+            self.open[pipe] -= 1
+
+
+class ShardedSearch:
+    def __init__(self, shards: int, data_dir: str = SEARCH_DATA_DIR):
+        self._data_dir_lock = lock_data_dir(data_dir)
+        self.count = shards
+        self.data_dir = data_dir
+        self.ready = threading.Event()
+        self._shards: List[_Shard] = []  # started by warm_start()
+        self._pending: List[List[Tuple[Dict, str]]] = [[] for _ in range(shards)]
+        self._queued = 0  # events in _pending, as recorded
+        self._pending_since = 0.0
+        self._lock = threading.Lock()
+
+    # Writes, as IndexPersistence
+
+    def warm_start(self):
+        """Start the shard processes; each loads its snapshot and journal"""
+        began = time.perf_counter()
+        context = multiprocessing.get_context("spawn")  # no forked locks or threads
+        self._shards = [
+            _Shard(context, number, os.path.join(self.data_dir, f"shard-{number}"))
+            for number in range(self.count)
+        ]
+        counts = self._call_all("writes", "warm_start")
+        logger.info(
+            f"{self.count} search shards ready in {time.perf_counter() - began:.2f}s: "
+            f"{sum(counts)} products ({', '.join(map(str, counts))})"
+        )
+        self.ready.set()
+
+    def record(self, event: Dict, exchange: str = None):
+        """Queue one consumed event for its shard's part of the next batch"""
+        with self._lock:
+            if not self._queued:
+                self._pending_since = time.monotonic()
+            for shard, part in self._route(event):
+                self._pending[shard].append((part, exchange))
+            self._queued += 1
+
+    def flush_if_due(self) -> bool:
+        """As IndexPersistence.flush_if_due, over all shards"""
+        if self._queued and (
+            self._queued >= SEARCH_BATCH_SIZE
+            or time.monotonic() - self._pending_since >= SEARCH_BATCH_INTERVAL
+        ):
+            self.flush()
+        return not self._queued
+
+    def flush(self):
+        with self._lock:
+            if self._queued:
+                # Kept queued until every shard has its part: a failed batch
+                # is sent again whole, and every event is safe to reapply
+                self._call_all("writes", "apply", per_shard=[(part,) for part in self._pending])
+                self._pending = [[] for _ in range(self.count)]
+                self._queued = 0
+
+    def begin_rebuild(self):
+        self._call_all("writes", "begin_rebuild")
+
+    def add_to_rebuild(self, products: List[Dict]):
+        parts = [[] for _ in range(self.count)]
+        for product in products:
+            if product.get("id") is not None:
+                parts[shard_of(product["id"], self.count)].append(product)
+        self._call_all("writes", "add_to_rebuild", per_shard=[(part,) for part in parts])
+
+    def finish_rebuild(self) -> int:
+        return sum(self._call_all("writes", "finish_rebuild"))
+
+    def abort_rebuild(self):
+        self._call_all("writes", "abort_rebuild")
+
+    def close(self):
+        if self._shards:
+            self.flush()
+            self._call_all("writes", "close")
+            for shard in self._shards:
+                for connection in shard.connections:
+                    connection.close()
+                shard.process.join(timeout=10)
+        self._data_dir_lock.close()
+
+    # Reads, as indexing_service
+
+    def search_products(
+        self,
+        query: str,
+        category_id: int = None,
+        tag_id: int = None,
+        min_price: float = None,
+        max_price: float = None,
+        in_stock_only: bool = False,
+        limit: int = SEARCH_DEFAULT_LIMIT,
+        offset: int = 0,
+        sort: str = "relevance",
+    ) -> Dict:
+        """indexing_service.search_products over every shard"""
+        k = offset + limit
+        parts = self._call_all(
+            "reads",
+            "search_shard",
+            dict(
+                query=query,
+                category_id=category_id,
+                tag_id=tag_id,
+                min_price=min_price,
+                max_price=max_price,
+                in_stock_only=in_stock_only,
+                k=k,
+                sort=sort,
+                facet_size=SEARCH_FACET_SIZE * SEARCH_SHARD_FACET_FACTOR,
+            ),
+        )
+        best = heapq.nlargest(
+            k,
+            (result for part in parts for result in part["results"]),
+            key=lambda result: result[0],
+        )
+        return {
+            "total": sum(part["total"] for part in parts),
+            "facets": _merge_facets([part["facets"] for part in parts]),
+            "results": [doc for _, doc in best[offset:]],
+        }
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_DEFAULT_LIMIT) -> List[Dict]:
+        """Completions from every shard, the weights of the same one added up"""
+        count = limit * 3  # extra to dedupe, as in SuggestIndex.suggest
+        parts = self._call_all("reads", "suggest_shard", prefix, count)
+        if any(len(part) == count for part in parts):
+            # A shard may have more completions than it returned, among them
+            # ones another shard returned: ask them all for those weights
+            candidates = list({key for part in parts for key, _, _ in part})
+            parts = [
+                [(key, text, weight) for key, (text, weight) in part.items()]
+                for part in self._call_all("reads", "suggest_weights", candidates)
+            ]
+        weights, texts = Counter(), {}
+        for part in parts:
+            for key, text, weight in part:
+                weights[key] += weight
+                # The smallest display text, as SuggestIndex shows
+                texts[key] = min(text, texts.get(key, text))
+        best = heapq.nsmallest(count, weights.items(), key=lambda item: (-item[1], item[0]))
+        return distinct_texts([(key, texts[key], weight) for key, weight in best], limit)
+
+    def cache_stats(self) -> Dict:
+        """The result caches of all shards, added up"""
+        parts = self._call_all("reads", "cache_stats")
+        totals = {
+            key: sum(part[key] for part in parts)
+            for key in ("entries", "bytes", "max_bytes", "hits", "misses", "stale", "evictions")
+        }
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        totals["shards"] = self.count
+        return totals
+
+    def _route(self, event: Dict) -> List[Tuple[int, Dict]]:
+        """(shard, event) for the shard(s) an event is about"""
+        if event.get("event_type") == "product_stock_bulk_adjusted":
+            data = event.get("data") or {}
+            items: Dict[int, List[Dict]] = {}
+            for level in data.get("items") or []:
+                items.setdefault(shard_of(level.get("id"), self.count), []).append(level)
+            return [
+                (shard, {**event, "data": {**data, "items": levels}})
+                for shard, levels in items.items()
+            ]
+        product_id = indexing_service.product_of(event)
+        # Events about no product are only logged, by any one shard
+        return [(shard_of(product_id, self.count) if product_id is not None else 0, event)]
+
+    def _call_all(self, pipe: str, method: str, *args, per_shard: Optional[List[tuple]] = None) -> List:
+        """
+        Call `method` on every shard at once (with `args`, or per_shard[n]
+        for shard n) and wait for all; the results in shard order
+        """
+        shards = self._shards
+        for shard in shards:
+            shard.check_alive()  # before any is sent a call it would not finish
+        taken = []  # (shard, pipe connection)
+        sent = 0  # of those, sent the call
+        replies = []
+        try:
+            # Taken in shard order, so concurrent callers cannot deadlock;
+            # each shard starts on the call as soon as it has a pipe
+            for shard in shards:
+                connection = shard.take(pipe)
+                taken.append((shard, connection))
+                arguments = per_shard[shard.number] if per_shard is not None else args
+                sent += 1  # counted first: a failed send may have written part
+                connection.send((method, arguments))
+            for shard, connection in taken:
+                try:
+                    replies.append(connection.recv())
+                except (EOFError, OSError) as e:
+                    raise ShardError(f"shard {shard.number} {method}: {e!r}") from e
+                shard.free[pipe].put(connection)
+        finally:
+            for number, (shard, connection) in enumerate(taken):
+                if len(replies) <= number < sent:
+                    shard.discard(pipe, connection)
+                elif number >= sent:
+                    shard.free[pipe].put(connection)
+
+        failed = [(shard, error) for shard, (ok, error) in zip(shards, replies) if not ok]
+        if failed:
+            raise ShardError(
+                "; ".join(f"shard {shard.number} {method}: {error}" for shard, error in failed)
+            )
+        return [result for _, result in replies]
+
+
+def _merge_facets(parts: List[Dict], size: int = SEARCH_FACET_SIZE) -> Dict:
+    """Facet counts of all shards added up, most common first (as facet_counts)"""
+    merged = {}
+    for facet in ("categories", "tags"):
+        counts, names = Counter(), {}
+        for part in parts:
+            for value in part[facet]:
+                counts[value["id"]] += value["count"]
+                names[value["id"]] = value["name"]
+        merged[facet] = [
+            {"id": value_id, "name": names[value_id], "count": count}
+            for value_id, count in heapq.nsmallest(
+                size, counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+    return merged
+
+
+def _serve(data_dir: str, reads: List, writes):
+    """Main of a shard process: writes on one thread, queries on one per pipe"""
+    configure_logging()
+    persistence = IndexPersistence(data_dir)
+
+    def warm_start() -> int:
+        persistence.warm_start()
+        return len(indexing_service.current()[0])
+
+    def apply(events: List[Tuple[Dict, str]]):
+        for event, exchange in events:
+            persistence.record(event, exchange=exchange)
+        persistence.flush()
+
+    writer = threading.Thread(
+        target=_answer,
+        args=(
+            writes,
+            {
+                "warm_start": warm_start,
+                "apply": apply,
+                "begin_rebuild": persistence.begin_rebuild,
+                "add_to_rebuild": persistence.add_to_rebuild,
+                "finish_rebuild": persistence.finish_rebuild,
+                "abort_rebuild": persistence.abort_rebuild,
+                "close": persistence.close,
+            },
+        ),
+        name="search-shard-writer",
+    )
+    writer.start()
+    handlers = {
+        "search_shard": lambda kwargs: indexing_service.search_shard(**kwargs),
+        "suggest_shard": indexing_service.suggest_shard,
+        "suggest_weights": indexing_service.suggest_weights,
+        "cache_stats": indexing_service.cache_stats,
+    }
+    readers = [
+        threading.Thread(
+            target=_answer, args=(connection, handlers), name=f"search-shard-reader-{number}"
+        )
+        for number, connection in enumerate(reads)
+    ]
+    for reader in readers:
+        reader.start()
+    for thread in readers + [writer]:
+        thread.join()
+
+
+def _answer(connection, handlers: Dict):
+    while True:
+        try:
+            method, args = connection.recv()
+        except (EOFError, OSError):  # the API process closed the pipe, or is gone
+            return
+        try:
+            reply = (True, handlers[method](*args))
+        except Exception as e:
+            logger.exception(f"Shard request {method} failed")
+            reply = (False, f"{type(e).__name__}: {e}")
+        try:
+            connection.send(reply)
+        except OSError:  # the API process discarded the pipe meanwhile
+            return
+        if method == "close":
+            return
@@ -0,0 +1,126 @@
+"""
+On-disk snapshots of the search index, for a warm start.
+
+A snapshot is a directory under SEARCH_DATA_DIR/snapshots:
+
+    snapshot-<seq>/
+        meta.json       sequence number of the last applied event, counts
+        *.npy           the NumPy columns, memory-mapped on load
+        index.pickle    postings, documents, facet sets and completions,
+                        unpickled into memory on load
+
+It is written under a temporary name, fsynced and renamed, and only then
+does the CURRENT file (itself replaced atomically) point at it, so a crash
+at any point leaves the previous snapshot in use.
+"""
+
+import gc
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.config import SEARCH_SNAPSHOTS_KEPT
+from app.services.columns import Columns
+from app.services.search_index import SearchIndex
+from app.services.suggest_index import SuggestIndex
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+_PREFIX = "snapshot-"
+
+
+def save_snapshot(
+    directory: str, index: SearchIndex, suggestions: SuggestIndex, position: Dict
+) -> str:
+    """Write a snapshot of the index as of `position` and make it current"""
+    began = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{_PREFIX}{position['seq']:012d}"
+    final = os.path.join(directory, name)
+    staging = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    index.columns.save(staging)
+    with open(os.path.join(staging, "index.pickle"), "wb") as out:
+        pickle.dump((index, suggestions), out, protocol=pickle.HIGHEST_PROTOCOL)
+    meta = {
+        "format": FORMAT_VERSION,
+        **position,
+        "products": len(index),
+        "created_at": time.time(),
+    }
+    with open(os.path.join(staging, "meta.json"), "w") as out:
+        json.dump(meta, out)
+
+    for file_name in os.listdir(staging):
+        _fsync(os.path.join(staging, file_name))
+    shutil.rmtree(final, ignore_errors=True)
+    os.rename(staging, final)
+    _fsync(directory)
+
+    pointer = os.path.join(directory, "CURRENT")
+    with open(pointer + ".tmp", "w") as out:
+        out.write(name)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    _fsync(directory)
+
+    _prune(directory, keep=SEARCH_SNAPSHOTS_KEPT)
+    logger.info(
+        f"Snapshot {name} of {len(index)} products written in "
+        f"{time.perf_counter() - began:.2f}s"
+    )
+    return final
+
+
+def load_snapshot(directory: str) -> Optional[Tuple[SearchIndex, SuggestIndex, Dict]]:
+    """(index, suggestions, position) of the current snapshot, or None"""
+    try:
+        with open(os.path.join(directory, "CURRENT")) as pointer:
+            path = os.path.join(directory, pointer.read().strip())
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        return None
+    if meta.get("format") != FORMAT_VERSION:
+        logger.warning(f"Ignoring snapshot {path} in format {meta.get('format')}")
+        return None
+
+    began = time.perf_counter()
+    # Unpickling millions of containers is much faster without the cyclic
+    # GC walking them as they are created
+    gc.disable()
+    try:
+        with open(os.path.join(path, "index.pickle"), "rb") as data:
+            index, suggestions = pickle.load(data)
+    finally:
+        gc.enable()
+    index.columns = Columns.load(path)
+
+    logger.info(
+        f"Loaded snapshot {os.path.basename(path)} of {len(index)} products in "
+        f"{time.perf_counter() - began:.2f}s"
+    )
+    position = {key: meta[key] for key in ("seq", "event_ids") if key in meta}
+    return index, suggestions, position
+
+
+def _prune(directory: str, keep: int):
+    snapshots = sorted(name for name in os.listdir(directory) if name.startswith(_PREFIX))
+    for name in snapshots[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
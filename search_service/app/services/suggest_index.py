@@ -0,0 +1,460 @@
+"""
+Prefix index behind /search/suggest (search-as-you-type).
+
+- Completions come from product names, every word-suffix of a name (so
+  "mug" is completed even from "Red Mug") and tag names, normalized like
+  queries. A suffix shows as itself ("mug"), a whole name or tag as written;
+  a key with several display texts shows the smallest, so what is shown
+  does not depend on the order products came in, nor on the sharding
+- They are kept sorted, in blocks of a few hundred keys: a prefix is a
+  contiguous run found with two binary searches, and adding or removing a
+  key shifts one block, not the whole list
+- Each completion weighs the sum of its products' weights; a product weighs
+  more the more stock it has, in log2 buckets so stock events rarely move it
+- Short prefixes match the most completions, so each prefix of up to
+  _TOP_PREFIX_LENGTH characters keeps its heaviest keys: those of the
+  longest prefixes from their run of keys, shorter ones merged from their
+  one-character-longer prefixes. A key added or made heavier is moved up
+  in the tops of its prefixes, one made lighter down (or out, past keys a
+  top left out); a top left too short is worked out again when next read
+- Products are added / removed incrementally
+- clone() gives a copy-on-write version, like SearchIndex.clone(): its
+  maps are chunked (services/chunked.py) and it shares the key blocks,
+  each copied when the clone first changes it
+"""
+
+import heapq
+import math
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from app.core.config import SUGGEST_MAX_LIMIT
+from app.services.chunked import copy_on_write
+from app.services.search_index import name_of
+from app.services.tokenizer import tokenize
+
+# Prefixes up to this long keep their top completions
+_TOP_PREFIX_LENGTH = 3
+# Completions a prefix can be asked for: suggest() takes 3 per result, to
+# dedupe texts. Twice as many are kept, so that keys getting lighter can
+# drop out of a top for a while before it has to be worked out again
+_TOP_COUNT = SUGGEST_MAX_LIMIT * 3
+_TOP_DEPTH = 2 * _TOP_COUNT
+# Keys per block of the sorted keys; a block is split at twice this
+_BLOCK_SIZE = 512
+# _tops.get() default for a prefix without keys yet
+_UNSEEN = object()
+
+
+class _Completion:
+    __slots__ = ("texts", "weight", "products")
+
+    def __init__(self):
+        self.texts: Dict[str, int] = {}  # display text -> products using it
+        self.weight = 0.0
+        self.products = 0
+
+    def copy(self) -> "_Completion":
+        other = _Completion()
+        other.texts = dict(self.texts)
+        other.weight = self.weight
+        other.products = self.products
+        return other
+
+    @property
+    def text(self) -> str:
+        return min(self.texts)
+
+
+def product_weight(doc: Dict) -> float:
+    stock = doc.get("stock") or 0
+    return 1.0 + (int(math.log2(stock)) + 1 if stock > 0 else 0)
+
+
+def distinct_texts(completions: List[Tuple[str, str, float]], limit: int) -> List[Dict]:
+    """The first `limit` completions with a display text not seen before"""
+    results, seen = [], set()
+    for _, text, weight in completions:
+        if text in seen:
+            continue
+        seen.add(text)
+        results.append({"text": text, "weight": weight})
+        if len(results) == limit:
+            break
+    return results
+
+
+def _prefixes(key: str) -> List[str]:
+    """The prefixes of `key` that keep top completions, shortest first"""
+    return [key[:length] for length in range(1, min(len(key), _TOP_PREFIX_LENGTH) + 1)]
+
+
+class _SortedKeys:
+    """
+    A sorted list of distinct strings, kept as blocks of up to 2 *
+    _BLOCK_SIZE keys with the first key of each, so an insert or a delete
+    moves one block's worth of references instead of the whole list.
+    Copies share the blocks until they change them.
+    """
+
+    def __init__(self, keys: List[str] = ()):
+        keys = sorted(keys)
+        self._blocks: List[List[str]] = [
+            keys[start : start + _BLOCK_SIZE] for start in range(0, len(keys), _BLOCK_SIZE)
+        ]
+        self._firsts: List[str] = [block[0] for block in self._blocks]
+        self._count = len(keys)
+        self._owned: Optional[set] = None  # see services/chunked.py
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        for block in self._blocks:
+            yield from block
+
+    def copy(self) -> "_SortedKeys":
+        other = _SortedKeys.__new__(_SortedKeys)
+        other._blocks = list(self._blocks)
+        other._firsts = list(self._firsts)
+        other._count = self._count
+        other._owned = set()
+        return other
+
+    def add(self, key: str):
+        if not self._blocks:
+            self._blocks.append(self._new_block([key]))
+            self._firsts.append(key)
+            self._count = 1
+            return
+        number = max(bisect_right(self._firsts, key) - 1, 0)
+        block = self._block_to_change(number)
+        insort(block, key)
+        self._firsts[number] = block[0]
+        self._count += 1
+        if len(block) > 2 * _BLOCK_SIZE:
+            self._blocks[number : number + 1] = [
+                self._new_block(block[:_BLOCK_SIZE]),
+                self._new_block(block[_BLOCK_SIZE:]),
+            ]
+            self._firsts.insert(number + 1, block[_BLOCK_SIZE])
+
+    def remove(self, key: str):
+        number = bisect_right(self._firsts, key) - 1
+        block = self._block_to_change(number)
+        del block[bisect_left(block, key)]
+        self._count -= 1
+        if block:
+            self._firsts[number] = block[0]
+        else:
+            del self._blocks[number], self._firsts[number]
+
+    def starting_with(self, prefix: str) -> Iterator[str]:
+        """The keys starting with `prefix`, in order"""
+        number = max(bisect_right(self._firsts, prefix) - 1, 0)
+        for block in self._blocks[number:]:
+            for key in block[bisect_left(block, prefix) :]:
+                if not key.startswith(prefix):
+                    return
+                yield key
+
+    def any_starting_with(self, prefix: str) -> bool:
+        return next(self.starting_with(prefix), None) is not None
+
+    def _block_to_change(self, number: int) -> List[str]:
+        block = self._blocks[number]
+        if self._owned is not None and id(block) not in self._owned:
+            block = self._blocks[number] = self._new_block(list(block))
+        return block
+
+    def _new_block(self, keys: List[str]) -> List[str]:
+        if self._owned is not None:
+            self._owned.add(id(keys))
+        return keys
+
+
+def _texts_of(doc: Dict) -> Tuple:
+    """What a product's completions are made of"""
+    return doc.get("name"), tuple(name_of(tag) for tag in doc.get("tags") or [])
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._keys = _SortedKeys()
+        self._completions: Dict[str, _Completion] = {}
+        self._contributions: Dict[int, Tuple[Tuple[str, str, float], ...]] = {}
+        # prefix (see _prefixes()) -> (its heaviest keys, whether they are
+        # all of its keys), or None when stale. Only keys lighter than the
+        # last of an incomplete top are left out of it
+        self._tops: Dict[str, Optional[Tuple[Tuple[str, ...], bool]]] = {}
+        # prefix shorter than _TOP_PREFIX_LENGTH -> its one-character-longer
+        # prefixes; replaced rather than modified, like the tops
+        self._children: Dict[str, FrozenSet[str]] = {}
+        self._owned: Optional[set] = None  # see SearchIndex._owned
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __getstate__(self) -> Dict:
+        # The prefix tables are worked out again on load
+        return {"_completions": self._completions, "_contributions": self._contributions}
+
+    def __setstate__(self, state: Dict):
+        self._completions = state["_completions"]
+        self._contributions = state["_contributions"]
+        self._keys = _SortedKeys(self._completions)
+        self._tops, self._children = {}, {}
+        for key in self._keys:
+            for prefix in _prefixes(key):
+                self._tops[prefix] = None
+                if len(prefix) < _TOP_PREFIX_LENGTH:
+                    self._children.setdefault(prefix, frozenset())
+                if len(prefix) > 1:
+                    parent = prefix[:-1]
+                    self._children[parent] = self._children[parent] | {prefix}
+        self._owned = None
+
+    def clone(self) -> "SuggestIndex":
+        """A writable version; completions are copied when first changed"""
+        other = SuggestIndex.__new__(SuggestIndex)
+        other._keys = self._keys.copy()
+        other._completions = copy_on_write(self._completions)
+        other._contributions = copy_on_write(self._contributions)
+        other._tops = copy_on_write(self._tops)
+        other._children = copy_on_write(self._children)
+        other._owned = set()
+        return other
+
+    def add(self, doc: Dict, previous: Optional[Dict] = None):
+        """Add or replace a product's completions (`previous`: its indexed version)"""
+        product_id = doc["id"]
+        weight = product_weight(doc)
+        known = self._contributions.get(product_id)
+        if known and previous is not None and _texts_of(previous) == _texts_of(doc):
+            # Same name and tags, e.g. a stock change: at most the weight moves
+            self._reweigh(product_id, known, weight)
+            return
+        contributions = tuple(
+            (key, text, weight) for key, text in self._completions_of(doc)
+        )
+
+        if self._contributions.get(product_id) == contributions:
+            return  # e.g. a stock change within the same bucket
+
+        self._unlink(product_id)
+        for key, text, weight in contributions:
+            completion = self._completions.get(key)
+            if completion is None:
+                completion = self._completions[key] = self._owned_new(_Completion())
+                self._keys.add(key)
+            else:
+                completion = self._writable(key)
+            completion.texts[text] = completion.texts.get(text, 0) + 1
+            completion.weight += weight
+            completion.products += 1
+            self._raised(key)
+        self._contributions[product_id] = contributions
+
+    def remove(self, product_id: int):
+        self._unlink(product_id)
+
+    def suggest(self, prefix: str, limit: int) -> List[Dict]:
+        """Best `limit` completions of `prefix`, heaviest first"""
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return []
+        # Different keys can show the same text; take extra to dedupe
+        return distinct_texts(self.completions(prefix, limit * 3), limit)
+
+    def completions(self, prefix: str, count: int) -> List[Tuple[str, str, float]]:
+        """The `count` heaviest (key, display text, weight) of a normalized prefix"""
+        if len(prefix) <= _TOP_PREFIX_LENGTH and count <= _TOP_COUNT:
+            keys = self._top(prefix)[:count] if prefix in self._tops else ()
+        else:
+            keys = self._heaviest(self._keys.starting_with(prefix), count)
+        completions = self._completions
+        return [(key, completions[key].text, completions[key].weight) for key in keys]
+
+    def weights(self, keys: List[str]) -> Dict[str, Tuple[str, float]]:
+        """(display text, weight) of those of `keys` that are completions here"""
+        return {
+            key: (self._completions[key].text, self._completions[key].weight)
+            for key in keys
+            if key in self._completions
+        }
+
+    @staticmethod
+    def _completions_of(doc: Dict):
+        """(key, display text) pairs for a product, without duplicates"""
+        pairs = {}
+        name = doc.get("name") or ""
+        words = tokenize(name)
+        if words:
+            pairs[" ".join(words)] = name
+        for start in range(1, len(words)):
+            suffix = " ".join(words[start:])
+            pairs.setdefault(suffix, suffix)
+        for tag in doc.get("tags") or []:
+            text = name_of(tag)
+            key = " ".join(tokenize(text))
+            if key:
+                pairs.setdefault(key, text)
+        return pairs.items()
+
+    def _heaviest(self, keys, count: int) -> List[str]:
+        """The `count` heaviest of `keys`; equal weights in key order"""
+        completions = self._completions
+        return heapq.nsmallest(count, keys, key=lambda key: (-completions[key].weight, key))
+
+    def _top(self, prefix: str) -> Tuple[str, ...]:
+        """
+        The heaviest keys of a prefix in _tops, heaviest first: at least
+        _TOP_COUNT of them, or all. Worked out again if stale.
+        """
+        top = self._tops[prefix]
+        if top is None or (not top[1] and len(top[0]) < _TOP_COUNT):
+            # Readers of a published version may fill this in: the same
+            # value whichever of them does
+            top = self._tops[prefix] = self._work_out(prefix)
+        return top[0]
+
+    def _work_out(self, prefix: str) -> Tuple[Tuple[str, ...], bool]:
+        if len(prefix) == _TOP_PREFIX_LENGTH:
+            keys = self._heaviest(self._keys.starting_with(prefix), _TOP_DEPTH)
+            return tuple(keys), len(keys) < _TOP_DEPTH
+
+        candidates = [prefix] if prefix in self._completions else []
+        complete, boundary = True, None
+        for child in self._children[prefix]:
+            child_keys = self._top(child)
+            candidates.extend(child_keys)
+            if not self._tops[child][1]:
+                # What the child left out is lighter than its last key
+                complete = False
+                if boundary is None or self._outweighs(boundary, child_keys[-1]):
+                    boundary = child_keys[-1]
+        keys = self._heaviest(candidates, _TOP_DEPTH)
+        if boundary in keys:
+            keys = keys[: keys.index(boundary) + 1]
+        return tuple(keys), complete and len(candidates) <= _TOP_DEPTH
+
+    def _raised(self, key: str):
+        """`key` was added or got heavier: it may enter the tops of its prefixes"""
+        parent = None
+        for prefix in _prefixes(key):
+            top = self._tops.get(prefix, _UNSEEN)
+            if top is _UNSEEN:
+                # Its first key
+                self._tops[prefix] = ((key,), True)
+                if len(prefix) < _TOP_PREFIX_LENGTH:
+                    self._children[prefix] = frozenset()
+                if parent is not None:
+                    self._children[parent] = self._children[parent] | {prefix}
+            elif top is None:
+                pass  # worked out from the keys when read
+            elif self._owned is None:
+                # Not a clone: being built, with nothing reading it yet (see
+                # SearchIndex._owned); cheaper to work the tops out once read
+                self._tops[prefix] = None
+            else:
+                keys, complete = top
+                if key in keys:
+                    at = keys.index(key)
+                    keys = keys[:at] + keys[at + 1 :]
+                elif not complete and not (keys and self._outweighs(key, keys[-1])):
+                    parent = prefix
+                    continue
+                keys = self._placed(keys, key)
+                if len(keys) > _TOP_DEPTH:
+                    keys, complete = keys[:_TOP_DEPTH], False
+                self._tops[prefix] = (keys, complete)
+            parent = prefix
+
+    def _lowered(self, key: str, removed: bool = False):
+        """
+        `key` got lighter, or was removed: the tops holding it move it down,
+        or leave it out if keys they left out may outweigh it now
+        """
+        for prefix in _prefixes(key):
+            top = self._tops.get(prefix)
+            if top is None or key not in top[0]:
+                continue
+            if self._owned is None:
+                self._tops[prefix] = None  # see _raised()
+                continue
+            keys, complete = top
+            at = keys.index(key)
+            keys = keys[:at] + keys[at + 1 :]
+            if not removed and (complete or (keys and self._outweighs(key, keys[-1]))):
+                keys = self._placed(keys, key)
+            self._tops[prefix] = (keys, complete)
+
+    def _placed(self, keys: Tuple[str, ...], key: str) -> Tuple[str, ...]:
+        """`keys` (heaviest first, without `key`) with `key` put in its place"""
+        completions = self._completions
+        at = bisect_left(
+            keys,
+            (-completions[key].weight, key),
+            key=lambda other: (-completions[other].weight, other),
+        )
+        return keys[:at] + (key,) + keys[at:]
+
+    def _outweighs(self, key: str, other: str) -> bool:
+        weight, other_weight = self._completions[key].weight, self._completions[other].weight
+        return weight > other_weight or (weight == other_weight and key < other)
+
+    def _unlink_prefixes(self, key: str):
+        """A removed key: prefixes it was the last key of go"""
+        for prefix in reversed(_prefixes(key)):
+            if len(prefix) < _TOP_PREFIX_LENGTH:
+                left = prefix in self._completions or self._children[prefix]
+            else:
+                left = self._keys.any_starting_with(prefix)
+            if left:
+                continue
+            del self._tops[prefix]
+            self._children.pop(prefix, None)
+            if len(prefix) > 1:
+                parent = prefix[:-1]
+                self._children[parent] = self._children[parent] - {prefix}
+
+    def _writable(self, key: str) -> _Completion:
+        """The completion of `key`, made modifiable by this version"""
+        completion = self._completions[key]
+        if self._owned is not None and id(completion) not in self._owned:
+            completion = self._completions[key] = self._owned_new(completion.copy())
+        return completion
+
+    def _owned_new(self, completion: _Completion) -> _Completion:
+        if self._owned is not None:
+            self._owned.add(id(completion))
+        return completion
+
+    def _reweigh(self, product_id: int, known: Tuple, weight: float):
+        delta = weight - known[0][2]
+        if not delta:
+            return
+        for key, _, _ in known:
+            completion = self._writable(key)
+            completion.weight += delta
+            if delta > 0:
+                self._raised(key)
+            else:
+                self._lowered(key)
+        self._contributions[product_id] = tuple((key, text, weight) for key, text, _ in known)
+
+    def _unlink(self, product_id: int):
+        for key, text, weight in self._contributions.pop(product_id, ()):
+            completion = self._writable(key)
+            completion.texts[text] -= 1
+            if not completion.texts[text]:
+                del completion.texts[text]
+            completion.weight -= weight
+            completion.products -= 1
+            if completion.products == 0:
+                self._lowered(key, removed=True)
+                del self._completions[key]
+                self._keys.remove(key)
+                self._unlink_prefixes(key)
+            else:
+                self._lowered(key)
@@ -0,0 +1,26 @@
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Too common to narrow a product search down
+STOPWORDS = frozenset(
+    {"a", "an", "and", "at", "by", "for", "in", "of", "on", "or", "the", "to", "with"}
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so "Café" and "cafe" are the same term"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text) -> List[str]:
+    """Split text into normalized terms, in order, dropping stopwords"""
+    if not text:
+        return []
+    return [
+        token for token in _TOKEN_RE.findall(normalize(str(text)))
+        if token not in STOPWORDS
+    ]
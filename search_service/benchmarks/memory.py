@@ -0,0 +1,113 @@
+"""
+Memory per indexed product, by index structure, for sizing search hosts.
+
+Indexes a synthetic catalog and measures every structure of the published
+version (documents, postings, facet sets, columns, completions, ...) by
+walking its objects, each shared object counted once. Reports the bytes
+per product of each, what the documents would take as the dicts they were
+before compact records, and the process memory the whole index takes.
+
+Run from search_service/:
+
+    python -m benchmarks.memory --products 1000000 --size-for 20000000
+"""
+
+import argparse
+import gc
+import sys
+import time
+
+import numpy as np
+
+from app.services import indexing_service
+from app.services.search_index import SearchIndex
+from app.services.suggest_index import SuggestIndex
+from benchmarks.search import rss_bytes
+from benchmarks.synthetic import products
+
+# Report rows: (label, the SearchIndex attributes measured)
+STRUCTURES = [
+    ("documents", ("docs",)),
+    ("postings", ("postings",)),
+    ("doc terms, lengths", ("_doc_terms", "_lengths")),
+    ("fuzzy vocabulary", ("fuzzy",)),
+    (
+        "facet sets",
+        ("live", "in_stock", "categories", "tags", "_doc_facets", "facet_names"),
+    ),
+    ("columns", ("columns",)),
+    ("id maps", ("doc_ids", "product_ids", "_free_doc_ids")),
+]
+
+
+def deep_size(root, seen: set) -> int:
+    """Bytes of `root` and everything it references not in `seen` (added to it)"""
+    size, stack = 0, [root]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, np.ndarray):
+            size += sys.getsizeof(value) + (0 if value.flags.owndata else value.nbytes)
+            continue
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            stack.extend(value)
+        elif not isinstance(value, (str, bytes, bytearray, int, float, type(None))):
+            for slot in getattr(type(value), "__slots__", ()):
+                if hasattr(value, slot):
+                    stack.append(getattr(value, slot))
+            if hasattr(value, "__dict__"):
+                stack.append(vars(value))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--words", type=int, default=None, help="vocabulary size")
+    parser.add_argument("--size-for", type=int, default=None, help="extrapolate to this many products")
+    args = parser.parse_args()
+
+    gc.collect()
+    before = rss_bytes()
+    began = time.perf_counter()
+    index, suggestions = SearchIndex(), SuggestIndex()
+    for product in products(args.products, words=args.words):
+        indexing_service.add_or_update_product(product, target=(index, suggestions))
+    build_seconds = time.perf_counter() - began
+    gc.collect()
+    process_bytes = rss_bytes() - before
+    count = len(index)
+
+    seen = set()
+    sizes = []
+    for label, attributes in STRUCTURES:
+        sizes.append(
+            (label, sum(deep_size(getattr(index, attribute), seen) for attribute in attributes))
+        )
+    sizes.append(("completions", deep_size(suggestions, seen)))
+    as_dicts = deep_size({product_id: index.get(product_id) for product_id in index.docs}, set())
+
+    total = sum(size for _, size in sizes)
+    print(f"indexed {count} products in {build_seconds:.1f}s\n")
+    print(f"{'structure':<22}{'MB':>9}{'bytes/product':>15}{'share':>8}")
+    for label, size in sizes + [("total", total)]:
+        print(f"{label:<22}{size / 2**20:>9.1f}{size / count:>15.0f}{size / total:>8.0%}")
+    documents = sizes[0][1]
+    print(
+        f"\ndocuments as dicts: {as_dicts / count:.0f} bytes/product, "
+        f"{as_dicts / max(documents, 1):.1f}x the records"
+    )
+    print(f"process memory taken: {process_bytes / 2**20:.0f} MB, {process_bytes / count:.0f} bytes/product")
+    if args.size_for:
+        estimate = process_bytes / count * args.size_for
+        print(f"for {args.size_for} products: about {estimate / 2**30:.1f} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Price / stock / category filtering: NumPy columns vs a scan of the dicts.
+
+Indexes a synthetic catalog, then times the same filtered queries through
+SearchIndex.filter() (column scan) and through the per-product dict scan
+search_products used to do, checking both return the same products.
+
+Run from search_service/:
+
+    python -m benchmarks.price_filter --products 1000000 --repeat 20
+"""
+
+import argparse
+import statistics
+import time
+
+from app.services.search_index import SearchIndex
+from benchmarks.synthetic import products
+
+# (description, filter kwargs)
+QUERIES = [
+    ("price 10-50", {"min_price": 10, "max_price": 50}),
+    ("price >= 200, in stock", {"min_price": 200, "in_stock_only": True}),
+    ("category 1, price <= 20", {"category_id": 1, "max_price": 20}),
+    ("category 3, in stock, 5-500", {"category_id": 3, "in_stock_only": True, "min_price": 5, "max_price": 500}),
+]
+
+
+def dict_scan(docs, category_id=None, in_stock_only=False, min_price=None, max_price=None):
+    low = min_price if min_price is not None else float("-inf")
+    high = max_price if max_price is not None else float("inf")
+    return [
+        doc["id"]
+        for doc in docs.values()
+        if (category_id is None or (doc.get("category") or {}).get("id") == category_id)
+        and (not in_stock_only or (doc.get("stock") or 0) > 0)
+        and low <= (doc.get("price") or 0) <= high
+    ]
+
+
+def timed(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - began)
+    return result, statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    index, docs = SearchIndex(), {}
+    began = time.perf_counter()
+    for doc in products(args.products):
+        index.add(doc)
+        docs[doc["id"]] = doc
+    print(f"indexed {args.products} products in {time.perf_counter() - began:.1f}s\n")
+
+    print(f"{'query':<30}{'matches':>10}{'dict ms':>10}{'columns ms':>12}{'speedup':>9}")
+    for label, kwargs in QUERIES:
+        expected, dict_ms = timed(lambda: dict_scan(docs, **kwargs), args.repeat)
+        doc_ids, column_ms = timed(lambda: index.filter(None, **kwargs), args.repeat)
+        found = [index.product_ids[doc_id] for doc_id in doc_ids]
+        assert sorted(found) == sorted(expected), label
+        print(
+            f"{label:<30}{len(found):>10}{dict_ms:>10.1f}{column_ms:>12.2f}"
+            f"{dict_ms / column_ms:>8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
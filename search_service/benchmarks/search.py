@@ -0,0 +1,273 @@
+"""
+Search benchmark and regression gate: build time, memory, latency, relevance.
+
+Builds the index for a synthetic catalog the way a bulk reindex does, then
+replays a query log (query_log(), or --queries: a JSON lines file of
+search_products arguments, optionally with a "shape" label) through
+indexing_service.search_products, in this process - no broker, database
+or network. Reports index build time, the memory the index takes, latency
+percentiles per kind of search and overall, queries per second, and the
+top results of every distinct search.
+
+With --save, the report is written as JSON; with --baseline, it is compared
+against one saved earlier with the same options on the same machine, and
+the run exits 1 if the index got slower to build or query, bigger, or
+returns different results for more than --max-changed searches.
+
+The result cache is on, as in production: the log repeats popular
+searches. --no-cache ranks every one.
+
+Run from search_service/:
+
+    python -m benchmarks.search --products 200000 --save baseline.json
+    python -m benchmarks.search --products 200000 --baseline baseline.json
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+if __name__ == "__main__":
+    if "--no-cache" in sys.argv:
+        os.environ["SEARCH_CACHE_BYTES"] = "0"  # before the config is imported
+
+from app.services import indexing_service
+from app.services.search_index import SearchIndex
+from app.services.suggest_index import SuggestIndex
+from benchmarks.synthetic import products, query_log
+
+RELEVANCE_DEPTH = 10  # top results compared against the baseline, per search
+
+# Compared against the baseline: (report field, higher is worse)
+GATED = [
+    ("build_seconds", True),
+    ("memory_bytes", True),
+    ("p95_ms", True),
+    ("qps", False),
+]
+
+
+def rss_bytes() -> int:
+    """Resident memory of this process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not Linux: the peak is the best there is
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    return samples[max(0, min(len(samples) - 1, math.ceil(fraction * len(samples)) - 1))]
+
+
+def build(catalog: List[Dict]) -> Tuple[float, int]:
+    """Index the catalog and publish it: (seconds, bytes of memory taken)"""
+    gc.collect()
+    before = rss_bytes()
+    began = time.perf_counter()
+    target = (SearchIndex(), SuggestIndex())
+    for product in catalog:
+        indexing_service.add_or_update_product(product, target=target)
+    indexing_service.publish(*target)
+    seconds = time.perf_counter() - began
+    gc.collect()
+    return seconds, rss_bytes() - before
+
+
+def read_log(path: str) -> List[Tuple[str, Dict]]:
+    searches = []
+    with open(path) as log:
+        for line in log:
+            if line.strip():
+                kwargs = json.loads(line)
+                searches.append((kwargs.pop("shape", "logged"), kwargs))
+    return searches
+
+
+def replay(searches: List[Tuple[str, Dict]], clients: int) -> Tuple[Dict[str, List[float]], float]:
+    """Latencies in ms by shape, and the wall time of the whole replay"""
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+
+    def client(part):
+        mine = defaultdict(list)
+        for shape, kwargs in part:
+            began = time.perf_counter()
+            indexing_service.search_products(**kwargs)
+            mine[shape].append((time.perf_counter() - began) * 1000)
+        with lock:
+            for shape, samples in mine.items():
+                latencies[shape].extend(samples)
+
+    threads = [
+        threading.Thread(target=client, args=(searches[number::clients],))
+        for number in range(clients)
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - began
+
+
+def relevance(searches: List[Tuple[str, Dict]]) -> Dict[str, Dict]:
+    """Total and top product ids of every distinct search"""
+    results = {}
+    for _, kwargs in searches:
+        key = json.dumps(kwargs, sort_keys=True)
+        if key not in results:
+            found = indexing_service.search_products(**{**kwargs, "limit": RELEVANCE_DEPTH})
+            results[key] = {
+                "total": found["total"],
+                "top": [product["id"] for product in found["results"]],
+            }
+    return results
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float, max_changed: int) -> List[str]:
+    """The regressions of `report` against `baseline`, described"""
+    regressions = []
+    print(f"\n{'vs baseline':<16}{'baseline':>12}{'now':>12}{'change':>9}")
+    for field, higher_is_worse in GATED:
+        old, new = baseline[field], report[field]
+        change = (new - old) / old if old else 0.0
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        print(f"{field:<16}{old:>12.4g}{new:>12.4g}{change:>+8.1%}{'  REGRESSED' if worse else ''}")
+        if worse:
+            regressions.append(f"{field} {old:.4g} -> {new:.4g} ({change:+.1%})")
+
+    old_results, new_results = baseline["relevance"], report["relevance"]
+    common = [key for key in new_results if key in old_results]
+    changed = [key for key in common if new_results[key] != old_results[key]]
+    overlap = sum(
+        len(set(new_results[key]["top"]) & set(old_results[key]["top"]))
+        / len(old_results[key]["top"])
+        if old_results[key]["top"]
+        else float(not new_results[key]["top"])
+        for key in common
+    ) / max(len(common), 1)
+    print(
+        f"relevance: {len(changed)} of {len(common)} searches changed, "
+        f"mean top-{RELEVANCE_DEPTH} overlap {overlap:.3f}"
+    )
+    for key in changed[:5]:
+        print(f"  {key}: {old_results[key]} -> {new_results[key]}")
+    if len(changed) > max_changed:
+        regressions.append(f"{len(changed)} searches return different results")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    catalog_options = parser.add_argument_group("catalog")
+    catalog_options.add_argument("--products", type=int, default=100_000)
+    catalog_options.add_argument("--words", type=int, default=None, help="vocabulary size")
+    catalog_options.add_argument("--categories", type=int, default=200)
+    catalog_options.add_argument("--tags", type=int, default=2000)
+    catalog_options.add_argument("--word-skew", type=float, default=1.0)
+    catalog_options.add_argument("--category-skew", type=float, default=1.2)
+    catalog_options.add_argument("--tag-skew", type=float, default=0.8)
+    catalog_options.add_argument("--seed", type=int, default=42)
+    log_options = parser.add_argument_group("query log")
+    log_options.add_argument("--queries", help="JSON lines of search_products arguments")
+    log_options.add_argument("--searches", type=int, default=20_000)
+    log_options.add_argument("--distinct", type=int, default=2000)
+    log_options.add_argument("--warmup", type=int, default=500)
+    log_options.add_argument("--clients", type=int, default=1)
+    log_options.add_argument("--no-cache", action="store_true", help="rank every search")
+    gate = parser.add_argument_group("regression gate")
+    gate.add_argument("--save", help="write the report to this JSON file")
+    gate.add_argument("--baseline", help="compare against this saved report")
+    gate.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change")
+    gate.add_argument("--max-changed", type=int, default=0, help="searches whose results may change")
+    args = parser.parse_args()
+
+    options = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("save", "baseline", "tolerance", "max_changed")
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as saved:
+            baseline = json.load(saved)
+        if baseline["options"] != options:
+            sys.exit(f"{args.baseline} was run with other options: {baseline['options']}")
+
+    catalog = list(
+        products(
+            args.products,
+            categories=args.categories,
+            tags=args.tags,
+            seed=args.seed,
+            words=args.words,
+            word_skew=args.word_skew,
+            category_skew=args.category_skew,
+            tag_skew=args.tag_skew,
+        )
+    )
+    if args.queries:
+        searches = read_log(args.queries)
+    else:
+        searches = query_log(catalog, args.warmup + args.searches, distinct=args.distinct)
+    warmup, searches = searches[: args.warmup], searches[args.warmup :]
+
+    build_seconds, memory = build(catalog)
+    print(
+        f"indexed {args.products} products in {build_seconds:.1f}s, "
+        f"{memory / 2**20:.0f} MB ({memory / max(args.products, 1):.0f} bytes per product)"
+    )
+
+    replay(warmup, 1)
+    latencies, wall = replay(searches, args.clients)
+
+    print(f"\n{'search':<12}{'count':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    every = []
+    for shape, samples in sorted(latencies.items()) + [("all", every)]:
+        if shape != "all":
+            every.extend(samples)
+        samples.sort()
+        print(
+            f"{shape:<12}{len(samples):>8}{percentile(samples, 0.50):>9.2f}"
+            f"{percentile(samples, 0.95):>9.2f}{percentile(samples, 0.99):>9.2f}"
+        )
+    qps = len(every) / wall
+    print(f"\n{qps:.0f} searches per second, {args.clients} client(s)")
+    print(f"cache: {indexing_service.cache_stats()}")
+
+    report = {
+        "options": options,
+        "build_seconds": build_seconds,
+        "memory_bytes": memory,
+        "p50_ms": percentile(every, 0.50),
+        "p95_ms": percentile(every, 0.95),
+        "p99_ms": percentile(every, 0.99),
+        "qps": qps,
+        "relevance": relevance(warmup + searches),
+    }
+    if args.save:
+        with open(args.save, "w") as saved:
+            json.dump(report, saved, indent=1)
+        print(f"\nreport saved to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance, args.max_changed)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Query throughput: the index in one process vs partitioned across shards.
+
+Loads the same synthetic catalog into the single-process engine and into
+ShardedSearch with each shard count given, through the bulk reindex path,
+then has concurrent clients send a fixed mix of searches at each for a
+while, reporting queries per second and latency. The result cache is off
+unless --cache, so every query is ranked.
+
+Run from search_service/:
+
+    python -m benchmarks.shards --products 1000000 --shards 2 4 --clients 8
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+if __name__ == "__main__":
+    _cache = argparse.ArgumentParser(add_help=False)
+    _cache.add_argument("--cache", action="store_true")
+    if not _cache.parse_known_args()[0].cache:
+        # Before the config is imported, here and in the shard processes
+        os.environ["SEARCH_CACHE_BYTES"] = "0"
+
+from app.services import indexing_service
+from app.services.index_persistence import IndexPersistence
+from app.services.shards import ShardedSearch
+from benchmarks.synthetic import products, query_log
+
+_CHUNK = 10_000  # products per add_to_rebuild, as services/reindex.py sends
+
+
+def load(engine, catalog):
+    began = time.perf_counter()
+    engine.warm_start()
+    engine.begin_rebuild()
+    for start in range(0, len(catalog), _CHUNK):
+        engine.add_to_rebuild(catalog[start : start + _CHUNK])
+    count = engine.finish_rebuild()
+    return count, time.perf_counter() - began
+
+
+def run(search, mix, clients: int, seconds: float):
+    """(queries per second, p50 ms, p99 ms) of `clients` threads searching"""
+    latencies = [[] for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+
+    def client(number: int):
+        rng = random.Random(number)
+        while time.perf_counter() < deadline:
+            kwargs = rng.choice(mix)
+            began = time.perf_counter()
+            search(**kwargs)
+            latencies[number].append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    samples = sorted(latency for part in latencies for latency in part)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return len(samples) / seconds, statistics.median(samples) * 1000, p99 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--cache", action="store_true", help="leave the result cache on")
+    args = parser.parse_args()
+
+    catalog = list(products(args.products))
+    mix = [kwargs for _, kwargs in query_log(catalog, 500)]
+
+    print(f"{'engine':<12}{'products':>10}{'load s':>9}{'qps':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        persistence = IndexPersistence(os.path.join(data_dir, "single"))
+        count, load_s = load(persistence, catalog)
+        qps, p50, p99 = run(indexing_service.search_products, mix, args.clients, args.seconds)
+        print(f"{'1 process':<12}{count:>10}{load_s:>9.1f}{qps:>9.0f}{p50:>9.2f}{p99:>9.2f}")
+        persistence.close()
+
+        for shards in args.shards:
+            engine = ShardedSearch(shards, os.path.join(data_dir, f"sharded-{shards}"))
+            try:
+                count, load_s = load(engine, catalog)
+                qps, p50, p99 = run(engine.search_products, mix, args.clients, args.seconds)
+            finally:
+                engine.close()
+            label = f"{shards} shards"
+            print(f"{label:<12}{count:>10}{load_s:>9.1f}{qps:>9.0f}{p50:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
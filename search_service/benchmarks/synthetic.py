@@ -0,0 +1,146 @@
+"""
+Synthetic product catalog for the search benchmarks.
+
+Products look like the product events the index consumes: a few words of
+name and description from a Zipf-ish vocabulary, one category, a couple of
+tags, a price and a stock level. query_log() makes a matching mix of
+searches. Generation is seeded, so runs compare.
+"""
+
+import itertools
+import random
+from typing import Dict, Iterator, List, Tuple
+
+_WORDS = [
+    f"{stem}{suffix}"
+    for stem in (
+        "red", "blue", "steel", "wood", "cotton", "mini", "pro", "smart", "eco",
+        "classic", "travel", "kitchen", "garden", "office", "sport", "kids",
+    )
+    for suffix in ("", "s", "er", "ly", "x", "ion", "ware", "line")
+]
+# For vocabularies larger than _WORDS
+_SYLLABLES = (
+    "ka", "lo", "mi", "ne", "tor", "va", "sen", "ri", "pul", "da", "fex", "go",
+    "hu", "zan", "bel", "qui",
+)
+_NOUNS = [
+    "mug", "lamp", "chair", "desk", "bottle", "bag", "shirt", "shoe", "watch",
+    "phone", "cable", "charger", "pan", "knife", "towel", "pillow", "tent",
+    "ball", "book", "pen",
+]
+
+
+def vocabulary(words: int = None) -> List[str]:
+    """`words` distinct name / description words, the built-in ones first"""
+    if words is None or words <= len(_WORDS):
+        return _WORDS[:words]
+    made = (
+        "".join(syllables)
+        for length in (2, 3, 4, 5)
+        for syllables in itertools.product(_SYLLABLES, repeat=length)
+    )
+    extra = (word for word in dict.fromkeys(made) if word not in _WORDS)
+    return _WORDS + list(itertools.islice(extra, words - len(_WORDS)))
+
+
+def products(
+    count: int,
+    categories: int = 200,
+    tags: int = 2000,
+    seed: int = 42,
+    words: int = None,
+    word_skew: float = 1.0,
+    category_skew: float = 1.2,
+    tag_skew: float = 0.8,
+) -> Iterator[Dict]:
+    """
+    `words`: vocabulary size (default the built-in 128 words). The skews are
+    the Zipf exponent of word frequency and the Pareto shapes of category
+    and tag popularity: lower is more skewed toward the first ones.
+    """
+    rng = random.Random(seed)
+    # Skewed so some words, categories and tags are far more common
+    words = vocabulary(words)
+    word_weights = [1 / (rank + 1) ** word_skew for rank in range(len(words))]
+    for product_id in range(1, count + 1):
+        name_words = rng.choices(words, weights=word_weights, k=2)
+        name = " ".join(name_words + [rng.choice(_NOUNS)])
+        category_id = min(int(rng.paretovariate(category_skew)), categories)
+        tag_ids = {min(int(rng.paretovariate(tag_skew)), tags) for _ in range(rng.randint(1, 3))}
+        yield {
+            "id": product_id,
+            "name": name.title(),
+            "description": " ".join(rng.choices(words, weights=word_weights, k=8)),
+            "price": round(rng.lognormvariate(3.5, 1.0), 2),
+            "stock": 0 if rng.random() < 0.2 else rng.randint(1, 500),
+            "category": {"id": category_id, "name": f"category {category_id}"},
+            "tags": [{"id": tag_id, "name": f"tag {tag_id}"} for tag_id in sorted(tag_ids)],
+            "promotions": [],
+        }
+
+
+# Kinds of search in a query log, and how often each is made
+QUERY_SHAPES = {
+    "terms": 0.45,  # a word or two of a product name
+    "typo": 0.10,  # the same, one word misspelled
+    "filtered": 0.15,  # in stock, under a price, cheapest first
+    "category": 0.10,  # terms within a category
+    "browse": 0.10,  # a category without terms, dearest first
+    "page": 0.10,  # a later page of terms
+}
+
+
+def query_log(
+    catalog: List[Dict],
+    count: int,
+    distinct: int = 2000,
+    seed: int = 7,
+) -> List[Tuple[str, Dict]]:
+    """
+    `count` searches as (shape, search_products kwargs), drawn from
+    `distinct` different ones by Zipf popularity, so that as in a real log
+    a few queries are made over and over and most only once or twice
+    """
+    rng = random.Random(seed)
+    shapes, shape_weights = zip(*QUERY_SHAPES.items())
+    searches = []
+    for _ in range(distinct):
+        shape = rng.choices(shapes, weights=shape_weights)[0]
+        product = rng.choice(catalog)
+        terms = product["name"].lower().split()
+        query = " ".join(rng.sample(terms, rng.randint(1, 2)))
+        if shape == "terms":
+            kwargs = {"query": query}
+        elif shape == "typo":
+            kwargs = {"query": " ".join(_misspelled(rng, term) for term in query.split())}
+        elif shape == "filtered":
+            kwargs = {
+                "query": query,
+                "max_price": rng.choice((20, 50, 100)),
+                "in_stock_only": True,
+                "sort": "price_asc",
+            }
+        elif shape == "category":
+            kwargs = {"query": query, "category_id": product["category"]["id"]}
+        elif shape == "browse":
+            kwargs = {"query": "", "category_id": product["category"]["id"], "sort": "price_desc"}
+        else:
+            kwargs = {"query": query, "offset": rng.choice((20, 40, 60))}
+        searches.append((shape, kwargs))
+
+    popularity = [1 / (rank + 1) for rank in range(distinct)]
+    return rng.choices(searches, weights=popularity, k=count)
+
+
+def _misspelled(rng: random.Random, term: str) -> str:
+    """`term` with one character dropped, doubled or swapped with the next"""
+    if len(term) < 5:
+        return term
+    i = rng.randrange(1, len(term) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return term[:i] + term[i + 1 :]
+    if edit == 1:
+        return term[:i] + term[i] + term[i:]
+    return term[:i] + term[i + 1] + term[i] + term[i + 2 :]
@@ -3,11 +3,15 @@
 import pika, json
 from app.services.shipping_service import create_shipment, cancel_shipment
 from app.core.config import RABBITMQ_URL
+from app.infrastructure.outbox import get_relay
 
 EXCHANGES = ["orders"]
 
 
 def start_consumer():
+    # Publishes outbox events, including any left over from a previous run
+    get_relay().start()
+
     connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
     channel = connection.channel()
 
@@ -1,6 +1,6 @@
 # shipping_service/app/infrastructure/models.py
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import JSON, BigInteger, Column, Integer, String, DateTime, ForeignKey
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
@@ -18,3 +18,19 @@ class Shipment(Base):
     tracking_number = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OutboxEvent(Base):
+    """
+    Domain event written in the same transaction as the change it describes.
+
+    The outbox relay (infrastructure/outbox.py) publishes rows in id order
+    and deletes them once the broker has confirmed them.
+    """
+
+    __tablename__ = "outbox_events"
+    id = Column(BigInteger, primary_key=True)  # also the event_id consumers see
+    exchange = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -3,7 +3,7 @@
 from sqlalchemy.orm import Session
 from app.infrastructure.models import Shipment
 from app.infrastructure.database import SessionLocal
-from app.infrastructure.event_publisher import publish_event
+from app.infrastructure.outbox import enqueue_event
 import random
 
 
@@ -17,11 +17,11 @@ def create_shipment(order_data: dict):
             tracking_number=f"TRK{random.randint(100000, 999999)}",
         )
         db.add(shipment)
-        db.commit()
-        db.refresh(shipment)
+        db.flush()
 
-        # Publish shipment event
-        publish_event(
+        # Publish shipment event (committed together with the shipment)
+        enqueue_event(
+            db,
             "shipments",
             "shipment_created",
             {
@@ -32,6 +32,7 @@ def create_shipment(order_data: dict):
                 "tracking_number": shipment.tracking_number,
             },
         )
+        db.commit()
     finally:
         db.close()
 
@@ -42,7 +43,9 @@ def cancel_shipment(order_id: int):
         shipment = db.query(Shipment).filter(Shipment.order_id == order_id).first()
         if shipment:
             shipment.status = "cancelled"
+            enqueue_event(
+                db, "shipments", "shipment_cancelled", {"order_id": order_id}
+            )
             db.commit()
-            publish_event("shipments", "shipment_cancelled", {"order_id": order_id})
     finally:
         db.close()